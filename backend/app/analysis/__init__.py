@@ -4,4 +4,4 @@ bp = Blueprint('analysis', __name__, template_folder='templates/analysis')
 
 # Esta es la forma correcta, solo importando las rutas.
 # Las rutas, a su vez, importarán los formularios.
-from . import routes
\ No newline at end of file
+from . import routes, comandos
\ No newline at end of file
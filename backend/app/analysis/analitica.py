@@ -0,0 +1,232 @@
+from sqlalchemy import event, extract, func, inspect
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Analisis, Plantilla, ResumenEstimacion
+
+# --- Mantenimiento Incremental de ResumenEstimacion ---
+#
+# Cada Analisis aporta (1 análisis, casos, horas diseño, horas ejecución) a la
+# fila de su clave (usuario, plantilla, mes, nivel). Los eventos del ORM
+# suman o restan ese aporte en la misma transacción que modifica el Analisis.
+# Las operaciones masivas (bulk_update_mappings, query.update) no disparan
+# eventos: después de usarlas hay que llamar a reconstruir_resumen_estimacion().
+
+NIVEL_DESCONOCIDO = "Sin nivel"
+
+_COLUMNAS_APORTE = (
+    "id_usuario",
+    "id_plantilla",
+    "timestamp",
+    "nivel_complejidad",
+    "casos_generados",
+    "horas_diseño_estimadas",
+    "horas_ejecucion_estimadas",
+)
+
+
+def _aporte(valores):
+    """Convierte los valores de un Analisis en (clave, totales)."""
+    timestamp = valores["timestamp"]
+    clave = (
+        valores["id_usuario"],
+        valores["id_plantilla"],
+        timestamp.strftime("%Y-%m") if timestamp else "0000-00",
+        valores["nivel_complejidad"] or NIVEL_DESCONOCIDO,
+    )
+    totales = (
+        1,
+        valores["casos_generados"] or 0,
+        valores["horas_diseño_estimadas"] or 0.0,
+        valores["horas_ejecucion_estimadas"] or 0.0,
+    )
+    return clave, totales
+
+
+def _valores_actuales(target):
+    return {col: getattr(target, col) for col in _COLUMNAS_APORTE}
+
+
+def _valores_anteriores(target):
+    """Valores previos al flush, según el historial de cada atributo."""
+    estado = inspect(target)
+    valores = {}
+    for col in _COLUMNAS_APORTE:
+        historial = estado.attrs[col].history
+        valores[col] = historial.deleted[0] if historial.deleted else getattr(target, col)
+    return valores
+
+
+def _aplicar_aporte(connection, clave, totales, signo):
+    """
+    UPDATE incremental de la fila de la clave; si no existe, la crea. Dos
+    transacciones pueden no encontrarla a la vez: el INSERT va en un
+    SAVEPOINT y, si la otra ya la creó (restricción única), se repite el
+    UPDATE sobre esa fila.
+    """
+    tabla = ResumenEstimacion.__table__
+    id_usuario, id_plantilla, periodo, nivel = clave
+    n, casos, horas_diseño, horas_ejecucion = totales
+
+    filtro = (
+        (tabla.c.id_usuario == id_usuario)
+        & (tabla.c.id_plantilla == id_plantilla)
+        & (tabla.c.periodo == periodo)
+        & (tabla.c.nivel_complejidad == nivel)
+    )
+    actualizar = (
+        tabla.update()
+        .where(filtro)
+        .values(
+            total_analisis=tabla.c.total_analisis + signo * n,
+            total_casos=tabla.c.total_casos + signo * casos,
+            total_horas_diseño=tabla.c.total_horas_diseño + signo * horas_diseño,
+            total_horas_ejecucion=tabla.c.total_horas_ejecucion + signo * horas_ejecucion,
+        )
+    )
+    if connection.execute(actualizar).rowcount or signo < 0:
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(
+                tabla.insert().values(
+                    id_usuario=id_usuario,
+                    id_plantilla=id_plantilla,
+                    periodo=periodo,
+                    nivel_complejidad=nivel,
+                    total_analisis=n,
+                    total_casos=casos,
+                    total_horas_diseño=horas_diseño,
+                    total_horas_ejecucion=horas_ejecucion,
+                )
+            )
+    except IntegrityError:
+        connection.execute(actualizar)
+
+
+@event.listens_for(Analisis, "after_insert")
+def _resumen_al_insertar(mapper, connection, target):
+    _aplicar_aporte(connection, *_aporte(_valores_actuales(target)), signo=1)
+
+
+@event.listens_for(Analisis, "after_update")
+def _resumen_al_actualizar(mapper, connection, target):
+    anterior = _aporte(_valores_anteriores(target))
+    actual = _aporte(_valores_actuales(target))
+    if anterior == actual:
+        return
+    _aplicar_aporte(connection, *anterior, signo=-1)
+    _aplicar_aporte(connection, *actual, signo=1)
+
+
+@event.listens_for(Analisis, "after_delete")
+def _resumen_al_borrar(mapper, connection, target):
+    _aplicar_aporte(connection, *_aporte(_valores_anteriores(target)), signo=-1)
+
+
+def reconstruir_resumen_estimacion():
+    """
+    Recalcula toda la tabla ResumenEstimacion con un único GROUP BY sobre
+    Analisis. Devuelve el número de filas de resumen generadas.
+    """
+    anio = extract("year", Analisis.timestamp)
+    mes = extract("month", Analisis.timestamp)
+    nivel = func.coalesce(Analisis.nivel_complejidad, NIVEL_DESCONOCIDO)
+
+    grupos = (
+        db.session.query(
+            Analisis.id_usuario,
+            Analisis.id_plantilla,
+            anio,
+            mes,
+            nivel,
+            func.count(Analisis.id),
+            func.coalesce(func.sum(Analisis.casos_generados), 0),
+            func.coalesce(func.sum(Analisis.horas_diseño_estimadas), 0.0),
+            func.coalesce(func.sum(Analisis.horas_ejecucion_estimadas), 0.0),
+        )
+        .group_by(Analisis.id_usuario, Analisis.id_plantilla, anio, mes, nivel)
+        .all()
+    )
+
+    db.session.query(ResumenEstimacion).delete()
+    db.session.bulk_insert_mappings(
+        ResumenEstimacion,
+        [
+            {
+                "id_usuario": id_usuario,
+                "id_plantilla": id_plantilla,
+                "periodo": f"{int(a):04d}-{int(m):02d}" if a else "0000-00",
+                "nivel_complejidad": niv,
+                "total_analisis": n,
+                "total_casos": casos,
+                "total_horas_diseño": hd,
+                "total_horas_ejecucion": he,
+            }
+            for id_usuario, id_plantilla, a, m, niv, n, casos, hd, he in grupos
+        ],
+    )
+    db.session.commit()
+    return len(grupos)
+
+
+# --- Consultas de Analítica ---
+
+
+def _totales(*columnas_grupo, id_usuario):
+    """SUM de los totales pre-agregados del usuario, agrupados por las columnas dadas."""
+    r = ResumenEstimacion
+    consulta = db.session.query(
+        *columnas_grupo,
+        func.sum(r.total_analisis),
+        func.sum(r.total_casos),
+        func.sum(r.total_horas_diseño),
+        func.sum(r.total_horas_ejecucion),
+    ).filter(r.id_usuario == id_usuario, r.total_analisis > 0)
+    if columnas_grupo:
+        consulta = consulta.group_by(*columnas_grupo).order_by(*columnas_grupo)
+    return consulta.all()
+
+
+def _como_dict(n, casos, horas_diseño, horas_ejecucion):
+    return {
+        "analisis": int(n or 0),
+        "casos": int(casos or 0),
+        "horas_diseño": round(horas_diseño or 0, 2),
+        "horas_ejecucion": round(horas_ejecucion or 0, 2),
+    }
+
+
+def analitica_usuario(id_usuario):
+    """
+    Totales de estimación del usuario: global, por mes, por plantilla y
+    distribución de complejidad. Lee solo la tabla ResumenEstimacion.
+    """
+    r = ResumenEstimacion
+
+    por_mes = [
+        {"periodo": periodo, **_como_dict(*totales)}
+        for periodo, *totales in _totales(r.periodo, id_usuario=id_usuario)
+    ]
+
+    nombres = dict(
+        db.session.query(Plantilla.id, Plantilla.nombre_plantilla)
+        .filter(Plantilla.id_usuario == id_usuario)
+        .all()
+    )
+    por_plantilla = [
+        {"id_plantilla": id_plantilla, "plantilla": nombres.get(id_plantilla), **_como_dict(*totales)}
+        for id_plantilla, *totales in _totales(r.id_plantilla, id_usuario=id_usuario)
+    ]
+
+    complejidad = {
+        nivel: _como_dict(*totales)
+        for nivel, *totales in _totales(r.nivel_complejidad, id_usuario=id_usuario)
+    }
+
+    total = _totales(id_usuario=id_usuario)
+    return {
+        "total": _como_dict(*total[0]) if total else _como_dict(0, 0, 0, 0),
+        "por_mes": por_mes,
+        "por_plantilla": por_plantilla,
+        "complejidad": complejidad,
+    }
@@ -0,0 +1,310 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Requerimiento, RespuestaIACache
+from app.analysis.lectura import VERSION_EXTRACTOR
+
+# --- Cache LRU en memoria (por proceso) ---
+
+
+class CacheLRU:
+    """
+    Cache LRU thread-safe acotado por número de entradas y, opcionalmente,
+    por tamaño total (según la función 'medir' aplicada a cada valor) y por
+    antigüedad ('ttl' en segundos). Lleva contadores de aciertos, fallos,
+    desalojos y expiraciones.
+    """
+
+    def __init__(self, max_entradas=256, max_tamano=None, medir=len, ttl=None):
+        self.max_entradas = max_entradas
+        self.max_tamano = max_tamano
+        self.ttl = ttl
+        self._medir = medir
+        self._datos = OrderedDict()
+        self._tamanos = {}
+        self._expiraciones = {}
+        self._tamano_total = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.expirados = 0
+
+    def get(self, clave):
+        """Devuelve el valor (y lo marca como reciente) o None si no existe o expiró."""
+        with self._lock:
+            if clave not in self._datos:
+                self.fallos += 1
+                return None
+            if self.ttl and self._expiraciones[clave] < time.monotonic():
+                self._quitar(clave)
+                self.expirados += 1
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return self._datos[clave]
+
+    def put(self, clave, valor):
+        """Guarda un valor y desaloja los menos recientes si se superan los límites."""
+        tamano = self._medir(valor)
+        with self._lock:
+            if self.max_tamano and tamano > self.max_tamano:
+                return  # Nunca cabría: no vaciamos el cache por un solo valor
+            if clave in self._datos:
+                self._quitar(clave)
+            self._datos[clave] = valor
+            self._tamanos[clave] = tamano
+            if self.ttl:
+                self._expiraciones[clave] = time.monotonic() + self.ttl
+            self._tamano_total += tamano
+
+            while len(self._datos) > self.max_entradas or (
+                self.max_tamano and self._tamano_total > self.max_tamano
+            ):
+                clave_vieja = next(iter(self._datos))
+                self._quitar(clave_vieja)
+                self.desalojos += 1
+
+    def invalidar(self, clave):
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._tamanos.clear()
+            self._expiraciones.clear()
+            self._tamano_total = 0
+
+    def _quitar(self, clave):
+        del self._datos[clave]
+        self._expiraciones.pop(clave, None)
+        self._tamano_total -= self._tamanos.pop(clave)
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "tamano": self._tamano_total,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "desalojos": self.desalojos,
+                "expirados": self.expirados,
+                "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+            }
+
+
+# --- Cache de Textos Extraídos (direccionado por contenido) ---
+#
+# Nivel 1: CacheLRU en memoria  {clave: (id_requerimiento, texto)}
+# Nivel 2: tabla Requerimiento   (contenido_hash único = clave)
+#
+# La clave combina el SHA-256 de los bytes del archivo con VERSION_EXTRACTOR:
+# al cambiar los lectores, el texto extraído con la versión anterior deja de
+# reutilizarse.
+
+_cache_textos = None
+_cache_textos_lock = threading.Lock()
+_contadores_bd = {"aciertos": 0, "fallos": 0}
+
+
+def _obtener_cache_textos():
+    """Crea el cache en memoria la primera vez, con los límites de Config."""
+    global _cache_textos
+    if _cache_textos is None:
+        with _cache_textos_lock:
+            if _cache_textos is None:
+                _cache_textos = CacheLRU(
+                    max_entradas=current_app.config["EXTRACTION_CACHE_MAX_ENTRIES"],
+                    max_tamano=current_app.config["EXTRACTION_CACHE_MAX_CHARS"],
+                    medir=lambda valor: len(valor[1]),
+                )
+    return _cache_textos
+
+
+def _clave_texto(contenido_hash):
+    """Clave del cache de textos: hash del archivo + versión del extractor."""
+    return Requerimiento.calcular_hash(f"extractor-v{VERSION_EXTRACTOR}:{contenido_hash}")
+
+
+def buscar_requerimiento_cacheado(contenido_hash):
+    """
+    Busca el texto ya extraído de un archivo por el SHA-256 de sus bytes
+    (con la versión actual del extractor).
+    Devuelve (id_requerimiento, texto) o None si nunca se ha procesado.
+    """
+    clave = _clave_texto(contenido_hash)
+    cache = _obtener_cache_textos()
+    entrada = cache.get(clave)
+    if entrada is not None:
+        return entrada
+
+    requerimiento = Requerimiento.query.filter_by(contenido_hash=clave).first()
+    with _cache_textos_lock:
+        _contadores_bd["fallos" if requerimiento is None else "aciertos"] += 1
+    if requerimiento is None:
+        return None
+
+    entrada = (requerimiento.id, requerimiento.contenido_texto)
+    cache.put(clave, entrada)
+    return entrada
+
+
+def guardar_requerimiento_cacheado(contenido_hash, texto, usuario, nombre_archivo):
+    """
+    Registra el texto extraído en la tabla Requerimiento y en el cache en memoria.
+    Se confirma de inmediato para que el texto quede disponible aunque la
+    llamada posterior a la IA falle. Devuelve el id del Requerimiento.
+    """
+    clave = _clave_texto(contenido_hash)
+    requerimiento = Requerimiento(
+        contenido_hash=clave,
+        contenido_texto=texto,
+        autor=usuario,
+        nombre_archivo_original=nombre_archivo,
+    )
+    try:
+        db.session.add(requerimiento)
+        db.session.commit()
+    except IntegrityError:
+        # Otra petición subió el mismo archivo a la vez: usamos su registro
+        db.session.rollback()
+        requerimiento = Requerimiento.query.filter_by(contenido_hash=clave).one()
+
+    _obtener_cache_textos().put(clave, (requerimiento.id, requerimiento.contenido_texto))
+    return requerimiento.id
+
+
+def estadisticas_cache_textos():
+    """Contadores de ambos niveles del cache de extracción."""
+    return {
+        "memoria": _obtener_cache_textos().estadisticas(),
+        "bd": dict(_contadores_bd),
+    }
+
+
+# --- Cache de Respuestas de la IA (por huella del prompt) ---
+#
+# Clave: SHA-256 de (prompt final, modelo resuelto, generation_config).
+# Nivel 1: CacheLRU en memoria con TTL   {clave: texto_json}
+# Nivel 2: tabla RespuestaIACache         (TTL + tope de filas)
+# El nivel persistente usa su propia conexión (db.engine.begin()) para no
+# confirmar nada pendiente en la sesión de la petición.
+
+_cache_respuestas = None
+_cache_respuestas_lock = threading.Lock()
+_contadores_respuestas_bd = {"aciertos": 0, "fallos": 0, "escrituras": 0}
+
+
+def _obtener_cache_respuestas():
+    global _cache_respuestas
+    if _cache_respuestas is None:
+        with _cache_respuestas_lock:
+            if _cache_respuestas is None:
+                _cache_respuestas = CacheLRU(
+                    max_entradas=current_app.config["LLM_CACHE_MAX_ENTRIES"],
+                    ttl=current_app.config["LLM_CACHE_TTL"],
+                )
+    return _cache_respuestas
+
+
+def huella_prompt(prompt, nombre_modelo, generation_config):
+    """Clave del cache: hash del prompt, el modelo y la configuración de generación."""
+    hasher = Requerimiento.nuevo_hasher()
+    hasher.update(nombre_modelo.encode("utf-8"))
+    hasher.update(b"\0")
+    hasher.update(json.dumps(generation_config, sort_keys=True).encode("utf-8"))
+    hasher.update(b"\0")
+    hasher.update(prompt.encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def buscar_respuesta_cacheada(clave):
+    """Devuelve el texto JSON guardado para la clave, o None (fallo o expirado)."""
+    cache = _obtener_cache_respuestas()
+    texto = cache.get(clave)
+    if texto is not None:
+        return texto
+
+    tabla = RespuestaIACache.__table__
+    ahora = datetime.now(timezone.utc)
+    limite = ahora - timedelta(seconds=current_app.config["LLM_CACHE_TTL"])
+    with db.engine.begin() as conn:
+        texto = conn.execute(
+            db.select(tabla.c.respuesta_texto).where(
+                tabla.c.clave_hash == clave, tabla.c.timestamp_creacion >= limite
+            )
+        ).scalar()
+        if texto is not None:
+            conn.execute(
+                tabla.update().where(tabla.c.clave_hash == clave).values(ultimo_acceso=ahora)
+            )
+
+    with _cache_respuestas_lock:
+        _contadores_respuestas_bd["fallos" if texto is None else "aciertos"] += 1
+    if texto is not None:
+        cache.put(clave, texto)
+    return texto
+
+
+def guardar_respuesta_cacheada(clave, nombre_modelo, texto):
+    """
+    Guarda (o reemplaza) la respuesta en ambos niveles. En el nivel
+    persistente borra las filas expiradas y recorta al tope de filas,
+    desalojando las de acceso más antiguo.
+    """
+    _obtener_cache_respuestas().put(clave, texto)
+
+    tabla = RespuestaIACache.__table__
+    ahora = datetime.now(timezone.utc)
+    limite = ahora - timedelta(seconds=current_app.config["LLM_CACHE_TTL"])
+    max_filas = current_app.config["LLM_CACHE_MAX_ROWS"]
+
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(tabla.delete().where(tabla.c.clave_hash == clave))
+            conn.execute(
+                tabla.insert().values(
+                    clave_hash=clave,
+                    modelo=nombre_modelo,
+                    respuesta_texto=texto,
+                    timestamp_creacion=ahora,
+                    ultimo_acceso=ahora,
+                )
+            )
+            conn.execute(tabla.delete().where(tabla.c.timestamp_creacion < limite))
+            sobrantes = conn.execute(
+                db.select(tabla.c.id)
+                .order_by(tabla.c.ultimo_acceso.desc())
+                .offset(max_filas)
+            ).scalars().all()
+            if sobrantes:
+                conn.execute(tabla.delete().where(tabla.c.id.in_(sobrantes)))
+    except IntegrityError:
+        # Otra petición guardó la misma clave a la vez: su respuesta es igual de válida
+        pass
+
+    with _cache_respuestas_lock:
+        _contadores_respuestas_bd["escrituras"] += 1
+
+
+def estadisticas_cache_respuestas():
+    """Contadores de ambos niveles del cache de respuestas de la IA."""
+    memoria = _obtener_cache_respuestas().estadisticas()
+    bd = dict(_contadores_respuestas_bd)
+    consultas = memoria["aciertos"] + bd["aciertos"] + bd["fallos"]
+    return {
+        "memoria": memoria,
+        "bd": bd,
+        "tasa_aciertos_total": round(
+            (memoria["aciertos"] + bd["aciertos"]) / consultas, 4
+        ) if consultas else 0.0,
+    }
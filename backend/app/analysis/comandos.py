@@ -0,0 +1,116 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import click
+from app import db
+from app.analysis import bp
+from app.analysis.metricas import recalcular_registro
+from app.analysis.analitica import reconstruir_resumen_estimacion
+from app.models import Analisis
+
+# --- Comandos CLI del Módulo de Análisis ---
+# Uso (desde 'backend/'):  flask analysis recalcular-metricas --procesos 4
+
+
+def _leer_lote(ultimo_id, tamano_lote, re_escanear):
+    """
+    Lee el siguiente lote por paginación keyset (id > ultimo_id), solo con las
+    columnas necesarias. El texto crudo se carga únicamente para los registros
+    sin resumen o si se pide re-escanear.
+    """
+    filas = (
+        db.session.query(Analisis.id, Analisis.resumen_metricas)
+        .filter(Analisis.id > ultimo_id)
+        .order_by(Analisis.id)
+        .limit(tamano_lote)
+        .all()
+    )
+
+    ids_con_texto = [f.id for f in filas if re_escanear or f.resumen_metricas is None]
+    textos = {}
+    if ids_con_texto:
+        textos = dict(
+            db.session.query(Analisis.id, Analisis.texto_requerimiento_raw)
+            .filter(Analisis.id.in_(ids_con_texto))
+            .all()
+        )
+
+    return [
+        (
+            f.id,
+            None if re_escanear else f.resumen_metricas,
+            (textos.get(f.id) or "") if f.id in textos else None,
+        )
+        for f in filas
+    ]
+
+
+@bp.cli.command("recalcular-metricas")
+@click.option("--lote", "tamano_lote", default=1000, show_default=True, help="Registros por lote.")
+@click.option("--procesos", default=os.cpu_count() or 1, show_default=True, help="Procesos trabajadores.")
+@click.option("--re-escanear", is_flag=True, help="Ignora los resúmenes guardados y escanea el texto.")
+def recalcular_metricas(tamano_lote, procesos, re_escanear):
+    """
+    Recalcula nivel, criterios y horas PERT de todos los análisis guardados
+    (sin llamar a la IA), por lotes y en paralelo, con actualizaciones masivas.
+    """
+    inicio = time.perf_counter()
+    total = 0
+    ultimo_id = 0
+
+    pool = ProcessPoolExecutor(max_workers=procesos) if procesos > 1 else None
+    try:
+        while True:
+            registros = _leer_lote(ultimo_id, tamano_lote, re_escanear)
+            if not registros:
+                break
+            ultimo_id = registros[-1][0]
+
+            if pool is not None:
+                resultados = pool.map(
+                    recalcular_registro, registros,
+                    chunksize=max(1, len(registros) // (procesos * 4)),
+                )
+            else:
+                resultados = map(recalcular_registro, registros)
+
+            actualizaciones = [
+                {
+                    "id": id_analisis,
+                    "nivel_complejidad": m["nivel"],
+                    "criterios_detectados": m["criterios"],
+                    "criterios_no_funcionales": m["criterios_no_funcionales"],
+                    "palabras_analizadas": m["palabras"],
+                    "horas_diseño_estimadas": m["horas_diseño_estimadas"],
+                    "horas_ejecucion_estimadas": m["horas_ejecucion_estimadas"],
+                    "resumen_metricas": resumen,
+                }
+                for id_analisis, m, resumen in resultados
+            ]
+            db.session.bulk_update_mappings(Analisis, actualizaciones)
+            db.session.commit()
+
+            total += len(actualizaciones)
+            transcurrido = time.perf_counter() - inicio
+            click.echo(
+                f"  {total} análisis recalculados "
+                f"({total / transcurrido:.0f} filas/s, último id {ultimo_id})"
+            )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    transcurrido = time.perf_counter() - inicio
+    velocidad = total / transcurrido if transcurrido else 0
+    click.echo(f"✅ {total} análisis recalculados en {transcurrido:.1f} s ({velocidad:.0f} filas/s)")
+
+    # Las actualizaciones masivas no disparan los eventos del ORM
+    grupos = reconstruir_resumen_estimacion()
+    click.echo(f"📊 Resumen de estimaciones reconstruido ({grupos} grupos)")
+
+
+@bp.cli.command("reconstruir-resumen")
+def reconstruir_resumen():
+    """Recalcula la tabla ResumenEstimacion desde cero con un GROUP BY sobre Analisis."""
+    grupos = reconstruir_resumen_estimacion()
+    click.echo(f"📊 Resumen de estimaciones reconstruido ({grupos} grupos)")
@@ -0,0 +1,174 @@
+import math
+import re
+from flask import current_app
+from app.analysis.ia import obtener_proveedor
+from app.analysis.metricas import PATRON_CRITERIO_FUNCIONAL, PATRON_CRITERIO_NO_FUNCIONAL
+
+# --- Compactación del Requerimiento antes del Prompt ---
+#
+# El texto extraído de un Excel trae filas como "a |  |  |  | b", cabeceras
+# repetidas en cada bloque y espacios sobrantes. Nada de eso aporta a la IA,
+# pero cuesta tokens (latencia y cuota) y puede desbordar el contexto.
+# La compactación:
+#   - normaliza espacios (tabulaciones y rachas de espacios -> un espacio),
+#   - quita las celdas vacías al final de las filas "celda | celda | ..." (las
+#     de en medio se dejan vacías para no correr las columnas),
+#   - omite las repeticiones de la fila de encabezados de cada hoja (la
+#     primera fila de tabla que no es un criterio CA/CNF),
+#   - colapsa las líneas en blanco consecutivas y omite las hojas vacías.
+# El texto original se conserva tal cual en el análisis (las métricas se
+# calculan sobre él); solo el prompt usa la versión compacta.
+
+# Caracteres por token para la estimación (sin llamar al proveedor)
+CARACTERES_POR_TOKEN = 4
+
+# Separador de celdas que usan los lectores de .xlsx y .docx
+_SEPARADOR_CELDAS = " | "
+
+_RE_ESPACIOS = re.compile(r"[^\S\n]+")
+_RE_INICIO_HOJA = re.compile(r"^--- INICIO HOJA: .* ---$")
+_RE_CRITERIO = re.compile(
+    rf"^(?:{PATRON_CRITERIO_FUNCIONAL}|{PATRON_CRITERIO_NO_FUNCIONAL})", re.IGNORECASE
+)
+
+
+def _compactar_linea(linea):
+    """
+    Normaliza los espacios de una línea y quita sus celdas vacías finales.
+    Las vacías entre celdas con texto quedan como "a | | b".
+    Devuelve (linea, es_fila_de_tabla).
+    """
+    linea = _RE_ESPACIOS.sub(" ", linea).strip()
+    if "|" not in linea:
+        return linea, False
+    celdas = [c.strip() for c in linea.split("|")]
+    while celdas and not celdas[-1]:
+        celdas.pop()
+    # Las celdas vacías dejan dos espacios seguidos: se reducen a uno
+    return _RE_ESPACIOS.sub(" ", _SEPARADOR_CELDAS.join(celdas)).strip(), True
+
+
+def compactar_requerimiento(texto):
+    """
+    Devuelve el texto compactado (ver el comentario del módulo).
+    Los marcadores '--- INICIO HOJA: ... ---' y el inicio de cada línea
+    (criterios CA/CNF) se conservan para que la segmentación siga igual.
+    """
+    lineas = []
+    hoja = None  # Índice del marcador de la hoja en curso
+    encabezado = None  # Fila de encabezados de la hoja en curso
+    en_blanco = True  # Evita líneas en blanco al inicio
+
+    def _cerrar_hoja():
+        # Una hoja sin contenido no aporta nada: se quita su marcador
+        if hoja is not None and all(not l for l in lineas[hoja + 1:]):
+            del lineas[hoja:]
+
+    for linea in texto.splitlines():
+        linea, es_fila = _compactar_linea(linea)
+
+        if _RE_INICIO_HOJA.match(linea):
+            _cerrar_hoja()
+            encabezado = None
+            hoja = len(lineas)
+            lineas.append(linea)
+            en_blanco = False
+            continue
+
+        if not linea:
+            if not en_blanco:
+                lineas.append("")
+            en_blanco = True
+            continue
+
+        if es_fila and not _RE_CRITERIO.match(linea):
+            if encabezado is None:
+                encabezado = linea
+            elif linea == encabezado:
+                continue
+
+        lineas.append(linea)
+        en_blanco = False
+
+    _cerrar_hoja()
+    return "\n".join(lineas).strip()
+
+
+def estimar_tokens(texto):
+    """Estimación rápida de tokens (sin red): longitud / CARACTERES_POR_TOKEN."""
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def contar_tokens(texto, exacto=False):
+    """
+    Devuelve (tokens, metodo). Con 'exacto' se pide el conteo al proveedor
+    de IA (si lo ofrece); si no está disponible o falla, se estima.
+    """
+    if exacto and texto:
+        try:
+            proveedor = obtener_proveedor()
+            proveedor.preparar()
+            tokens = proveedor.contar_tokens(texto)
+            if tokens is not None:
+                return tokens, "exacto"
+        except Exception as e:
+            print(f"⚠️ No se pudo contar tokens con el proveedor: {e}")
+    return estimar_tokens(texto), "estimado"
+
+
+def preparar_texto_prompt(texto, exacto=None, compactado=None):
+    """
+    Compacta (si PROMPT_COMPACTION está activo) el texto que irá al prompt y
+    mide tamaños antes y después. Devuelve (texto_prompt, informe), donde
+    'informe' se guarda en Analisis.compactacion_prompt e incluye
+    'max_caracteres_segmento': el tamaño de segmento que respeta el
+    presupuesto de tokens (PROMPT_TOKEN_BUDGET) y LLM_FANOUT_MAX_CHARS.
+    'exacto' (por defecto PROMPT_TOKEN_COUNT_EXACT) decide si se cuentan
+    los tokens con el proveedor o se estiman. Si el llamador ya compactó el
+    texto, lo pasa en 'compactado' y no se vuelve a compactar.
+    """
+    config = current_app.config
+    if exacto is None:
+        exacto = config["PROMPT_TOKEN_COUNT_EXACT"]
+
+    if compactado is not None:
+        texto_prompt = compactado
+    elif config["PROMPT_COMPACTION"]:
+        texto_prompt = compactar_requerimiento(texto)
+    else:
+        texto_prompt = texto
+    tokens_antes, metodo = contar_tokens(texto, exacto)
+    if texto_prompt == texto:
+        tokens_despues = tokens_antes
+    else:
+        tokens_despues, metodo = contar_tokens(texto_prompt, exacto)
+
+    # El presupuesto en tokens se traduce a caracteres con la proporción
+    # real del texto (o la de la estimación)
+    max_caracteres = config["LLM_FANOUT_MAX_CHARS"]
+    presupuesto = config["PROMPT_TOKEN_BUDGET"]
+    if presupuesto:
+        caracteres_por_token = (
+            len(texto_prompt) / tokens_despues if tokens_despues else CARACTERES_POR_TOKEN
+        )
+        caracteres_presupuesto = max(int(presupuesto * caracteres_por_token), 1)
+        max_caracteres = (
+            min(max_caracteres, caracteres_presupuesto) if max_caracteres else caracteres_presupuesto
+        )
+
+    informe = {
+        "caracteres_antes": len(texto),
+        "caracteres_despues": len(texto_prompt),
+        "tokens_antes": tokens_antes,
+        "tokens_despues": tokens_despues,
+        "metodo_tokens": metodo,
+        "presupuesto_tokens": presupuesto,
+        "max_caracteres_segmento": max_caracteres,
+    }
+    if informe["caracteres_antes"]:
+        ahorro = 100 * (1 - informe["caracteres_despues"] / informe["caracteres_antes"])
+        print(
+            f"🗜️ Requerimiento compactado: {tokens_antes} -> {tokens_despues} tokens "
+            f"({metodo}, {ahorro:.0f}% menos caracteres)"
+        )
+    return texto_prompt, informe
@@ -0,0 +1,120 @@
+import hashlib
+from app.analysis.compactacion import compactar_requerimiento
+from app.analysis.segmentacion import dividir_en_secciones, es_criterio
+
+# --- Re-análisis Diferencial por Secciones ---
+#
+# Cada análisis guarda en 'Analisis.mapa_secciones' qué casos salieron de qué
+# secciones del requerimiento (hojas y criterios CA/CNF):
+#
+#     [{"huellas": [h1, h2], "casos": 5}, {"huellas": [h3], "casos": 2}, ...]
+#
+# Cada grupo es una llamada a la IA: sus casos son los siguientes 'casos'
+# elementos de ai_result_json, en orden. El primer análisis ya se genera así
+# (planificar_reanalisis sin mapa: todo son grupos nuevos de hasta
+# ANALYSIS_DELTA_GROUP_CHARS), de modo que la primera edición solo regenera
+# el grupo que cambió. Al re-analizar, un grupo cuyas
+# secciones siguen idénticas (y consecutivas) en el texto nuevo conserva sus
+# casos; el resto de secciones (editadas o nuevas) se agrupan de nuevo y son
+# lo único que se envía a la IA. Las secciones eliminadas se llevan sus casos.
+#
+# Las huellas se calculan sobre el texto compactado, así que los cambios de
+# espacios o celdas vacías no invalidan una sección.
+#
+# El preámbulo (lo anterior al primer criterio: objetivo, alcance, glosario)
+# da contexto a todos los criterios. Se antepone a cada grupo regenerado
+# aunque no haya cambiado; sus casos siguen siendo solo los de su grupo.
+
+
+def huella_seccion(texto):
+    """Huella corta (64 bits) de una sección, insensible a espacios."""
+    return hashlib.sha256(compactar_requerimiento(texto).encode("utf-8")).hexdigest()[:16]
+
+
+def mapa_completo(texto, casos_generados):
+    """Mapa de un análisis generado de una sola vez (p. ej. en un lote): un único grupo."""
+    return [
+        {
+            "huellas": [huella_seccion(s) for _, s in dividir_en_secciones(texto)],
+            "casos": casos_generados,
+        }
+    ]
+
+
+def mapa_valido(mapa, total_casos):
+    """El mapa solo sirve si cuadra con los casos guardados (sin ediciones de filas)."""
+    return bool(mapa) and sum(g["casos"] for g in mapa) == total_casos
+
+
+def _agrupar(secciones, max_caracteres, preambulo=""):
+    """
+    Empaqueta secciones consecutivas (encabezado, texto, huella) en grupos de
+    hasta 'max_caracteres'. A cada grupo que no lo incluye se le antepone el
+    'preambulo' y, si empieza a mitad de una hoja, la línea de la hoja para
+    conservar el contexto.
+    """
+    grupos = []
+    actual = None
+    for encabezado, texto, huella in secciones:
+        if actual and len(actual["texto"]) + len(texto) > max_caracteres:
+            grupos.append(actual)
+            actual = None
+        if actual is None:
+            prefijo = preambulo if texto != preambulo else ""
+            if encabezado and not texto.startswith(encabezado) and not prefijo.startswith(encabezado):
+                prefijo += encabezado
+            actual = {"huellas": [], "texto": prefijo}
+        actual["huellas"].append(huella)
+        actual["texto"] += texto
+    if actual:
+        grupos.append(actual)
+    return grupos
+
+
+def planificar_reanalisis(mapa, casos, texto_nuevo, max_caracteres):
+    """
+    Compara el texto nuevo con el mapa del análisis anterior y devuelve los
+    grupos del resultado en el orden del texto nuevo:
+      {"huellas": [...], "casos": [...]}  -> se conservan los casos
+      {"huellas": [...], "texto": "..."}  -> hay que regenerarlo
+    Sin un mapa válido todos los grupos se regeneran.
+    """
+    # Grupos anteriores por su primera huella (puede haber repetidas)
+    disponibles = {}
+    if mapa_valido(mapa, len(casos)):
+        inicio = 0
+        for grupo in mapa:
+            fin = inicio + grupo["casos"]
+            if grupo["huellas"]:
+                disponibles.setdefault(grupo["huellas"][0], []).append(
+                    (grupo["huellas"], casos[inicio:fin])
+                )
+            inicio = fin
+
+    secciones = [
+        (encabezado, texto, huella_seccion(texto))
+        for encabezado, texto in dividir_en_secciones(texto_nuevo)
+    ]
+    huellas = [h for _, _, h in secciones]
+    preambulo = secciones[0][1] if secciones and not es_criterio(secciones[0][1]) else ""
+
+    plan = []
+    pendientes = []
+    i = 0
+    while i < len(secciones):
+        candidatos = disponibles.get(huellas[i], [])
+        previo = next(
+            (c for c in candidatos if huellas[i:i + len(c[0])] == c[0]), None
+        )
+        if previo is None:
+            pendientes.append(secciones[i])
+            i += 1
+            continue
+        candidatos.remove(previo)
+        plan.extend(_agrupar(pendientes, max_caracteres, preambulo))
+        pendientes = []
+        plan.append({"huellas": previo[0], "casos": previo[1]})
+        i += len(previo[0])
+
+    plan.extend(_agrupar(pendientes, max_caracteres, preambulo))
+    return plan
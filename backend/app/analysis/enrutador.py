@@ -0,0 +1,251 @@
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Enrutamiento por Latencia entre Modelos ---
+#
+# El cliente de la IA puede tener varios modelos candidatos disponibles. El
+# enrutador guarda una ventana móvil de (latencia, éxito) por modelo y envía
+# cada petición al que tiene menor tiempo esperado:
+#
+#     mediana de latencia / (1 - tasa de error)
+#
+# (un modelo que falla la mitad de las veces cuesta, en promedio, dos
+# llamadas). Los modelos sin muestras suficientes se prueban de vez en cuando
+# (exploración) para no quedarse con datos viejos.
+#
+# Cobertura ("hedged request"): el modelo elegido se llama en el hilo que
+# pide la respuesta; si tarda más que su propio percentil p95, se lanza la
+# misma petición al segundo mejor en un pool aparte. Si el principal falla
+# (p. ej. se agota su timeout) o su respuesta no es válida, se usa la de la
+# cobertura, que ya lleva ese tiempo en curso. La llamada sobrante no se
+# cancela (no se puede cortar la petición HTTP), pero su latencia se sigue
+# registrando. Para no duplicar la carga, las coberturas se limitan a una
+# fracción de las llamadas.
+#
+# La cobertura es una llamada más a la IA: con 'reservar' (ver ejecutar) toma
+# un hueco de los límites globales sin esperar y, si no lo hay, no se lanza.
+#
+# El pool de coberturas solo ejecuta coberturas (la espera hasta el umbral y
+# la llamada): un principal nunca queda en cola detrás de coberturas lentas.
+# Cada llamada cubierta ocupa un hilo mientras el principal está en curso,
+# así que 'max_hilos' debe cubrir al menos las llamadas simultáneas a la IA.
+
+
+# Resultado de una cobertura que no llegó a lanzarse
+_SIN_COBERTURA = object()
+
+
+def _percentil(valores, p):
+    """Percentil 'p' (0-100) por el método del rango más cercano."""
+    ordenados = sorted(valores)
+    rango = math.ceil(p / 100 * len(ordenados))
+    return ordenados[max(0, min(len(ordenados), rango) - 1)]
+
+
+class EnrutadorModelos:
+    """Elige modelo por latencia y errores recientes y lanza coberturas."""
+
+    def __init__(
+        self,
+        ventana=50,
+        min_muestras=5,
+        exploracion=0.05,
+        percentil_cobertura=95,
+        min_umbral_cobertura=0.0,
+        max_fraccion_coberturas=0.1,
+        max_hilos=8,
+    ):
+        self.ventana = ventana
+        self.min_muestras = min_muestras
+        self.exploracion = exploracion
+        self.percentil_cobertura = percentil_cobertura
+        self.min_umbral_cobertura = min_umbral_cobertura
+        self.max_fraccion_coberturas = max_fraccion_coberturas
+        self._max_hilos = max_hilos
+        self._muestras = {}  # nombre -> deque[(segundos, ok)]
+        self._elegido = {}  # nombre -> veces elegido como principal
+        self._lock = threading.Lock()
+        self._pool = None
+        self.llamadas = 0
+        self.coberturas = 0
+        self.coberturas_ganadas = 0
+
+    # --- Estadísticas ---
+
+    def registrar(self, nombre, segundos, ok):
+        with self._lock:
+            muestras = self._muestras.get(nombre)
+            if muestras is None:
+                muestras = self._muestras[nombre] = deque(maxlen=self.ventana)
+            muestras.append((segundos, ok))
+
+    def _latencias(self, nombre):
+        return [s for s, ok in self._muestras.get(nombre, ()) if ok]
+
+    def _tasa_error(self, nombre):
+        muestras = self._muestras.get(nombre, ())
+        return sum(1 for _, ok in muestras if not ok) / len(muestras) if muestras else 0.0
+
+    def _puntuacion(self, nombre):
+        """Tiempo esperado por respuesta válida, o None sin muestras suficientes."""
+        muestras = self._muestras.get(nombre, ())
+        if len(muestras) < self.min_muestras:
+            return None
+        latencias = self._latencias(nombre)
+        tasa_error = self._tasa_error(nombre)
+        if not latencias or tasa_error >= 1:
+            return float("inf")
+        return _percentil(latencias, 50) / max(1 - tasa_error, 0.05)
+
+    def umbral_cobertura(self, nombre):
+        """Segundos tras los que conviene lanzar la cobertura (p95 del modelo)."""
+        with self._lock:
+            latencias = self._latencias(nombre)
+            if len(latencias) < self.min_muestras:
+                return None
+            return max(_percentil(latencias, self.percentil_cobertura), self.min_umbral_cobertura)
+
+    def ordenar(self, nombres):
+        """
+        Devuelve 'nombres' del mejor al peor. Los modelos sin muestras se
+        ponen primero si no hay ninguno medido o, si lo hay, con probabilidad
+        'exploracion'; si no, van al final en su orden de preferencia.
+        """
+        with self._lock:
+            puntuaciones = {n: self._puntuacion(n) for n in nombres}
+        medidos = sorted(
+            (n for n in nombres if puntuaciones[n] is not None), key=puntuaciones.get
+        )
+        sin_medir = [n for n in nombres if puntuaciones[n] is None]
+        if sin_medir and (not medidos or random.random() < self.exploracion):
+            return sin_medir[:1] + medidos + sin_medir[1:]
+        return medidos + sin_medir
+
+    # --- Ejecución ---
+
+    def _obtener_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self._max_hilos, thread_name_prefix="cobertura-ia"
+                    )
+        return self._pool
+
+    def _medir(self, nombre, llamar):
+        inicio = time.monotonic()
+        try:
+            resultado = llamar(nombre)
+        except Exception:
+            self.registrar(nombre, time.monotonic() - inicio, False)
+            raise
+        self.registrar(nombre, time.monotonic() - inicio, True)
+        return resultado
+
+    def _cobertura_permitida(self):
+        with self._lock:
+            return self.coberturas + 1 <= self.max_fraccion_coberturas * self.llamadas
+
+    def _cubrir_tras(self, umbral, terminado, principal, nombre, llamar, reservar):
+        """
+        Espera hasta 'umbral' segundos a que termine el principal; si no,
+        quedan coberturas disponibles y 'reservar' da hueco, hace la misma
+        llamada con 'nombre'.
+        """
+        if terminado.wait(umbral) or not self._cobertura_permitida():
+            return _SIN_COBERTURA
+        terminar = reservar() if reservar is not None else None
+        if reservar is not None and terminar is None:
+            print(f"🛡️ {principal} supera su p{self.percentil_cobertura}: sin hueco para la cobertura")
+            return _SIN_COBERTURA
+        with self._lock:
+            self.coberturas += 1
+
+        print(f"🛡️ {principal} supera su p{self.percentil_cobertura} ({umbral:.1f}s): cobertura con {nombre}")
+        try:
+            resultado = self._medir(nombre, llamar)
+        except Exception as e:
+            if terminar is not None:
+                terminar(e)
+            raise
+        if terminar is not None:
+            terminar()
+        return resultado
+
+    def ejecutar(self, nombres, llamar, es_valida=bool, cubrir=True, reservar=None):
+        """
+        Ejecuta 'llamar(nombre_modelo)' con el mejor modelo de 'nombres' en
+        el hilo actual. Con 'cubrir', si tarda más que su p95 se lanza la
+        misma llamada al segundo mejor en el pool de coberturas. 'reservar()'
+        (opcional) se llama antes de lanzarla: devuelve None si no hay hueco
+        (no hay cobertura) o terminar(error=None), que se llama al acabar
+        con el error de la cobertura (o sin él si salió bien). Se devuelve
+        el resultado del principal si cumple 'es_valida'; si no, el de la
+        cobertura si la cumple. Si ninguno la cumple se devuelve el del
+        principal (o, si falló, el de la cobertura); si ambas fallan se
+        relanza el error del principal.
+        """
+        orden = self.ordenar(nombres)
+        principal = orden[0]
+        with self._lock:
+            self.llamadas += 1
+            self._elegido[principal] = self._elegido.get(principal, 0) + 1
+
+        umbral = self.umbral_cobertura(principal) if cubrir and len(orden) > 1 else None
+        if umbral is None:
+            return self._medir(principal, llamar)
+
+        terminado = threading.Event()
+        cobertura = self._obtener_pool().submit(
+            self._cubrir_tras, umbral, terminado, principal, orden[1], llamar, reservar
+        )
+        try:
+            resultado = self._medir(principal, llamar)
+        except Exception as e:
+            error = e
+        else:
+            error = None
+        finally:
+            terminado.set()  # Si aún no venció el umbral, la cobertura no se lanza
+
+        if error is None and es_valida(resultado):
+            return resultado
+
+        try:
+            respaldo = cobertura.result()
+        except Exception:
+            respaldo = _SIN_COBERTURA
+        if respaldo is not _SIN_COBERTURA and es_valida(respaldo):
+            with self._lock:
+                self.coberturas_ganadas += 1
+            return respaldo
+
+        # Ninguna válida: se comporta como si no hubiera habido cobertura
+        if error is None:
+            return resultado
+        if respaldo is not _SIN_COBERTURA:
+            return respaldo
+        raise error
+
+    def estadisticas(self):
+        with self._lock:
+            modelos = {}
+            for nombre, muestras in self._muestras.items():
+                latencias = self._latencias(nombre)
+                modelos[nombre] = {
+                    "muestras": len(muestras),
+                    "tasa_error": round(self._tasa_error(nombre), 3),
+                    "p50_s": round(_percentil(latencias, 50), 3) if latencias else None,
+                    "p95_s": round(_percentil(latencias, 95), 3) if latencias else None,
+                    "elegido": self._elegido.get(nombre, 0),
+                }
+            return {
+                "modelos": modelos,
+                "llamadas": self.llamadas,
+                "coberturas": self.coberturas,
+                "coberturas_ganadas": self.coberturas_ganadas,
+            }
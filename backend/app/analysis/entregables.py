@@ -0,0 +1,249 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from flask import current_app
+from app.models import Analisis
+
+# --- Cache de Entregables Generados (Excel / XML) ---
+#
+# Un entregable depende solo de los casos guardados, del mapeo de la
+# plantilla y del formato. Su clave combina los tres:
+#
+#     sha256(ai_result_json) + versión del mapeo + formato
+#
+# y el archivo vive en UPLOAD_FOLDER/entregables/analisis_<id>/<formato>_<clave>.<ext>
+# (solo el último de cada formato). La misma clave es el ETag de la
+# descarga: si el navegador ya lo tiene se responde 304 sin leer nada.
+#
+# Como la clave cambia con el contenido, un entregable viejo nunca se sirve;
+# aun así se borran en cuanto cambian los casos (update_results, re-análisis,
+# reuse_analysis) o la plantilla, para no acumular archivos.
+#
+# Cada descarga genera el archivo en su propio buffer (RAM o temporal anónimo,
+# ver generar_en_buffer) y lo envía desde ahí: dos descargas simultáneas no
+# comparten ningún archivo. El cache en disco es solo una copia publicada con
+# os.replace y acotada por tamaño total (EXPORT_CACHE_MAX_BYTES).
+#
+# Fechas de cada archivo del cache:
+#   - mtime: cuándo se generó. Es el Last-Modified de la descarga y no cambia
+#     al servirlo, así las peticiones condicionales siguen acertando.
+#   - atime: último uso. Se fija a mano al servirlo (no depende de cómo esté
+#     montado el disco) y la poda borra primero los de atime más antiguo.
+
+EXTENSIONES = {"excel": "xlsx", "xml": "xml"}
+
+# Un .tmp más antiguo que esto (segundos) es de una escritura que no terminó
+_EDAD_TEMPORAL_HUERFANO = 3600
+
+_escritura_lock = threading.Lock()
+
+
+def version_mapeo(plantilla, mapas):
+    """Huella de todo lo que la plantilla aporta al entregable."""
+    datos = [
+        plantilla.filename_seguro,
+        plantilla.sheet_name,
+        plantilla.header_row,
+        bool(plantilla.desglosar_pasos),
+        [(m.etiqueta, m.coordenada) for m in mapas],
+    ]
+    return hashlib.sha256(json.dumps(datos).encode("utf-8")).hexdigest()[:16]
+
+
+def clave_entregable(analisis, plantilla, mapas, formato):
+    """Clave (y ETag) del entregable en 'formato' con el contenido actual."""
+    contenido = hashlib.sha256((analisis.ai_result_json or "").encode("utf-8")).hexdigest()
+    huella = f"{contenido}:{version_mapeo(plantilla, mapas)}:{formato}"
+    return hashlib.sha256(huella.encode("utf-8")).hexdigest()[:32]
+
+
+def _carpeta(analisis_id):
+    return os.path.join(
+        current_app.config["UPLOAD_FOLDER"], "entregables", f"analisis_{analisis_id}"
+    )
+
+
+def _ruta(analisis_id, formato, clave):
+    return os.path.join(_carpeta(analisis_id), f"{formato}_{clave}.{EXTENSIONES[formato]}")
+
+
+def abrir_entregable(analisis_id, formato, clave):
+    """
+    Abre el entregable ya generado con esa clave y lo marca como usado.
+    Devuelve (archivo abierto, fecha de generación) o (None, None). Aunque
+    se pode después, el descriptor sigue siendo válido hasta cerrarlo.
+    """
+    ruta = _ruta(analisis_id, formato, clave)
+    try:
+        archivo = open(ruta, "rb")
+    except FileNotFoundError:
+        return None, None
+    generado = os.fstat(archivo.fileno()).st_mtime
+    try:
+        os.utime(ruta, (time.time(), generado))  # Solo el atime: ver arriba
+    except OSError:
+        pass
+    return archivo, generado
+
+
+def generar_en_buffer(escribir):
+    """
+    Llama a 'escribir(buffer)' sobre un SpooledTemporaryFile: en RAM hasta
+    EXPORT_SPOOL_MAX_SIZE bytes y, por encima, en un archivo temporal
+    anónimo y único. Devuelve el buffer rebobinado; al cerrarlo desaparece.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=current_app.config["EXPORT_SPOOL_MAX_SIZE"])
+    try:
+        escribir(buffer)
+    except Exception:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return buffer
+
+
+def guardar_entregable(analisis_id, formato, clave, buffer, generado):
+    """
+    Copia 'buffer' al cache de forma atómica (temporal único + os.replace),
+    con 'generado' (el Last-Modified enviado) como mtime, borra los
+    anteriores de ese formato y poda el cache. Es un guardado de mejor
+    esfuerzo: si falla (disco lleno...) la descarga sigue desde el buffer.
+    Deja el buffer rebobinado.
+    """
+    ruta = _ruta(analisis_id, formato, clave)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(temporal, "wb") as f:
+            shutil.copyfileobj(buffer, f)
+        os.utime(temporal, (generado, generado))
+        os.replace(temporal, ruta)
+    except OSError as e:
+        print(f"⚠️ No se pudo guardar el entregable {formato} del análisis {analisis_id}: {e}")
+        return
+    finally:
+        buffer.seek(0)
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+    _borrar_anteriores(ruta, formato)
+    podar_entregables()
+
+
+def _borrar_anteriores(ruta, formato):
+    """Deja 'ruta' como único entregable de su formato en la carpeta."""
+    carpeta = os.path.dirname(ruta)
+    with _escritura_lock:
+        for nombre in os.listdir(carpeta):
+            viejo = os.path.join(carpeta, nombre)
+            if nombre.startswith(f"{formato}_") and viejo != ruta and not nombre.endswith(".tmp"):
+                _borrar(viejo)
+
+
+def publicar_en_flujo(analisis_id, formato, clave, trozos, generado):
+    """
+    Re-emite los trozos (bytes) de 'trozos' para enviarlos al cliente
+    mientras se generan y, a la vez, los copia a un temporal único que se
+    publica en el cache (con 'generado' como mtime) solo si la generación
+    termina. Si el cliente corta la descarga o hay un error, el temporal se
+    borra.
+    """
+    ruta = _ruta(analisis_id, formato, clave)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        copia = open(temporal, "wb")
+    except OSError as e:
+        print(f"⚠️ No se pudo guardar el entregable {formato} del análisis {analisis_id}: {e}")
+        copia = None
+
+    completo = False
+    try:
+        for trozo in trozos:
+            if copia is not None:
+                try:
+                    copia.write(trozo)
+                except OSError:
+                    copia.close()
+                    copia = None
+                    _borrar(temporal)
+            yield trozo
+        completo = True
+    finally:
+        if copia is not None:
+            copia.close()
+            if completo:
+                os.utime(temporal, (generado, generado))
+                os.replace(temporal, ruta)
+            else:
+                _borrar(temporal)
+
+    if copia is not None:
+        _borrar_anteriores(ruta, formato)
+        podar_entregables()
+
+
+def podar_entregables():
+    """
+    Mantiene el cache por debajo de EXPORT_CACHE_MAX_BYTES borrando los
+    entregables menos usados, y limpia temporales huérfanos (de procesos
+    caídos) y los archivos que dejaba la exportación anterior en 'temp/'.
+    """
+    carpeta_base = os.path.join(current_app.config["UPLOAD_FOLDER"], "entregables")
+    limite = current_app.config["EXPORT_CACHE_MAX_BYTES"]
+    ahora = time.time()
+
+    with _escritura_lock:
+        archivos = []  # (atime, tamaño, ruta)
+        for carpeta in glob.glob(os.path.join(carpeta_base, "analisis_*")):
+            for entrada in os.scandir(carpeta):
+                try:
+                    info = entrada.stat()
+                except FileNotFoundError:
+                    continue
+                if entrada.name.endswith(".tmp"):
+                    if ahora - info.st_mtime > _EDAD_TEMPORAL_HUERFANO:
+                        _borrar(entrada.path)
+                    continue
+                archivos.append((info.st_atime, info.st_size, entrada.path))
+
+        total = sum(tamano for _, tamano, _ in archivos)
+        for _, tamano, ruta in sorted(archivos):
+            if total <= limite:
+                break
+            _borrar(ruta)
+            total -= tamano
+
+        for carpeta in glob.glob(os.path.join(carpeta_base, "analisis_*")):
+            try:
+                os.rmdir(carpeta)  # Solo si quedó vacía
+            except OSError:
+                pass
+
+        for legado in glob.glob(
+            os.path.join(current_app.config["UPLOAD_FOLDER"], "temp", "entregable_*")
+        ):
+            _borrar(legado)
+
+
+def _borrar(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+
+def invalidar_entregables(analisis_id):
+    """Borra los entregables generados de un análisis."""
+    shutil.rmtree(_carpeta(analisis_id), ignore_errors=True)
+
+
+def invalidar_entregables_plantilla(plantilla):
+    """Borra los entregables de todos los análisis que usan la plantilla."""
+    for (analisis_id,) in plantilla.analisis_historial.with_entities(Analisis.id):
+        invalidar_entregables(analisis_id)
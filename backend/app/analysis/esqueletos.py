@@ -0,0 +1,116 @@
+import io
+import os
+import threading
+import openpyxl
+from flask import current_app
+from app.analysis.cache import CacheLRU
+
+# --- Esqueletos de Plantillas Excel ---
+#
+# Cada exportación partía de leer la plantilla original del disco. Ahora se
+# lee y se valida una vez al terminar el mapeo (map_step_3_columns) y su
+# versión guardada por openpyxl (el "esqueleto") se conserva:
+#
+#   Nivel 1: CacheLRU en memoria   {id_plantilla: (mtime, bytes)}
+#   Nivel 2: UPLOAD_FOLDER/esqueletos/plantilla_<id>.xlsx
+#
+# El esqueleto es el libro completo: todas las hojas, filas, validaciones y
+# nombres definidos de la plantilla, igual que el entregable de siempre.
+# Cada exportación abre su propia copia desde los bytes (los libros de
+# openpyxl no se pueden compartir entre hilos). El mtime del archivo sirve
+# para que otros procesos noten que se regeneró o se borró.
+
+_cache_esqueletos = None
+_cache_esqueletos_lock = threading.Lock()
+
+
+def _obtener_cache_esqueletos():
+    global _cache_esqueletos
+    if _cache_esqueletos is None:
+        with _cache_esqueletos_lock:
+            if _cache_esqueletos is None:
+                _cache_esqueletos = CacheLRU(
+                    max_entradas=current_app.config["TEMPLATE_SKELETON_CACHE_MAX_ENTRIES"],
+                    medir=lambda valor: len(valor[1]),
+                )
+    return _cache_esqueletos
+
+
+def _ruta_esqueleto(plantilla_id):
+    return os.path.join(
+        current_app.config["UPLOAD_FOLDER"], "esqueletos", f"plantilla_{plantilla_id}.xlsx"
+    )
+
+
+def construir_esqueleto(plantilla):
+    """
+    Lee la plantilla original (una sola vez), guarda su esqueleto en disco y
+    en memoria y devuelve sus bytes.
+    """
+    origen = os.path.join(current_app.config["UPLOAD_FOLDER"], plantilla.filename_seguro)
+    wb = openpyxl.load_workbook(origen)
+    if plantilla.sheet_name not in wb.sheetnames:
+        raise KeyError(f"La hoja '{plantilla.sheet_name}' no existe en la plantilla")
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    contenido = buffer.getvalue()
+
+    ruta = _ruta_esqueleto(plantilla.id)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)  # Atómico: nadie lee un esqueleto a medias
+
+    _obtener_cache_esqueletos().put(plantilla.id, (os.path.getmtime(ruta), contenido))
+    print(
+        f"🦴 Esqueleto de la plantilla {plantilla.id}: "
+        f"{os.path.getsize(origen) / 1024:.0f} KiB -> {len(contenido) / 1024:.0f} KiB"
+    )
+    return contenido
+
+
+def _bytes_esqueleto(plantilla):
+    ruta = _ruta_esqueleto(plantilla.id)
+    try:
+        mtime = os.path.getmtime(ruta)
+    except OSError:
+        mtime = None
+
+    cache = _obtener_cache_esqueletos()
+    entrada = cache.get(plantilla.id)
+    if entrada is not None and mtime is not None and entrada[0] == mtime:
+        return entrada[1]
+
+    if mtime is None:
+        # Plantilla mapeada antes de existir los esqueletos (o archivo borrado)
+        return construir_esqueleto(plantilla)
+
+    with open(ruta, "rb") as f:
+        contenido = f.read()
+    cache.put(plantilla.id, (mtime, contenido))
+    return contenido
+
+
+def cargar_esqueleto(plantilla):
+    """
+    Devuelve (libro, hoja mapeada) listos para escribir casos desde la fila
+    siguiente a los encabezados. Cada llamada obtiene un libro nuevo e
+    independiente.
+    """
+    wb = openpyxl.load_workbook(io.BytesIO(_bytes_esqueleto(plantilla)))
+    return wb, wb[plantilla.sheet_name]
+
+
+def invalidar_esqueleto(plantilla_id):
+    """Descarta el esqueleto (al re-mapear o eliminar la plantilla)."""
+    _obtener_cache_esqueletos().invalidar(plantilla_id)
+    try:
+        os.remove(_ruta_esqueleto(plantilla_id))
+    except FileNotFoundError:
+        pass
+
+
+def estadisticas_esqueletos():
+    return _obtener_cache_esqueletos().estadisticas()
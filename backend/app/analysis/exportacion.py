@@ -0,0 +1,153 @@
+from openpyxl.comments import Comment
+from openpyxl.styles import Alignment, NamedStyle
+from openpyxl.utils import column_index_from_string
+
+# --- Motor de Exportación a Excel ---
+#
+# El entregable puede tener decenas de miles de filas (un caso por cada paso
+# en modo "Desglosar Pasos"). Todo lo que depende solo de las columnas se
+# resuelve una vez por exportación (el plan):
+#
+#   - qué columna recibe pasos/resultados y cuáles traducen la prioridad;
+#   - en qué orden se escriben las columnas mapeadas.
+#
+# Al escribir, las celdas nuevas reciben un estilo con nombre registrado una
+# vez en el libro (ajuste de texto y alineación superior) en vez de construir
+# y registrar un Alignment nuevo cada una. Si la plantilla ya daba formato a
+# la celda (bordes, fuente...), se conserva y solo se le cambia la alineación.
+# Por debajo de la última fila de la plantilla no hay celdas previas: las
+# vacías no se crean (en modo desglose son la mayoría de las filas de pasos
+# 2..n). Solo se usa la API pública de openpyxl.
+
+ALINEACION_CASO = Alignment(wrap_text=True, vertical="top")
+ESTILO_CASO = "Caso Q-Vision"
+AUTOR_COMENTARIO = "Q-Vision"
+
+# Traducción de prioridad para la plantilla (igual que en TestLink)
+_PRIORIDAD_A_NUMERO = {"alta": 1, "media": 2, "baja": 3}
+
+
+def traducir_prioridad(valor):
+    """Alta/Media/Baja -> 1/2/3; cualquier otro valor se deja igual."""
+    if isinstance(valor, str):
+        return _PRIORIDAD_A_NUMERO.get(valor.strip().lower(), valor)
+    return valor
+
+
+def _es_prioridad(etiqueta):
+    etiqueta = etiqueta.lower()
+    return "importancia" in etiqueta or "complejidad" in etiqueta
+
+
+def planificar_exportacion(mapas, desglosar_pasos):
+    """
+    Resuelve el plan de columnas de una plantilla:
+      {"columnas": [(indice, etiqueta, es_prioridad)], "pasos": etiqueta|None,
+       "resultados": etiqueta|None}
+    'pasos'/'resultados' solo se rellenan en modo desglose y si la plantilla
+    tiene ambas columnas; si no, el caso se escribe en una sola fila.
+    """
+    # Con etiquetas repetidas gana la última coordenada (como antes)
+    indices = {m.etiqueta: column_index_from_string(m.coordenada) for m in mapas}
+    plan = {
+        "columnas": [(idx, etq, _es_prioridad(etq)) for etq, idx in indices.items()],
+        "pasos": None,
+        "resultados": None,
+    }
+    if desglosar_pasos:
+        etiquetas = [m.etiqueta for m in mapas]
+        pasos = next((e for e in etiquetas if "paso" in e.lower()), None)
+        resultados = next((e for e in etiquetas if "resultado" in e.lower()), None)
+        if pasos and resultados:
+            plan["pasos"], plan["resultados"] = pasos, resultados
+    return plan
+
+
+def _valor_celda(caso, etiqueta, es_prioridad):
+    valor = caso.get(etiqueta, "")
+    if es_prioridad:
+        valor = traducir_prioridad(valor)
+    if isinstance(valor, list):
+        valor = "\n".join(map(str, valor))
+    return valor
+
+
+def iterar_filas(casos, plan):
+    """
+    Genera (valores, comentario) por cada fila del entregable: 'valores' va
+    en el orden de plan["columnas"] y 'comentario' es el origen del caso (o
+    None) para su primera fila.
+    """
+    columnas = plan["columnas"]
+    etq_pasos, etq_resultados = plan["pasos"], plan["resultados"]
+    # Posiciones de pasos/resultados; el resto de columnas solo va en la 1ª fila
+    pos_pasos = [i for i, (_, e, _) in enumerate(columnas) if e == etq_pasos]
+    pos_resultados = [i for i, (_, e, _) in enumerate(columnas) if e == etq_resultados]
+    vacia = [""] * len(columnas)
+
+    for caso in casos:
+        origen = caso.get("__import_source") or None
+        fila = [_valor_celda(caso, etq, prio) for _, etq, prio in columnas]
+
+        if etq_pasos is None:
+            yield fila, origen
+            continue
+
+        pasos = str(caso.get(etq_pasos, "")).split("\n")
+        resultados = str(caso.get(etq_resultados, "")).split("\n")
+        total = max(len(pasos), len(resultados))
+        pasos.extend([""] * (total - len(pasos)))
+        resultados.extend([""] * (total - len(resultados)))
+
+        for n in range(total):
+            if n:
+                fila = vacia.copy()
+                origen = None
+            for i in pos_pasos:
+                fila[i] = pasos[n]
+            for i in pos_resultados:
+                fila[i] = resultados[n]
+            yield fila, origen
+
+
+def _registrar_estilo(libro):
+    if ESTILO_CASO not in libro.named_styles:
+        libro.add_named_style(NamedStyle(name=ESTILO_CASO, alignment=ALINEACION_CASO))
+
+
+def escribir_filas(ws, filas, plan, fila_inicio):
+    """
+    Escribe en 'ws' las filas de iterar_filas() desde 'fila_inicio' con el
+    estilo compartido. Devuelve el número de filas escritas.
+    """
+    _registrar_estilo(ws.parent)
+    ultima_fila_plantilla = ws.max_row
+    indices = [idx for idx, _, _ in plan["columnas"]]
+
+    fila_actual = fila_inicio
+    for valores, origen in filas:
+        en_plantilla = fila_actual <= ultima_fila_plantilla
+        for col, valor in zip(indices, valores):
+            if valor == "" and not en_plantilla and not (col == 1 and origen):
+                # Celda nueva y vacía (filas de pasos 2..n): no se crea
+                continue
+            celda = ws.cell(row=fila_actual, column=col)
+            celda.value = valor
+            if celda.has_style:
+                celda.alignment = ALINEACION_CASO
+            else:
+                celda.style = ESTILO_CASO
+            if col == 1 and origen:
+                celda.comment = Comment(origen, AUTOR_COMENTARIO)
+        fila_actual += 1
+    return fila_actual - fila_inicio
+
+
+def exportar_casos_excel(ws, casos, mapas, fila_inicio, desglosar_pasos):
+    """
+    Vuelca 'casos' en la hoja de la plantilla. Devuelve (filas_escritas,
+    plan); plan["pasos"] es None si el desglose no fue posible.
+    """
+    plan = planificar_exportacion(mapas, desglosar_pasos)
+    escritas = escribir_filas(ws, iterar_filas(casos, plan), plan, fila_inicio)
+    return escritas, plan
@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+from app import db
+from app.models import TrabajoAnalisis
+
+# --- Casos en Vivo (Server-Sent Events) ---
+#
+# Mientras un trabajo genera, cada caso que el extractor incremental completa
+# se publica en el canal del trabajo. La ruta de eventos lo reenvía al
+# navegador como SSE. Los canales viven en memoria del proceso que ejecuta el
+# trabajo; si el navegador se conecta a otro proceso, solo recibe el estado
+# (leído de la BD) y el aviso de fin.
+#
+# Cada conexión ocupa un worker mientras está abierta, así que dura como
+# máximo ANALYSIS_JOB_EVENTS_MAX_SECONDS: después se envía 'reconectar' y el
+# navegador vuelve a consultar el estado con peticiones cortas.
+
+# Cada cuánto (segundos) se manda un comentario para mantener viva la conexión
+# y, sin canal local, se vuelve a leer el estado en la BD.
+INTERVALO_LATIDO = 2
+
+
+class CanalCasos:
+    """Lista de casos publicados por un trabajo, con espera para los lectores."""
+
+    def __init__(self):
+        self.casos = []
+        self.cerrado = False
+        self._condicion = threading.Condition()
+
+    def publicar(self, caso):
+        with self._condicion:
+            self.casos.append(caso)
+            self._condicion.notify_all()
+
+    def cerrar(self):
+        with self._condicion:
+            self.cerrado = True
+            self._condicion.notify_all()
+
+    def esperar(self, desde, timeout):
+        """Devuelve los casos a partir del índice 'desde' (espera si no hay)."""
+        with self._condicion:
+            if len(self.casos) <= desde and not self.cerrado:
+                self._condicion.wait(timeout)
+            return self.casos[desde:]
+
+
+_canales = {}
+_canales_lock = threading.Lock()
+
+
+def abrir_canal(id_trabajo):
+    with _canales_lock:
+        canal = _canales[id_trabajo] = CanalCasos()
+    return canal
+
+
+def cerrar_canal(id_trabajo):
+    with _canales_lock:
+        canal = _canales.pop(id_trabajo, None)
+    if canal is not None:
+        canal.cerrar()
+
+
+def _evento(nombre, datos):
+    return f"event: {nombre}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+def _leer_estado(id_trabajo):
+    """Estado actual del trabajo en la BD (sin quedarse con la transacción abierta)."""
+    fila = db.session.execute(
+        db.select(TrabajoAnalisis.estado, TrabajoAnalisis.mensaje).where(
+            TrabajoAnalisis.id == id_trabajo
+        )
+    ).one_or_none()
+    db.session.rollback()
+    return fila
+
+
+def eventos_trabajo(id_trabajo, url_resultado, duracion_max):
+    """
+    Generador de eventos SSE de un trabajo:
+      'caso'       -> cada caso generado (solo con canal en este proceso)
+      'estado'     -> cambios de estado ('pendiente', 'en_proceso', ...)
+      'fin'        -> el trabajo terminó; incluye la URL del resultado
+      'reconectar' -> pasaron 'duracion_max' segundos: el cliente debe
+                      seguir consultando el estado por su cuenta
+    """
+    enviados = 0
+    ultimo_estado = None
+    limite = time.monotonic() + duracion_max
+
+    while True:
+        if time.monotonic() >= limite:
+            yield _evento("reconectar", {"casos_enviados": enviados})
+            return
+
+        with _canales_lock:
+            canal = _canales.get(id_trabajo)
+
+        if canal is not None:
+            nuevos = canal.esperar(enviados, INTERVALO_LATIDO)
+            for caso in nuevos:
+                yield _evento("caso", caso)
+            enviados += len(nuevos)
+            if not canal.cerrado:
+                if not nuevos:
+                    yield ": latido\n\n"
+                continue
+
+        fila = _leer_estado(id_trabajo)
+        if fila is None:
+            yield _evento("fin", {"estado": "error", "mensaje": "Trabajo no encontrado"})
+            return
+
+        estado, mensaje = fila
+        if estado in ("completado", "error"):
+            yield _evento(
+                "fin", {"estado": estado, "mensaje": mensaje, "url_resultado": url_resultado}
+            )
+            return
+        if estado != ultimo_estado:
+            ultimo_estado = estado
+            yield _evento("estado", {"estado": estado})
+
+        if canal is None:
+            # El trabajo se ejecuta en otro proceso (o aún no arranca)
+            yield ": latido\n\n"
+            time.sleep(INTERVALO_LATIDO)
@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
 from wtforms import SelectField, SubmitField
-from flask_wtf.file import FileField, FileRequired
+from flask_wtf.file import FileField, FileRequired, MultipleFileField
 from wtforms.validators import DataRequired
 
 class AnalysisForm(FlaskForm):
@@ -13,4 +13,13 @@ class AnalysisForm(FlaskForm):
         'Archivo de Requerimiento (.txt, .docx, .xlsx)', 
         validators=[FileRequired(message="Debes subir un archivo.")]
     )
-    submit = SubmitField('Analizar')
\ No newline at end of file
+    submit = SubmitField('Analizar')
+
+class AnalisisLoteForm(FlaskForm):
+    plantilla = SelectField(
+        'Seleccionar Plantilla',
+        coerce=int,
+        validators=[DataRequired(message="Debes seleccionar una plantilla.")]
+    )
+    archivos_requerimiento = MultipleFileField('Archivos de Requerimiento (.txt, .docx, .xlsx)')
+    submit = SubmitField('Analizar lote')
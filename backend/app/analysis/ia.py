@@ -0,0 +1,392 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+import google.generativeai as genai
+from flask import current_app
+from app.analysis.enrutador import EnrutadorModelos
+from app.analysis.json_incremental import respuesta_completa
+from app.analysis.resiliencia import obtener_resiliencia
+
+# --- Proveedores de IA ---
+#
+# La generación pasa por un proveedor elegido con Config.LLM_PROVIDER:
+#   'gemini' -> Google Gemini (ClienteGemini)
+#   'local'  -> ProveedorLocal: casos sintéticos y deterministas, sin red,
+#               para pruebas de carga y benchmarks del pipeline completo.
+# Cada proveedor implementa la interfaz de ProveedorIA.
+
+
+class ProveedorIA(ABC):
+    """Interfaz común de los proveedores de generación."""
+
+    nombre = "IA"
+
+    @abstractmethod
+    def preparar(self):
+        """
+        Deja el proveedor listo para generar (configuración, modelo) y
+        devuelve el nombre del modelo que se usará. Lanza RuntimeError si
+        no es posible.
+        """
+
+    @abstractmethod
+    def generar(self, prompt, generation_config, timeout):
+        """Devuelve el texto completo de la respuesta."""
+
+    @abstractmethod
+    def generar_en_flujo(self, prompt, generation_config, timeout):
+        """Itera los fragmentos de texto de la respuesta según se generan."""
+
+    def contar_tokens(self, texto):
+        """Tokens exactos de 'texto' según el modelo, o None si no se ofrece."""
+        return None
+
+    def refrescar(self):
+        return self.preparar()
+
+    def estado(self):
+        return {"proveedor": self.nombre}
+
+
+# --- Cliente de Gemini (uno por proceso) ---
+
+# Modelos candidatos, en orden de preferencia
+MODELOS_CANDIDATOS = [
+    "models/gemini-flash-latest",
+    "models/gemini-pro-latest",
+    "gemini-1.5-flash-latest",
+    "models/gemini-1.5-flash-latest",
+    "gemini-1.5-flash",
+    "models/gemini-1.5-flash",
+    "gemini-pro",
+]
+
+
+def _normalizar_nombre(nombre):
+    return nombre if nombre.startswith("models/") else f"models/{nombre}"
+
+
+class ClienteGemini(ProveedorIA):
+    """
+    Configura 'genai' y resuelve los modelos una sola vez por proceso.
+    El camino de cada petición solo hace la llamada de generación; el
+    listado de modelos se hace al resolver (primer uso, refresco explícito
+    o re-validación periódica en segundo plano).
+    Si hay varios candidatos disponibles, cada petición va al más rápido
+    según el enrutador (ver app/analysis/enrutador.py), con cobertura.
+    """
+
+    nombre = "Gemini"
+
+    def __init__(self, candidatos=None):
+        self.candidatos = list(candidatos or MODELOS_CANDIDATOS)
+        self._lock = threading.Lock()
+        self._api_key = None
+        self._modelo = None
+        self._nombre_modelo = None
+        self._modelos = {}  # nombre -> modelo, en orden de preferencia
+        self._max_modelos = 1
+        self._enrutador = None
+        self._cubrir = False
+        self._resuelto_en = None
+        self._hilo_revalidacion = None
+
+    def _configurar_enrutador(self, config):
+        """Crea el enrutador con la configuración de la app (una sola vez)."""
+        if self._enrutador is not None:
+            return
+        with self._lock:
+            if self._enrutador is None:
+                self._max_modelos = max(config["GEMINI_ROUTER_MAX_MODELS"], 1)
+                self._cubrir = config["LLM_HEDGE_ENABLED"]
+                self._enrutador = EnrutadorModelos(
+                    ventana=config["GEMINI_ROUTER_WINDOW"],
+                    min_muestras=config["GEMINI_ROUTER_MIN_SAMPLES"],
+                    exploracion=config["GEMINI_ROUTER_EXPLORATION"],
+                    percentil_cobertura=config["LLM_HEDGE_PERCENTILE"],
+                    min_umbral_cobertura=config["LLM_HEDGE_MIN_DELAY"],
+                    max_fraccion_coberturas=config["LLM_HEDGE_MAX_RATIO"],
+                    # Un hilo por llamada cubierta en curso y otro tanto para
+                    # las coberturas sobrantes que aún no terminaron
+                    max_hilos=2 * config["LLM_MAX_CONCURRENCY"],
+                )
+
+    def preparar(self):
+        api_key = current_app.config["GEMINI_API_KEY"]
+        if not api_key:
+            raise RuntimeError("Error: API Key no configurada")
+        self._configurar_enrutador(current_app.config)
+        _, nombre = self.obtener_modelo(api_key)
+        self.iniciar_revalidacion(current_app.config["GEMINI_REVALIDATION_INTERVAL"])
+        return nombre
+
+    def generar(self, prompt, generation_config, timeout):
+        modelos = self._modelos
+
+        def _llamar(nombre):
+            return modelos[nombre].generate_content(
+                prompt,
+                generation_config=generation_config,
+                request_options={"timeout": timeout},
+            ).text.strip()
+
+        # Una respuesta que no es JSON utilizable da paso a la cobertura, que
+        # respeta los límites y el circuito de la capa de resiliencia
+        return self._enrutador.ejecutar(
+            list(modelos),
+            _llamar,
+            es_valida=respuesta_completa,
+            cubrir=self._cubrir,
+            reservar=obtener_resiliencia().reservar_cobertura,
+        )
+
+    def generar_en_flujo(self, prompt, generation_config, timeout):
+        # Sin cobertura: los casos ya entregados no se pueden deshacer
+        modelos = self._modelos
+        nombre = self._enrutador.ordenar(list(modelos))[0]
+        inicio = time.monotonic()
+        try:
+            for fragmento in modelos[nombre].generate_content(
+                prompt,
+                generation_config=generation_config,
+                stream=True,
+                request_options={"timeout": timeout},
+            ):
+                yield fragmento.text
+        except Exception:
+            self._enrutador.registrar(nombre, time.monotonic() - inicio, False)
+            raise
+        self._enrutador.registrar(nombre, time.monotonic() - inicio, True)
+
+    def contar_tokens(self, texto):
+        return self._modelo.count_tokens(texto).total_tokens
+
+    def obtener_modelo(self, api_key):
+        """Devuelve (modelo, nombre_modelo), resolviéndolo solo si hace falta."""
+        modelo, nombre = self._modelo, self._nombre_modelo
+        if modelo is not None and api_key == self._api_key:
+            return modelo, nombre
+
+        with self._lock:
+            if self._modelo is None or api_key != self._api_key:
+                self._resolver(api_key)
+            return self._modelo, self._nombre_modelo
+
+    def refrescar(self):
+        """Vuelve a listar los modelos y re-resuelve el preferido disponible."""
+        with self._lock:
+            if self._api_key:
+                self._resolver(self._api_key)
+        return self._nombre_modelo
+
+    def _resolver(self, api_key):
+        """
+        Configura la API y elige los candidatos que soportan generateContent
+        (hasta GEMINI_ROUTER_MAX_MODELS); el primero es el modelo principal.
+        Si no se pudo listar, solo se usa el primero que se pueda construir.
+        """
+        genai.configure(api_key=api_key)
+
+        disponibles = None
+        try:
+            disponibles = {
+                m.name
+                for m in genai.list_models()
+                if "generateContent" in m.supported_generation_methods
+            }
+        except Exception as list_err:
+            print(f"⚠️ No se pudo listar modelos: {list_err}")
+
+        # Primero los candidatos que el listado confirma; si ninguno aparece
+        # (o no se pudo listar), se prueba construirlos en orden como antes.
+        preferidos = [
+            n for n in self.candidatos
+            if disponibles and _normalizar_nombre(n) in disponibles
+        ]
+        max_modelos = self._max_modelos if preferidos else 1
+        modelos = {}
+        for nombre in preferidos or self.candidatos:
+            try:
+                modelos[nombre] = genai.GenerativeModel(nombre)
+            except Exception as model_err:
+                print(f"❌ Falló {nombre}: {model_err}")
+                continue
+            if len(modelos) >= max_modelos:
+                break
+
+        if modelos:
+            nombre = next(iter(modelos))
+            self._api_key = api_key
+            self._modelo = modelos[nombre]
+            self._nombre_modelo = nombre
+            self._modelos = modelos
+            self._resuelto_en = time.time()
+            print(f"✅ Modelos de Gemini resueltos: {', '.join(modelos)}")
+            return
+
+        raise RuntimeError(
+            "Error: No se encontró ningún modelo compatible. "
+            "Actualiza la librería: pip install --upgrade google-generativeai"
+        )
+
+    def iniciar_revalidacion(self, intervalo_segundos):
+        """
+        Arranca (una sola vez) un hilo demonio que re-valida el modelo cada
+        'intervalo_segundos'. Si el refresco falla se conserva el modelo actual.
+        """
+        if not intervalo_segundos or self._hilo_revalidacion is not None:
+            return
+
+        def _bucle():
+            while True:
+                time.sleep(intervalo_segundos)
+                try:
+                    self.refrescar()
+                except Exception as e:
+                    print(f"⚠️ Re-validación del modelo fallida: {e}")
+
+        with self._lock:
+            if self._hilo_revalidacion is None:
+                self._hilo_revalidacion = threading.Thread(
+                    target=_bucle, name="revalidacion-gemini", daemon=True
+                )
+                self._hilo_revalidacion.start()
+
+    def estado(self):
+        return {
+            "proveedor": self.nombre,
+            "modelo": self._nombre_modelo,
+            "modelos": list(self._modelos),
+            "resuelto_en": self._resuelto_en,
+            "revalidacion_activa": self._hilo_revalidacion is not None,
+            "enrutador": self._enrutador.estadisticas() if self._enrutador else None,
+        }
+
+
+# Instancia única del proceso
+cliente_gemini = ClienteGemini()
+
+
+# --- Proveedor Local Determinista ---
+
+# Las claves que el prompt pide para cada caso: líneas '"Columna": "..."'
+_RE_COLUMNA_PROMPT = re.compile(r'^\s*"([^"\n]+)": "\.\.\."', re.MULTILINE)
+_RE_PALABRA = re.compile(r"\w{4,}")
+# Prompts de lote: un bloque '=== REQ-n (archivo) ===' por requerimiento
+_RE_REQUERIMIENTO_LOTE = re.compile(r"^\s*=== (REQ-\d+) \(", re.MULTILINE)
+
+
+class ProveedorLocal(ProveedorIA):
+    """
+    Sintetiza casos de prueba válidos para el esquema que pide el prompt
+    (las columnas mapeadas de la plantilla), sin salir a la red.
+    Mismo prompt -> misma respuesta. La latencia y el tamaño se configuran
+    con LOCAL_LLM_LATENCY_MS, LOCAL_LLM_CASES y LOCAL_LLM_TEXT_CHARS.
+    """
+
+    nombre = "Local"
+
+    def __init__(self):
+        self.generaciones = 0
+
+    def _parametros(self):
+        config = current_app.config
+        return (
+            config["LOCAL_LLM_LATENCY_MS"] / 1000.0,
+            config["LOCAL_LLM_CASES"],
+            config["LOCAL_LLM_TEXT_CHARS"],
+        )
+
+    def preparar(self):
+        _, casos, caracteres = self._parametros()
+        # El tamaño forma parte del nombre: cambia la huella del cache de respuestas
+        return f"local-determinista-{casos}x{caracteres}"
+
+    def _sintetizar_casos(self, prompt, casos, caracteres):
+        semilla = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(semilla)
+        columnas = list(dict.fromkeys(_RE_COLUMNA_PROMPT.findall(prompt))) or ["Caso"]
+        vocabulario = _RE_PALABRA.findall(prompt) or ["requerimiento"]
+        # En un lote se generan 'casos' por requerimiento, etiquetados
+        etiquetas = _RE_REQUERIMIENTO_LOTE.findall(prompt)
+        if etiquetas:
+            casos *= len(etiquetas)
+
+        def frase():
+            texto = " ".join(rng.choice(vocabulario) for _ in range(caracteres // 5 + 1))
+            return texto[:caracteres].strip().capitalize()
+
+        resultado = []
+        for n in range(1, casos + 1):
+            num_pasos = rng.randint(2, 5)
+            caso = {}
+            for columna in columnas:
+                nombre = columna.lower()
+                if "paso" in nombre or "resultado" in nombre:
+                    caso[columna] = "\n".join(
+                        f"{i}. {frase()}" for i in range(1, num_pasos + 1)
+                    )
+                elif nombre == "id" or nombre.startswith("id "):
+                    caso[columna] = f"CP-{n:03d}"
+                elif "importancia" in nombre or "prioridad" in nombre:
+                    caso[columna] = rng.choice(["Alta", "Media", "Baja"])
+                else:
+                    caso[columna] = frase()
+            if etiquetas:
+                caso["__requerimiento"] = etiquetas[(n - 1) % len(etiquetas)]
+            resultado.append(caso)
+        return resultado
+
+    def generar(self, prompt, generation_config, timeout):
+        latencia, casos, caracteres = self._parametros()
+        respuesta = self._sintetizar_casos(prompt, casos, caracteres)
+        time.sleep(latencia)
+        self.generaciones += 1
+        return json.dumps(respuesta, ensure_ascii=False, indent=2)
+
+    def generar_en_flujo(self, prompt, generation_config, timeout):
+        latencia, casos, caracteres = self._parametros()
+        respuesta = self._sintetizar_casos(prompt, casos, caracteres)
+        # La latencia total se reparte entre los casos, como un modelo real
+        pausa = latencia / max(len(respuesta), 1)
+        yield "["
+        for i, caso in enumerate(respuesta):
+            time.sleep(pausa)
+            yield ("," if i else "") + json.dumps(caso, ensure_ascii=False, indent=2)
+        yield "]"
+        self.generaciones += 1
+
+    def estado(self):
+        latencia, casos, caracteres = self._parametros()
+        return {
+            "proveedor": self.nombre,
+            "modelo": self.preparar(),
+            "latencia_ms": int(latencia * 1000),
+            "casos_por_respuesta": casos,
+            "generaciones": self.generaciones,
+        }
+
+
+# Proveedores disponibles (Config.LLM_PROVIDER) e instancia activa del proceso
+PROVEEDORES = {
+    "gemini": lambda: cliente_gemini,
+    "local": ProveedorLocal,
+}
+_proveedores_activos = {}
+_proveedores_lock = threading.Lock()
+
+
+def obtener_proveedor():
+    """Proveedor configurado en LLM_PROVIDER (uno por proceso y nombre)."""
+    nombre = current_app.config["LLM_PROVIDER"].lower()
+    proveedor = _proveedores_activos.get(nombre)
+    if proveedor is None:
+        if nombre not in PROVEEDORES:
+            raise RuntimeError(f"Error: Proveedor de IA desconocido '{nombre}'")
+        with _proveedores_lock:
+            proveedor = _proveedores_activos.setdefault(nombre, PROVEEDORES[nombre]())
+    return proveedor
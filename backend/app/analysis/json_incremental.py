@@ -0,0 +1,251 @@
+import json
+import re
+import threading
+
+# --- Extracción Incremental y Tolerante de Casos desde un Arreglo JSON ---
+#
+# La IA devuelve un arreglo JSON de casos ("[{...}, {...}]"), a veces envuelto
+# en ```json ... ```, con texto antes o después, comas sobrantes o cortado a
+# mitad. El extractor:
+#   - localiza el arreglo más externo (ignorando prosa y marcas markdown),
+#   - devuelve cada objeto del arreglo en cuanto se cierra,
+#   - repara comas finales sobrantes dentro de un objeto,
+#   - y al final informa qué se descartó (objetos inválidos, cola cortada).
+# Solo recorre una vez cada carácter nuevo: entre fragmentos guarda el estado
+# (profundidad, dentro/fuera de una cadena) y descarta el texto ya consumido.
+
+# Inicio del contenido: un arreglo de objetos ('[' seguido de '{' o ']') o un
+# objeto suelto ('{' seguido de una clave)
+_RE_INICIO = re.compile(r'\[\s*(?=[{\]])|\{\s*(?=")')
+# Fuera de una cadena solo interesan las llaves, corchetes y comillas
+_RE_ESTRUCTURA = re.compile(r'[\[\]{}"]')
+# Dentro de una cadena solo interesan el cierre y los escapes
+_RE_CADENA = re.compile(r'["\\]')
+# Para la reparación: cadenas completas (se respetan) o comas antes de un cierre
+_RE_COMA_SOBRANTE = re.compile(r'"(?:[^"\\]|\\.)*"|,(\s*[}\]])', re.DOTALL)
+# Lo que puede rodear al JSON sin ser "texto extra"
+_RE_MARCAS = re.compile(r"```(?:json)?|\s")
+
+# Totales del proceso, para monitoreo (ver /analysis/ia_stats)
+_estadisticas = {
+    "respuestas_incompletas": 0,
+    "casos_recuperados": 0,
+    "casos_reparados": 0,
+    "casos_descartados": 0,
+    "continuaciones": 0,
+}
+_estadisticas_lock = threading.Lock()
+
+
+def _hay_texto(fragmento):
+    return bool(_RE_MARCAS.sub("", fragmento))
+
+
+def _quitar_comas_sobrantes(texto_objeto):
+    return _RE_COMA_SOBRANTE.sub(
+        lambda m: m.group(1) if m.group(1) is not None else m.group(0), texto_objeto
+    )
+
+
+class ExtractorCasos:
+    """
+    Parser incremental de un arreglo JSON de objetos.
+    'alimentar(fragmento)' devuelve la lista de objetos que se completaron
+    con ese fragmento; 'informe()' resume lo recuperado y lo descartado.
+    Si la respuesta es un único objeto (sin arreglo), ese objeto se
+    devuelve al cerrarse.
+    """
+
+    def __init__(self):
+        self._texto = ""  # Texto pendiente, desde el inicio del objeto en curso
+        self._pos = 0
+        self._profundidad = 0
+        self._en_cadena = False
+        self._escape = False
+        self._inicio = None  # Índice en _texto del '{' del objeto en curso
+        self._nivel_casos = None  # Profundidad a la que viven los casos
+        self.terminado = False
+        self.emitidos = 0
+        self.reparados = 0
+        self.invalidos = []  # Primeros caracteres de cada objeto descartado
+        self.texto_previo = False
+        self.texto_posterior = False
+
+    def alimentar(self, fragmento):
+        if not fragmento:
+            return []
+        if self.terminado:
+            self.texto_posterior = self.texto_posterior or _hay_texto(fragmento)
+            return []
+
+        texto = self._texto + fragmento
+        i = self._pos
+        casos = []
+
+        if self._nivel_casos is None:
+            m = _RE_INICIO.search(texto, i)
+            if m is None:
+                # El inicio puede estar partido entre fragmentos: se conserva
+                # desde el último '[' o '{' y se descarta la prosa anterior
+                ultimo = max(texto.rfind("[", i), texto.rfind("{", i))
+                corte = ultimo if ultimo >= 0 else len(texto)
+                self.texto_previo = self.texto_previo or _hay_texto(texto[i:corte])
+                self._texto, self._pos = texto[corte:], 0
+                return []
+            self.texto_previo = self.texto_previo or _hay_texto(texto[i:m.start()])
+            if m.group().startswith("["):
+                self._nivel_casos = 1
+            else:
+                self._nivel_casos = 0
+                self._inicio = m.start()
+            self._profundidad = 1
+            i = m.start() + 1
+
+        if self._escape:
+            i += 1
+            self._escape = False
+
+        while i < len(texto):
+            if self._en_cadena:
+                m = _RE_CADENA.search(texto, i)
+                if m is None:
+                    i = len(texto)
+                    break
+                if m.group() == "\\":
+                    if m.end() == len(texto):
+                        # El carácter escapado llega en el siguiente fragmento
+                        self._escape = True
+                        i = len(texto)
+                        break
+                    i = m.end() + 1
+                    continue
+                self._en_cadena = False
+                i = m.end()
+                continue
+
+            m = _RE_ESTRUCTURA.search(texto, i)
+            if m is None:
+                i = len(texto)
+                break
+            c = m.group()
+            i = m.end()
+
+            if c == '"':
+                self._en_cadena = True
+            elif c in "[{":
+                if c == "{" and self._profundidad == self._nivel_casos and self._inicio is None:
+                    self._inicio = m.start()
+                self._profundidad += 1
+            else:
+                self._profundidad -= 1
+                if (
+                    c == "}"
+                    and self._inicio is not None
+                    and self._profundidad == self._nivel_casos
+                ):
+                    caso = self._decodificar(texto[self._inicio:i])
+                    if caso is not None:
+                        casos.append(caso)
+                    self._inicio = None
+                if self._profundidad <= 0:
+                    self.terminado = True
+                    self.texto_posterior = _hay_texto(texto[i:])
+                    break
+
+        # Solo se conserva el objeto en curso (si lo hay)
+        if self._inicio is None or self.terminado:
+            self._texto, self._pos = "", 0
+        else:
+            self._texto = texto[self._inicio:]
+            self._pos = i - self._inicio
+            self._inicio = 0
+        return casos
+
+    def _decodificar(self, texto_objeto):
+        try:
+            caso = json.loads(texto_objeto)
+        except json.JSONDecodeError:
+            try:
+                caso = json.loads(_quitar_comas_sobrantes(texto_objeto))
+            except json.JSONDecodeError:
+                self.invalidos.append(texto_objeto[:80])
+                return None
+            self.reparados += 1
+        self.emitidos += 1
+        return caso
+
+    def informe(self):
+        """
+        Resumen de la extracción. 'completo' es True solo si el arreglo se
+        cerró y no se descartó ningún objeto; 'truncado' indica que la
+        respuesta se cortó (con o sin un objeto a medias).
+        """
+        truncado = not self.terminado
+        return {
+            "recuperados": self.emitidos,
+            "reparados": self.reparados,
+            "descartados": len(self.invalidos)
+            + (1 if truncado and self._nivel_casos is not None and self._texto else 0),
+            "invalidos": list(self.invalidos),
+            "truncado": truncado,
+            "texto_previo": self.texto_previo,
+            "texto_posterior": self.texto_posterior,
+            "completo": self.terminado and not self.invalidos,
+        }
+
+
+def extraer_casos(texto):
+    """
+    Extrae todos los casos bien formados de una respuesta completa.
+    Devuelve (casos, informe). 'casos' es siempre una lista (vacía si no se
+    pudo recuperar nada). Un objeto único que envuelve la lista de casos
+    ({"casos": [...]}) se desenvuelve.
+    """
+    extractor = ExtractorCasos()
+    casos = extractor.alimentar(texto)
+    informe = extractor.informe()
+
+    if extractor._nivel_casos == 0 and len(casos) == 1:
+        valores = list(casos[0].values())
+        if (
+            len(valores) == 1
+            and isinstance(valores[0], list)
+            and all(isinstance(v, dict) for v in valores[0])
+        ):
+            casos = valores[0]
+            informe["recuperados"] = len(casos)
+
+    with _estadisticas_lock:
+        if not informe["completo"]:
+            _estadisticas["respuestas_incompletas"] += 1
+        _estadisticas["casos_recuperados"] += informe["recuperados"]
+        _estadisticas["casos_reparados"] += informe["reparados"]
+        _estadisticas["casos_descartados"] += informe["descartados"]
+    return casos, informe
+
+
+def respuesta_completa(texto):
+    """
+    True si 'texto' (con o sin cercas ```json) es un JSON válido o contiene
+    una lista de casos completa. No cuenta en las estadísticas: sirve para
+    elegir entre respuestas (p. ej. la principal y su cobertura).
+    """
+    limpio = texto.replace("```json", "").replace("```", "").strip()
+    try:
+        json.loads(limpio)
+        return True
+    except json.JSONDecodeError:
+        pass
+    extractor = ExtractorCasos()
+    return bool(extractor.alimentar(limpio)) and extractor.informe()["completo"]
+
+
+def registrar_continuacion():
+    """Cuenta una llamada extra hecha para regenerar solo la cola que faltó."""
+    with _estadisticas_lock:
+        _estadisticas["continuaciones"] += 1
+
+
+def estadisticas_extraccion():
+    with _estadisticas_lock:
+        return dict(_estadisticas)
@@ -0,0 +1,217 @@
+import os
+import codecs
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+import openpyxl
+from app.models import Requerimiento
+
+# Espacio de nombres de WordprocessingML (word/document.xml)
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_BODY = _W + "body"
+_W_P = _W + "p"
+_W_T = _W + "t"
+_W_R = _W + "r"
+_W_TR = _W + "tr"
+_W_TC = _W + "tc"
+
+# Elementos de un run que python-docx traduce a caracteres de control
+_CARACTERES_RUN = {_W + "tab": "\t", _W + "br": "\n", _W + "cr": "\n"}
+
+# --- Lectura de Requerimientos en Modo Streaming ---
+
+# Versión de la extracción de texto. Forma parte de la clave del cache de
+# textos (app/analysis/cache.py): súbela al cambiar lo que producen estos
+# lectores para que los archivos ya vistos se vuelvan a leer.
+VERSION_EXTRACTOR = 1
+
+
+def _recortar_vacias_finales(valores):
+    """
+    Devuelve la fila sin las celdas vacías (None) del final.
+    Las celdas vacías intermedias se conservan para no desalinear columnas.
+    """
+    fin = len(valores)
+    while fin and valores[fin - 1] is None:
+        fin -= 1
+    return valores[:fin]
+
+
+def iterar_texto_xlsx(origen):
+    """
+    Generador que recorre un Excel hoja por hoja en modo 'read_only'
+    y produce fragmentos de texto (una línea por fila no vacía).
+
+    Nunca construye el DOM completo del libro: openpyxl lee las filas
+    bajo demanda, así que la memoria no depende del tamaño del archivo.
+    """
+    workbook = openpyxl.load_workbook(origen, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield f"\n--- INICIO HOJA: {sheet.title} ---\n"
+
+            for valores in sheet.iter_rows(values_only=True):
+                valores = _recortar_vacias_finales(valores)
+                if not valores:
+                    continue
+
+                yield " | ".join(
+                    str(valor) if valor is not None else "" for valor in valores
+                ) + "\n"
+    finally:
+        workbook.close()
+
+
+def iterar_texto_docx(origen):
+    """
+    Generador que recorre 'word/document.xml' con un parser incremental
+    (iterparse) y produce los párrafos y las filas de tabla en el orden
+    del documento. Las filas se emiten como "celda | celda | ...", igual
+    que las filas de Excel.
+
+    Cada bloque de primer nivel del cuerpo se libera al terminar de
+    procesarse, así que la memoria no crece con el tamaño del documento.
+    """
+    with zipfile.ZipFile(origen) as paquete:
+        with paquete.open("word/document.xml") as document_xml:
+            pila_parrafos = []  # runs de texto de cada <w:p> abierto
+            pila_celdas = []  # párrafos de cada <w:tc> abierta
+            pila_filas = []  # celdas de cada <w:tr> abierta
+            runs_abiertos = 0  # <w:tab> también aparece en <w:tabs> (tabulaciones)
+            cuerpo = None
+            profundidad = 0
+
+            for evento, elem in ET.iterparse(document_xml, events=("start", "end")):
+                tag = elem.tag
+
+                if evento == "start":
+                    profundidad += 1
+                    if tag == _W_P:
+                        pila_parrafos.append([])
+                    elif tag == _W_TC:
+                        pila_celdas.append([])
+                    elif tag == _W_TR:
+                        pila_filas.append([])
+                    elif tag == _W_R:
+                        runs_abiertos += 1
+                    elif tag == _W_BODY:
+                        cuerpo = elem
+                    continue
+
+                profundidad -= 1
+
+                if tag == _W_R:
+                    runs_abiertos -= 1
+                elif tag == _W_T:
+                    if runs_abiertos:
+                        pila_parrafos[-1].append(elem.text or "")
+                elif tag in _CARACTERES_RUN:
+                    if runs_abiertos:
+                        pila_parrafos[-1].append(_CARACTERES_RUN[tag])
+
+                elif tag == _W_P:
+                    texto = "".join(pila_parrafos.pop())
+                    if pila_celdas:
+                        pila_celdas[-1].append(texto)
+                    else:
+                        yield texto + "\n"
+
+                elif tag == _W_TC:
+                    parrafos = pila_celdas.pop()
+                    if pila_filas:
+                        pila_filas[-1].append(" ".join(p for p in parrafos if p))
+
+                elif tag == _W_TR:
+                    celdas = pila_filas.pop()
+                    if not any(celdas):
+                        pass
+                    elif pila_celdas:
+                        # Tabla anidada: la fila se integra en la celda exterior
+                        pila_celdas[-1].append(" | ".join(celdas))
+                    else:
+                        yield " | ".join(celdas) + "\n"
+
+                # document (1) > body (2) > bloque (3): al cerrar un bloque de
+                # primer nivel ya no se necesita ninguno de sus nodos.
+                if cuerpo is not None and profundidad == 2:
+                    cuerpo.clear()
+
+
+def iterar_texto_txt(origen, tamano_bloque=64 * 1024):
+    """
+    Generador que lee un .txt (ruta o archivo binario) en bloques de tamaño fijo.
+    Usa un decodificador incremental para no partir caracteres UTF-8 entre bloques.
+    """
+    if isinstance(origen, (str, os.PathLike)):
+        with open(origen, "rb") as f:
+            yield from iterar_texto_txt(f, tamano_bloque)
+        return
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        bloque = origen.read(tamano_bloque)
+        if not bloque:
+            break
+        yield decoder.decode(bloque)
+    yield decoder.decode(b"", final=True)
+
+
+LECTORES_POR_EXTENSION = {
+    ".txt": iterar_texto_txt,
+    ".docx": iterar_texto_docx,
+    ".xlsx": iterar_texto_xlsx,
+}
+
+
+def iterar_requerimiento(origen, nombre_archivo=None):
+    """
+    Devuelve un generador de fragmentos de texto según la extensión del archivo.
+    'origen' puede ser una ruta o un archivo binario abierto (ej. el buffer de
+    una subida); en ese caso la extensión se toma de 'nombre_archivo'.
+    Las extensiones no soportadas producen un generador vacío.
+    """
+    _, extension = os.path.splitext(nombre_archivo or origen)
+    lector = LECTORES_POR_EXTENSION.get(extension.lower())
+    if lector is None:
+        return iter(())
+    return lector(origen)
+
+
+# --- Buffer de Subidas (sin pasar por UPLOAD_FOLDER) ---
+
+
+def bufferizar_subida(archivo, limite_memoria, tamano_maximo=None, tamano_bloque=64 * 1024):
+    """
+    Copia el stream de un FileStorage a un SpooledTemporaryFile, que vive en
+    RAM hasta 'limite_memoria' bytes y solo entonces se vuelca a un archivo
+    temporal anónimo (único por petición, sin colisiones de nombre).
+
+    El hash SHA-256 del contenido se calcula mientras se lee el stream.
+    Devuelve (buffer, contenido_hash) con el buffer rebobinado al inicio.
+    Lanza ValueError si el archivo supera 'tamano_maximo' bytes.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=limite_memoria)
+    hasher = Requerimiento.nuevo_hasher()
+    leidos = 0
+
+    try:
+        while True:
+            bloque = archivo.stream.read(tamano_bloque)
+            if not bloque:
+                break
+
+            leidos += len(bloque)
+            if tamano_maximo and leidos > tamano_maximo:
+                raise ValueError(
+                    f"El archivo supera el tamaño máximo permitido "
+                    f"({tamano_maximo // (1024 * 1024)} MB)."
+                )
+
+            hasher.update(bloque)
+            buffer.write(bloque)
+    except Exception:
+        buffer.close()
+        raise
+
+    buffer.seek(0)
+    return buffer, hasher.hexdigest()
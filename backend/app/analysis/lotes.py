@@ -0,0 +1,64 @@
+import re
+
+# --- Análisis por Lote de Requerimientos Pequeños ---
+#
+# Cuando se suben muchos requerimientos pequeños (historias de usuario), el
+# costo fijo de cada llamada a la IA domina. En un lote se empaquetan varios
+# requerimientos en un mismo prompt (hasta el presupuesto de tamaño), cada uno
+# con una etiqueta "REQ-n"; la IA marca cada caso con la etiqueta de su
+# requerimiento y aquí se reparten los casos de vuelta, uno por archivo.
+
+# Clave con la que la IA indica el requerimiento de cada caso
+CLAVE_REQUERIMIENTO = "__requerimiento"
+
+_RE_ETIQUETA = re.compile(r"REQ[-_ ]?(\d+)", re.IGNORECASE)
+
+
+def etiqueta_requerimiento(indice):
+    """Etiqueta del requerimiento 'indice' (base 0) dentro de su prompt."""
+    return f"REQ-{indice + 1}"
+
+
+def empaquetar_requerimientos(textos, max_caracteres, max_por_prompt):
+    """
+    Agrupa los índices de 'textos' en paquetes consecutivos de como máximo
+    'max_por_prompt' requerimientos y 'max_caracteres' en total. Un texto que
+    no cabe solo en el presupuesto va en un paquete propio (se segmentará).
+    """
+    paquetes = []
+    actual = []
+    tamano = 0
+    for indice, texto in enumerate(textos):
+        if actual and (
+            len(actual) >= max_por_prompt
+            or (max_caracteres and tamano + len(texto) > max_caracteres)
+        ):
+            paquetes.append(actual)
+            actual, tamano = [], 0
+        actual.append(indice)
+        tamano += len(texto)
+    if actual:
+        paquetes.append(actual)
+    return paquetes
+
+
+def repartir_casos(casos, cantidad):
+    """
+    Reparte los casos de un prompt de lote entre sus 'cantidad' requerimientos
+    según la etiqueta de cada caso (que se quita). Devuelve (listas, sin_asignar):
+    una lista de casos por requerimiento y cuántos casos no traían una
+    etiqueta válida (se descartan).
+    """
+    listas = [[] for _ in range(cantidad)]
+    sin_asignar = 0
+    for caso in casos:
+        if not isinstance(caso, dict):
+            sin_asignar += 1
+            continue
+        m = _RE_ETIQUETA.search(str(caso.pop(CLAVE_REQUERIMIENTO, "")))
+        numero = int(m.group(1)) if m else 0
+        if 1 <= numero <= cantidad:
+            listas[numero - 1].append(caso)
+        else:
+            sin_asignar += 1
+    return listas, sin_asignar
@@ -0,0 +1,165 @@
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# --- Patrones de Criterios (compartidos por métricas y segmentación) ---
+
+# Criterios de Aceptación funcionales: "CA-01", "C.A. 2", "Criterio de Aceptación 3"
+PATRON_CRITERIO_FUNCIONAL = r"\b(CA|C\.A\.|\bCriterio de Aceptaci[oó]n)[\s\-]?[—_]?(\d{1,3})\b"
+
+# Criterios No Funcionales: "CNF-01", "C.N.F. 2", "Requerimiento No Funcional 3"
+PATRON_CRITERIO_NO_FUNCIONAL = r"\b(CNF|C\.N\.F\.|Requerimiento No Funcional)[\s\-]?[—_]?(\d{1,3})\b"
+
+# Ambos patrones en una sola expresión compilada: un único recorrido del texto.
+# Grupos: (prefijo CA, prefijo CNF, número); solo uno de los prefijos viene lleno.
+_RE_CRITERIOS = re.compile(
+    r"\b(?:(CA|C\.A\.|Criterio de Aceptaci[oó]n)|(CNF|C\.N\.F\.|Requerimiento No Funcional))"
+    r"[\s\-]?[—_]?(\d{1,3})\b",
+    re.IGNORECASE,
+)
+
+# --- Tablas de Estimación ---
+
+# Umbrales de complejidad: (nivel, palabras mínimas, criterios mínimos)
+UMBRALES_COMPLEJIDAD = (
+    ("Alta", 800, 15),
+    ("Media", 300, 7),
+)
+
+# Lookup de PERT (To, Tm, Tp) por nivel de complejidad (horas por caso)
+PERT_LOOKUP = {
+    "Baja": {"To": 0.1, "Tm": 0.25, "Tp": 0.5},
+    "Media": {"To": 0.25, "Tm": 0.5, "Tp": 1.0},
+    "Alta": {"To": 0.5, "Tm": 0.75, "Tp": 1.5},
+}
+
+# Te = (To + 4*Tm + Tp) / 6, precalculado una sola vez por nivel
+TIEMPO_PERT_POR_CASO = {
+    nivel: (v["To"] + 4 * v["Tm"] + v["Tp"]) / 6 for nivel, v in PERT_LOOKUP.items()
+}
+
+
+# --- Motor de Métricas ---
+
+
+def escanear_texto(texto):
+    """
+    Recorre el texto una vez con la expresión combinada y devuelve
+    (conteo_palabras, ids_funcionales, ids_no_funcionales), donde los ids
+    son conjuntos de tuplas (prefijo, número) como las que daba re.findall.
+    """
+    ids_funcionales = set()
+    ids_no_funcionales = set()
+    for prefijo_ca, prefijo_cnf, numero in _RE_CRITERIOS.findall(texto):
+        if prefijo_ca:
+            ids_funcionales.add((prefijo_ca, numero))
+        else:
+            ids_no_funcionales.add((prefijo_cnf, numero))
+
+    return len(texto.split()), ids_funcionales, ids_no_funcionales
+
+
+def metricas_desde_conteos(conteo_palabras, conteo_criterios, conteo_no_funcionales):
+    """
+    Calcula nivel de complejidad, casos estimados y horas PERT a partir
+    de los conteos. No toca el texto.
+    """
+    nivel = "Baja"
+    for nombre_nivel, min_palabras, min_criterios in UMBRALES_COMPLEJIDAD:
+        if conteo_palabras > min_palabras or conteo_criterios > min_criterios:
+            nivel = nombre_nivel
+            break
+
+    # Heurística simple: 3 casos por criterio, 5 por CNF
+    casos_totales_estimados = conteo_criterios * 3 + conteo_no_funcionales * 5
+    if casos_totales_estimados == 0 and conteo_palabras > 50:
+        casos_totales_estimados = 5
+
+    tiempo_estimado_por_caso = TIEMPO_PERT_POR_CASO[nivel]
+    horas = tiempo_estimado_por_caso * casos_totales_estimados
+
+    return {
+        "palabras": conteo_palabras,
+        "criterios": conteo_criterios,
+        "criterios_no_funcionales": conteo_no_funcionales,
+        "nivel": nivel,
+        "casos_estimados": casos_totales_estimados,
+        "horas_diseño_estimadas": horas,
+        "horas_ejecucion_estimadas": horas,
+    }
+
+
+def calcular_metricas(texto):
+    """Métricas de complejidad y estimación PERT de un texto (un recorrido)."""
+    return metricas_desde_resumen(resumen_desde_texto(texto))
+
+
+# --- Resúmenes Fusionables ---
+#
+# Un resumen guarda lo mínimo para recalcular las métricas sin el texto:
+#   {"palabras": int, "ca": [[prefijo, número], ...], "cnf": [[prefijo, número], ...]}
+# Es serializable a JSON (columna Analisis.resumen_metricas) y dos resúmenes
+# se fusionan sumando palabras y uniendo los conjuntos de identificadores.
+
+
+def resumen_desde_texto(texto):
+    """Escanea el texto una vez y devuelve su resumen fusionable."""
+    conteo_palabras, ids_funcionales, ids_no_funcionales = escanear_texto(texto)
+    return {
+        "palabras": conteo_palabras,
+        "ca": sorted([list(i) for i in ids_funcionales]),
+        "cnf": sorted([list(i) for i in ids_no_funcionales]),
+    }
+
+
+def fusionar_resumenes(*resumenes):
+    """
+    Fusiona resúmenes de textos concatenados (separados por saltos de línea).
+    El resultado es el mismo que escanear el texto completo.
+    """
+    palabras = 0
+    ids_funcionales = set()
+    ids_no_funcionales = set()
+    for resumen in resumenes:
+        palabras += resumen["palabras"]
+        ids_funcionales.update(tuple(i) for i in resumen["ca"])
+        ids_no_funcionales.update(tuple(i) for i in resumen["cnf"])
+
+    return {
+        "palabras": palabras,
+        "ca": sorted([list(i) for i in ids_funcionales]),
+        "cnf": sorted([list(i) for i in ids_no_funcionales]),
+    }
+
+
+def metricas_desde_resumen(resumen):
+    """Calcula criterios, nivel y horas PERT a partir de un resumen."""
+    return metricas_desde_conteos(
+        resumen["palabras"], len(resumen["ca"]), len(resumen["cnf"])
+    )
+
+
+def calcular_metricas_lote(textos, procesos=1, chunksize=64):
+    """
+    Calcula las métricas de muchos textos. Con 'procesos' > 1 reparte el
+    trabajo en procesos (el escaneo con regex es CPU puro y no libera el GIL).
+    Devuelve una lista de diccionarios en el mismo orden que 'textos'.
+    """
+    if procesos <= 1:
+        return [calcular_metricas(texto) for texto in textos]
+
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        return list(pool.map(calcular_metricas, textos, chunksize=chunksize))
+
+
+def recalcular_registro(registro):
+    """
+    Recalcula las métricas de un registro (id, resumen, texto) para el comando
+    de recálculo masivo. Usa el resumen si existe; si no (o si 'texto' viene
+    informado para forzar el re-escaneo) escanea el texto.
+    Devuelve (id, metricas, resumen). Es una función de módulo para poder
+    enviarse a procesos trabajadores.
+    """
+    id_analisis, resumen, texto = registro
+    if texto is not None or resumen is None:
+        resumen = resumen_desde_texto(texto or "")
+    return id_analisis, metricas_desde_resumen(resumen), resumen
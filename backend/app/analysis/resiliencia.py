@@ -0,0 +1,306 @@
+import random
+import threading
+import time
+from flask import current_app
+from google.api_core import exceptions as google_exceptions
+
+# --- Resiliencia de las Llamadas a la IA ---
+#
+# Toda generación pasa por una única instancia por proceso que aplica, en orden:
+#   1. Circuito: si la IA está degradada, falla al instante sin llamarla.
+#   2. Límite de concurrencia (semáforo) y de peticiones por minuto (token bucket).
+#   3. Reintentos con backoff exponencial y jitter ante errores transitorios
+#      (429, 5xx, timeouts, cortes de conexión).
+# El timeout por llamada se pasa a la API en 'request_options' (ver routes.py).
+#
+# Las coberturas del enrutador (app/analysis/enrutador.py) son llamadas extra
+# fuera de ejecutar(): piden un hueco con reservar_cobertura(), que no espera
+# (si no hay hueco, token o el circuito no está cerrado, no hay cobertura), y
+# su resultado cuenta para el circuito como el de cualquier otra llamada.
+
+# Errores tras los que vale la pena reintentar
+ERRORES_REINTENTABLES = (
+    google_exceptions.TooManyRequests,  # 429 (incluye ResourceExhausted)
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+class IANoDisponibleError(RuntimeError):
+    """La llamada no se hizo: circuito abierto o límite de peticiones saturado."""
+
+
+def es_reintentable(error):
+    return isinstance(error, ERRORES_REINTENTABLES)
+
+
+def _es_timeout(error):
+    return isinstance(
+        error,
+        (TimeoutError, google_exceptions.DeadlineExceeded, google_exceptions.GatewayTimeout),
+    )
+
+
+class LimitadorTasa:
+    """
+    Token bucket de 'por_minuto' peticiones (ráfaga máxima = 'por_minuto')
+    más un semáforo de 'max_en_vuelo' llamadas simultáneas.
+    """
+
+    def __init__(self, max_en_vuelo, por_minuto):
+        self._semaforo = threading.BoundedSemaphore(max_en_vuelo)
+        self.capacidad = float(por_minuto)
+        self._tasa = por_minuto / 60.0  # tokens por segundo
+        self._tokens = float(por_minuto)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _tomar_token(self, limite):
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._tokens = min(
+                    self.capacidad, self._tokens + (ahora - self._ultimo) * self._tasa
+                )
+                self._ultimo = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                espera = (1 - self._tokens) / self._tasa
+            if ahora + espera > limite:
+                return False
+            time.sleep(espera)
+
+    def adquirir(self, timeout):
+        """Espera un hueco y un token; devuelve False si no llegan a tiempo."""
+        limite = time.monotonic() + timeout
+        if not self._semaforo.acquire(timeout=timeout):
+            return False
+        if not self._tomar_token(limite):
+            self._semaforo.release()
+            return False
+        return True
+
+    def liberar(self):
+        self._semaforo.release()
+
+
+class Circuito:
+    """
+    Circuit breaker: tras 'umbral' fallos consecutivos se abre y rechaza
+    llamadas durante 'espera' segundos; luego deja pasar una sola prueba
+    (semiabierto) que lo cierra si sale bien o lo vuelve a abrir si falla.
+    """
+
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMIABIERTO = "semiabierto"
+
+    def __init__(self, umbral, espera):
+        self.umbral = umbral
+        self.espera = espera
+        self.estado = self.CERRADO
+        self.fallos_consecutivos = 0
+        self._abierto_en = 0.0
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        with self._lock:
+            if self.estado == self.CERRADO:
+                return True
+            if self.estado == self.ABIERTO:
+                if time.monotonic() - self._abierto_en < self.espera:
+                    return False
+                self.estado = self.SEMIABIERTO
+                self._prueba_en_curso = False
+            if self._prueba_en_curso:
+                return False
+            self._prueba_en_curso = True
+            return True
+
+    def registrar_exito(self):
+        with self._lock:
+            self.estado = self.CERRADO
+            self.fallos_consecutivos = 0
+            self._prueba_en_curso = False
+
+    def registrar_fallo(self):
+        with self._lock:
+            self.fallos_consecutivos += 1
+            self._prueba_en_curso = False
+            if self.estado == self.SEMIABIERTO or self.fallos_consecutivos >= self.umbral:
+                if self.estado != self.ABIERTO:
+                    print(f"🔌 Circuito de la IA abierto tras {self.fallos_consecutivos} fallos")
+                self.estado = self.ABIERTO
+                self._abierto_en = time.monotonic()
+
+    def liberar_prueba(self):
+        """La prueba terminó sin veredicto (p. ej. error no transitorio)."""
+        with self._lock:
+            self._prueba_en_curso = False
+
+
+class ResilienciaIA:
+    """Combina circuito, limitador y reintentos, y lleva sus contadores."""
+
+    def __init__(
+        self,
+        max_en_vuelo=4,
+        por_minuto=60,
+        max_intentos=4,
+        espera_base=1.0,
+        espera_maxima=30.0,
+        espera_cola=60.0,
+        umbral_circuito=5,
+        espera_circuito=60.0,
+    ):
+        self.limitador = LimitadorTasa(max_en_vuelo, por_minuto)
+        self.circuito = Circuito(umbral_circuito, espera_circuito)
+        self.max_intentos = max_intentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.espera_cola = espera_cola
+        self._lock = threading.Lock()
+        self.contadores = {
+            "llamadas": 0,
+            "intentos": 0,
+            "exitos": 0,
+            "fallos": 0,
+            "reintentos": 0,
+            "timeouts": 0,
+            "rechazos_circuito": 0,
+            "rechazos_limite": 0,
+            "coberturas": 0,
+            "coberturas_sin_hueco": 0,
+            "en_vuelo": 0,
+            "segundos_en_cola": 0.0,
+        }
+
+    def _sumar(self, contador, valor=1):
+        with self._lock:
+            self.contadores[contador] += valor
+
+    def _espera_reintento(self, intento):
+        """Backoff exponencial con 'full jitter': uniforme en [0, base * 2^intento]."""
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** intento))
+
+    def ejecutar(self, funcion, puede_reintentar=None):
+        """
+        Ejecuta 'funcion()' con circuito, límites y reintentos.
+        'puede_reintentar()' (opcional) permite vetar un reintento, p. ej.
+        cuando ya se entregaron casos en streaming.
+        Lanza IANoDisponibleError si no se pudo llamar, o el último error.
+        """
+        self._sumar("llamadas")
+        for intento in range(self.max_intentos):
+            if not self.circuito.permitir():
+                self._sumar("rechazos_circuito")
+                raise IANoDisponibleError(
+                    "El servicio de IA está degradado; se reintentará en unos segundos."
+                )
+
+            inicio_cola = time.monotonic()
+            if not self.limitador.adquirir(self.espera_cola):
+                self.circuito.liberar_prueba()
+                self._sumar("rechazos_limite")
+                raise IANoDisponibleError(
+                    "Se alcanzó el límite de peticiones a la IA. Inténtalo en unos minutos."
+                )
+            self._sumar("segundos_en_cola", time.monotonic() - inicio_cola)
+
+            self._sumar("intentos")
+            self._sumar("en_vuelo")
+            try:
+                resultado = funcion()
+            except Exception as e:
+                if not es_reintentable(e):
+                    self.circuito.liberar_prueba()
+                    self._sumar("fallos")
+                    raise
+                self.circuito.registrar_fallo()
+                if _es_timeout(e):
+                    self._sumar("timeouts")
+                ultimo = intento == self.max_intentos - 1
+                if ultimo or (puede_reintentar and not puede_reintentar()):
+                    self._sumar("fallos")
+                    raise
+                espera = self._espera_reintento(intento)
+                self._sumar("reintentos")
+                print(f"🔁 Reintento {intento + 1} de la IA en {espera:.1f}s: {e}")
+            else:
+                self.circuito.registrar_exito()
+                self._sumar("exitos")
+                return resultado
+            finally:
+                self._sumar("en_vuelo", -1)
+                self.limitador.liberar()
+
+            time.sleep(espera)
+
+    def reservar_cobertura(self):
+        """
+        Reserva sin esperar un hueco del limitador para una cobertura.
+        Devuelve terminar(error), que registra el resultado en el circuito
+        (error=None si salió bien) y libera el hueco, o None si no hay hueco.
+        """
+        if self.circuito.estado != Circuito.CERRADO or not self.limitador.adquirir(0):
+            self._sumar("coberturas_sin_hueco")
+            return None
+        self._sumar("coberturas")
+        self._sumar("intentos")
+        self._sumar("en_vuelo")
+
+        def terminar(error=None):
+            self._sumar("en_vuelo", -1)
+            self.limitador.liberar()
+            if error is None:
+                self.circuito.registrar_exito()
+                self._sumar("exitos")
+                return
+            self._sumar("fallos")
+            if es_reintentable(error):
+                self.circuito.registrar_fallo()
+                if _es_timeout(error):
+                    self._sumar("timeouts")
+
+        return terminar
+
+    def estadisticas(self):
+        with self._lock:
+            contadores = dict(self.contadores)
+        contadores["segundos_en_cola"] = round(contadores["segundos_en_cola"], 3)
+        return {
+            **contadores,
+            "circuito": self.circuito.estado,
+            "fallos_consecutivos": self.circuito.fallos_consecutivos,
+        }
+
+
+_resiliencia = None
+_resiliencia_lock = threading.Lock()
+
+
+def obtener_resiliencia():
+    """Instancia del proceso, creada la primera vez con los límites de Config."""
+    global _resiliencia
+    if _resiliencia is None:
+        with _resiliencia_lock:
+            if _resiliencia is None:
+                config = current_app.config
+                _resiliencia = ResilienciaIA(
+                    max_en_vuelo=config["LLM_MAX_CONCURRENCY"],
+                    por_minuto=config["LLM_MAX_REQUESTS_PER_MINUTE"],
+                    max_intentos=config["LLM_RETRY_MAX_ATTEMPTS"],
+                    espera_base=config["LLM_RETRY_BASE_DELAY"],
+                    espera_maxima=config["LLM_RETRY_MAX_DELAY"],
+                    espera_cola=config["LLM_QUEUE_TIMEOUT"],
+                    umbral_circuito=config["LLM_CIRCUIT_FAILURE_THRESHOLD"],
+                    espera_circuito=config["LLM_CIRCUIT_RESET_TIMEOUT"],
+                )
+    return _resiliencia
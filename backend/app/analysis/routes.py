@@ -1,12 +1,11 @@
 import os
 import json
-import openpyxl
-import docx
-import re
-import xml.etree.ElementTree as ET
-import xml.dom.minidom
-import google.generativeai as genai
-from openpyxl.comments import Comment
+import shutil
+import itertools
+import time
+from functools import partial
+import unicodedata
+from urllib.parse import quote
 from flask import (
     render_template,
     flash,
@@ -17,139 +16,95 @@ from flask import (
     jsonify,
     send_file,
     current_app,
+    Response,
+    stream_with_context,
 )
 from flask_login import current_user, login_required
-from werkzeug.utils import secure_filename
-from openpyxl.styles import Alignment
+from werkzeug.exceptions import RequestEntityTooLarge
 from app import db
 from app.analysis import bp
-from app.analysis.forms import AnalysisForm
-from app.models import Usuario, Plantilla, MapaPlantilla, Analisis, AnalisisDato
-
-# --- Funciones de Ayuda: Lectura y Métricas ---
-
-
-def leer_requerimiento(filepath):
-    """
-    Lee el contenido de un archivo (.txt, .docx, .xlsx) y lo devuelve como texto.
-    ¡ACTUALIZADO! Lee todas las hojas de un archivo Excel.
-    """
-    _, extension = os.path.splitext(filepath)
-    texto_completo = ""
-
-    try:
-        if extension == ".txt":
-            with open(filepath, "r", encoding="utf-8") as f:
-                texto_completo = f.read()
-
-        elif extension == ".docx":
-            doc = docx.Document(filepath)
-            for para in doc.paragraphs:
-                texto_completo += para.text + "\n"
-
-        elif extension == ".xlsx":
-            workbook = openpyxl.load_workbook(filepath, data_only=True)
-            for sheet_name in workbook.sheetnames:
-                sheet = workbook[sheet_name]
-                texto_completo += f"\n--- INICIO HOJA: {sheet_name} ---\n"
-
-                for row in sheet.iter_rows():
-                    if all(cell.value is None for cell in row):
-                        continue
-
-                    fila_texto = [
-                        str(cell.value) if cell.value is not None else ""
-                        for cell in row
-                    ]
-                    texto_completo += " | ".join(fila_texto) + "\n"
-
-    except Exception as e:
-        flash(f"Error al leer el archivo {filepath}: {e}", "danger")
-        return None
+from app.analysis.forms import AnalysisForm, AnalisisLoteForm
+from app.analysis.metricas import (
+    resumen_desde_texto,
+    fusionar_resumenes,
+    metricas_desde_resumen,
+)
+from app.analysis.lectura import (
+    bufferizar_subida,
+    LECTORES_POR_EXTENSION,
+)
+from app.analysis.segmentacion import (
+    segmentar_requerimiento,
+    generar_casos_por_prompt,
+)
+from app.analysis.analitica import analitica_usuario
+from app.analysis.ia import obtener_proveedor
+from app.analysis.json_incremental import (
+    ExtractorCasos,
+    extraer_casos,
+    registrar_continuacion,
+    estadisticas_extraccion,
+)
+from app.analysis.lotes import (
+    CLAVE_REQUERIMIENTO,
+    etiqueta_requerimiento,
+    empaquetar_requerimientos,
+    repartir_casos,
+)
+from app.analysis.flujo import eventos_trabajo
+from app.analysis.exportacion import exportar_casos_excel
+from app.analysis.testlink import iterar_xml_testlink
+from app.analysis.esqueletos import cargar_esqueleto, estadisticas_esqueletos
+from app.analysis.entregables import (
+    EXTENSIONES,
+    clave_entregable,
+    abrir_entregable,
+    generar_en_buffer,
+    guardar_entregable,
+    publicar_en_flujo,
+    invalidar_entregables,
+)
+from app.analysis.resiliencia import obtener_resiliencia, IANoDisponibleError
+from app.analysis.cache import (
+    buscar_requerimiento_cacheado,
+    estadisticas_cache_textos,
+    huella_prompt,
+    buscar_respuesta_cacheada,
+    guardar_respuesta_cacheada,
+    estadisticas_cache_respuestas,
+)
+from app.analysis import trabajos
+from app.models import (
+    Usuario,
+    Plantilla,
+    MapaPlantilla,
+    Analisis,
+    AnalisisDato,
+    TrabajoAnalisis,
+)
 
-    return texto_completo.strip()
+# --- Funciones de Ayuda: Métricas ---
 
 
-def analizar_complejidad_requerimiento(texto):
+def obtener_resumen_metricas(analisis):
     """
-    Analiza el texto de un requerimiento para determinar métricas clave.
-    Devuelve un diccionario con las métricas.
-    ¡ACTUALIZADO! Usa la fórmula PERT (Req. #3) en lugar de heurística simple.
+    Devuelve el resumen fusionable de métricas de un análisis.
+    Los registros anteriores a la columna se escanean una única vez.
     """
-
-    # 1. Conteo de Palabras
-    palabras = texto.split()
-    conteo_palabras = len(palabras)
-
-    # 2. Conteo de Criterios de Aceptación (CA)
-    criterios_funcionales = re.findall(
-        r"\b(CA|C\.A\.|\bCriterio de Aceptaci[oó]n)[\s\-]?[—_]?(\d{1,3})\b",
-        texto,
-        re.IGNORECASE,
-    )
-    conteo_criterios_funcionales = len(set(criterios_funcionales))
-
-    # 3. Conteo de Criterios No Funcionales (CNF)
-    criterios_no_funcionales = re.findall(
-        r"\b(CNF|C\.N\.F\.|Requerimiento No Funcional)[\s\-]?[—_]?(\d{1,3})\b",
-        texto,
-        re.IGNORECASE,
-    )
-    conteo_criterios_no_funcionales = len(set(criterios_no_funcionales))
-
-    # 4. Cálculo de Complejidad
-    nivel = "Baja"
-    if conteo_palabras > 800 or conteo_criterios_funcionales > 15:
-        nivel = "Alta"
-    elif conteo_palabras > 300 or conteo_criterios_funcionales > 7:
-        nivel = "Media"
-
-    # 5. Cálculo de Casos (Heurística simple: 3 casos por criterio, 5 por CNF)
-    casos_base = conteo_criterios_funcionales * 3
-    casos_no_funcionales = conteo_criterios_no_funcionales * 5
-    casos_totales_estimados = casos_base + casos_no_funcionales
-
-    if casos_totales_estimados == 0 and conteo_palabras > 50:
-        casos_totales_estimados = 5
-
-    # 6. Definir el lookup de PERT (To, Tm, Tp) basado en complejidad
-    PERT_LOOKUP = {
-        "Baja": {"To": 0.1, "Tm": 0.25, "Tp": 0.5},
-        "Media": {"To": 0.25, "Tm": 0.5, "Tp": 1.0},
-        "Alta": {"To": 0.5, "Tm": 0.75, "Tp": 1.5},
-    }
-
-    # 7. Calcular el Tiempo Estimado (Te) por caso, usando la fórmula PERT
-    lookup = PERT_LOOKUP.get(nivel, PERT_LOOKUP["Baja"])
-    To = lookup["To"]
-    Tm = lookup["Tm"]
-    Tp = lookup["Tp"]
-
-    # Te = (To + 4*Tm + Tp) / 6
-    tiempo_estimado_por_caso = (To + (4 * Tm) + Tp) / 6
-
-    # 8. Calcular las horas totales
-    horas_diseño = tiempo_estimado_por_caso * casos_totales_estimados
-    horas_ejecucion = tiempo_estimado_por_caso * casos_totales_estimados
-
-    return {
-        "palabras": conteo_palabras,
-        "criterios": conteo_criterios_funcionales,
-        "criterios_no_funcionales": conteo_criterios_no_funcionales,
-        "nivel": nivel,
-        "casos_estimados": casos_totales_estimados,
-        "horas_diseño_estimadas": horas_diseño,
-        "horas_ejecucion_estimadas": horas_ejecucion,
-    }
+    if analisis.resumen_metricas is None:
+        analisis.resumen_metricas = resumen_desde_texto(
+            analisis.texto_requerimiento_raw or ""
+        )
+    return analisis.resumen_metricas
 
 
 # --- Funciones de Ayuda: Lógica de IA (Gemini) ---
 
 
-def generar_prompt_dinamico(texto_requerimiento, plantilla_obj):
+def _esquema_columnas(plantilla_obj):
     """
-    Crea el prompt para la IA, pidiendo solo las columnas
-    mapeadas por el usuario.
+    Devuelve (columnas_json_string, instruccion_extra_pasos) con las columnas
+    mapeadas de la plantilla, o None si no tiene ninguna.
     """
     mapas = plantilla_obj.mapas.all()
     if not mapas:
@@ -174,6 +129,18 @@ def generar_prompt_dinamico(texto_requerimiento, plantilla_obj):
     columnas_json_string = ",\n".join(
         [f'        "{col}": "..."' for col in nombres_columnas]
     )
+    return columnas_json_string, instruccion_extra_pasos
+
+
+def generar_prompt_dinamico(texto_requerimiento, plantilla_obj):
+    """
+    Crea el prompt para la IA, pidiendo solo las columnas
+    mapeadas por el usuario.
+    """
+    esquema = _esquema_columnas(plantilla_obj)
+    if esquema is None:
+        return None
+    columnas_json_string, instruccion_extra_pasos = esquema
 
     prompt = f"""
     Eres un experto en QA y pruebas de software.
@@ -203,78 +170,156 @@ def generar_prompt_dinamico(texto_requerimiento, plantilla_obj):
     return prompt
 
 
-def llamar_api_gemini(prompt):
+def generar_prompt_lote(requerimientos, plantilla_obj):
     """
-    Envía el prompt al API de Google (Gemini) y maneja la respuesta.
-    ¡VERSIÓN MEJORADA! Auto-detecta el modelo disponible.
+    Prompt para varios requerimientos pequeños a la vez ('requerimientos' es
+    una lista de (nombre, texto)). Cada caso debe indicar en la clave
+    CLAVE_REQUERIMIENTO la etiqueta REQ-n de su requerimiento.
     """
-    try:
-        # Configuración del modelo
-        api_key = current_app.config["GEMINI_API_KEY"]
-        print(
-            f"🔑 API Key encontrada: {api_key[:10]}..."
-            if api_key
-            else "❌ API Key NO encontrada"
-        )
+    esquema = _esquema_columnas(plantilla_obj)
+    if esquema is None:
+        return None
+    columnas_json_string, instruccion_extra_pasos = esquema
 
-        if not api_key:
-            return None, "Error: API Key no configurada"
+    bloques = "\n".join(
+        f"    === {etiqueta_requerimiento(i)} ({nombre}) ===\n{texto}\n"
+        f"    === FIN {etiqueta_requerimiento(i)} ==="
+        for i, (nombre, texto) in enumerate(requerimientos)
+    )
 
-        genai.configure(api_key=api_key)
+    prompt = f"""
+    Eres un experto en QA y pruebas de software.
+    
+    Tarea: Analiza CADA UNO de los siguientes {len(requerimientos)} requerimientos de software, por separado, y genera un conjunto completo de casos de prueba para cada uno.
+    
+    Requerimientos:
+{bloques}
+    
+    Instrucciones de Salida:
+    1.  Tu respuesta debe ser únicamente un objeto JSON válido.
+    2.  El JSON debe ser UNA sola lista de objetos con los casos de todos los requerimientos.
+    3.  Cada objeto (caso de prueba) debe tener EXACTAMENTE las siguientes claves (respeta mayúsculas y espacios):
+    
+    [
+      {{
+        "{CLAVE_REQUERIMIENTO}": "REQ-1",
+    {columnas_json_string}
+      }}
+    ]
+    
+    4.  La clave "{CLAVE_REQUERIMIENTO}" indica la etiqueta (REQ-1, REQ-2, ...) del requerimiento al que pertenece el caso.
+    5.  {instruccion_extra_pasos}
+    6.  Asegúrate de cubrir escenarios positivos, negativos y de borde de cada requerimiento.
+    7.  No incluyas nada antes o después del JSON. Tu respuesta debe empezar con `[` y terminar con `]`.
+    """
+    return prompt
 
-        # Lista los modelos disponibles (para debug)
-        print("📋 Listando modelos disponibles:")
-        try:
-            for m in genai.list_models():
-                if "generateContent" in m.supported_generation_methods:
-                    print(f"  ✅ {m.name}")
-        except Exception as list_err:
-            print(f"  ⚠️ No se pudo listar modelos: {list_err}")
-
-        # Intenta con diferentes nombres de modelo
-        model_names = [
-            "models/gemini-flash-latest",
-            "models/gemini-pro-latest",
-            "gemini-1.5-flash-latest",
-            "models/gemini-1.5-flash-latest",
-            "gemini-1.5-flash",
-            "models/gemini-1.5-flash",
-            "gemini-pro",
-        ]
 
-        model = None
-        model_usado = None
-        for model_name in model_names:
-            try:
-                print(f"🔄 Intentando con modelo: {model_name}")
-                model = genai.GenerativeModel(model_name)
-                model_usado = model_name
-                print(f"✅ Modelo cargado exitosamente: {model_name}")
-                break
-            except Exception as model_err:
-                print(f"❌ Falló {model_name}: {model_err}")
-                continue
-
-        if not model:
-            return (
-                None,
-                "Error: No se encontró ningún modelo compatible. Actualiza la librería: pip install --upgrade google-generativeai",
-            )
+# Configuración de generación (forma parte de la huella del cache de respuestas)
+GENERATION_CONFIG = {
+    "temperature": 0.2,
+    "top_p": 0.9,
+    "top_k": 40,
+}
 
-        # Configuración de generación
-        generation_config = {
-            "temperature": 0.2,
-            "top_p": 0.9,
-            "top_k": 40,
-        }
 
-        print(f"📤 Enviando prompt a Gemini ({model_usado})...")
-        response = model.generate_content(prompt, generation_config=generation_config)
+def _titulo_caso(caso):
+    """Identificación corta de un caso (sus dos primeros valores) para un prompt."""
+    valores = list(caso.values()) if isinstance(caso, dict) else [caso]
+    return " - ".join(str(v) for v in valores[:2])[:120]
+
+
+def generar_prompt_continuacion(prompt, casos_recuperados):
+    """
+    Prompt para regenerar solo la cola de una respuesta que llegó cortada o
+    con casos inválidos: el original más la lista de casos ya obtenidos.
+    """
+    ya_generados = "\n".join(f"    - {_titulo_caso(c)}" for c in casos_recuperados)
+    return f"""{prompt}
+    IMPORTANTE: Una respuesta anterior quedó incompleta. Ya se generaron estos {len(casos_recuperados)} casos:
+{ya_generados}
+
+    Genera ÚNICAMENTE los casos que faltan para completar la cobertura, sin repetir
+    ninguno de los anteriores, con el mismo formato (una lista JSON de objetos).
+    """
 
-        print("📥 Respuesta recibida de Gemini")
 
-        # Extrae el texto de la respuesta
-        texto_respuesta = response.text.strip()
+def _generar_en_flujo(proveedor, prompt, al_recibir_caso, timeout):
+    """
+    Genera en modo streaming: entrega cada caso a 'al_recibir_caso' en cuanto
+    el extractor incremental lo completa. Devuelve el texto íntegro.
+    """
+    extractor = ExtractorCasos()
+    partes = []
+    for texto in proveedor.generar_en_flujo(prompt, GENERATION_CONFIG, timeout):
+        partes.append(texto)
+        for caso in extractor.alimentar(texto):
+            al_recibir_caso(caso)
+    return "".join(partes).strip()
+
+
+def llamar_api_gemini(prompt, usar_cache=True, al_recibir_caso=None):
+    """
+    Envía el prompt a la IA y maneja la respuesta.
+    ¡ACTUALIZADO! La generación la hace el proveedor de Config.LLM_PROVIDER
+    (Gemini por defecto, o el proveedor local para pruebas sin red); ver
+    app/analysis/ia.py. El modelo se resuelve una sola vez por proceso.
+    Las respuestas válidas se guardan por huella (prompt, modelo, config);
+    con 'usar_cache=False' se ignora el cache y se regenera (el resultado
+    nuevo reemplaza al guardado).
+    Con 'al_recibir_caso' se genera en streaming y cada caso se entrega en
+    cuanto está completo; el valor devuelto es el mismo que sin streaming.
+    """
+    proveedor = None
+    try:
+        try:
+            proveedor = obtener_proveedor()
+            model_usado = proveedor.preparar()
+        except RuntimeError as model_err:
+            return None, str(model_err)
+
+        clave = huella_prompt(prompt, model_usado, GENERATION_CONFIG)
+        if usar_cache:
+            texto_cacheado = buscar_respuesta_cacheada(clave)
+            if texto_cacheado is not None:
+                # Se parsea en cada acierto: quien llama puede modificar la lista
+                print(f"♻️ Respuesta de la IA en cache: {clave[:12]}...")
+                json_data = json.loads(texto_cacheado)
+                if al_recibir_caso:
+                    for caso in json_data if isinstance(json_data, list) else [json_data]:
+                        al_recibir_caso(caso)
+                return json_data, texto_cacheado
+
+        # Límites de concurrencia/tasa, reintentos con backoff y circuito
+        # (ver app/analysis/resiliencia.py); el timeout va por llamada.
+        resiliencia = obtener_resiliencia()
+        timeout = current_app.config["LLM_REQUEST_TIMEOUT"]
+
+        def _generar(prompt_a_enviar):
+            if not al_recibir_caso:
+                return resiliencia.ejecutar(
+                    lambda: proveedor.generar(prompt_a_enviar, GENERATION_CONFIG, timeout)
+                )
+            # Si ya se entregaron casos, reintentar los duplicaría
+            publicados = []
+
+            def _publicar(caso):
+                publicados.append(caso)
+                al_recibir_caso(caso)
+
+            return resiliencia.ejecutar(
+                lambda: _generar_en_flujo(proveedor, prompt_a_enviar, _publicar, timeout),
+                puede_reintentar=lambda: not publicados,
+            )
+
+        print(f"📤 Enviando prompt a {proveedor.nombre} ({model_usado})...")
+        try:
+            texto_respuesta = _generar(prompt)
+        except IANoDisponibleError as e:
+            print(f"⛔ {e}")
+            return None, f"Error: {e}"
+
+        print(f"📥 Respuesta recibida de {proveedor.nombre}")
 
         # Limpia el formato markdown si existe
         texto_limpio = texto_respuesta.replace("```json", "").replace("```", "").strip()
@@ -283,38 +328,148 @@ def llamar_api_gemini(prompt):
         try:
             json_data = json.loads(texto_limpio)
             print(f"✅ JSON válido con {len(json_data)} casos de prueba")
-            return json_data, texto_limpio
+            completo = True
         except json.JSONDecodeError as json_err:
-            print(f"❌ Error de JSON: {json_err}")
-            print(f"📄 Texto recibido (primeros 500 chars): {texto_limpio[:500]}...")
-            return None, f"Error: La IA devolvió un JSON inválido. {json_err}"
+            # Extracción tolerante: se recuperan los casos bien formados y,
+            # si la respuesta quedó incompleta, se pide solo la cola faltante.
+            print(f"⚠️ JSON inválido ({json_err}); recuperando casos bien formados...")
+            json_data, informe = extraer_casos(texto_respuesta)
+            if not json_data:
+                print(f"📄 Texto recibido (primeros 500 chars): {texto_limpio[:500]}...")
+                return None, f"Error: La IA devolvió un JSON inválido. {json_err}"
+            print(
+                f"🩹 {informe['recuperados']} casos recuperados "
+                f"({informe['reparados']} reparados, {informe['descartados']} descartados, "
+                f"truncada: {'sí' if informe['truncado'] else 'no'})"
+            )
+
+            for _ in range(current_app.config["LLM_TAIL_MAX_ATTEMPTS"]):
+                if informe["completo"]:
+                    break
+                registrar_continuacion()
+                print(f"📤 Regenerando solo la cola ({len(json_data)} casos ya obtenidos)...")
+                try:
+                    texto_cola = _generar(generar_prompt_continuacion(prompt, json_data))
+                except IANoDisponibleError as e:
+                    print(f"⛔ {e}")
+                    break
+                casos_cola, informe = extraer_casos(texto_cola)
+                json_data = json_data + casos_cola
+                print(f"🧩 Cola: {len(casos_cola)} casos más ({len(json_data)} en total)")
+
+            texto_limpio = json.dumps(json_data, indent=4)
+            completo = informe["completo"]
+
+        # Solo se cachean respuestas válidas y completas: un resultado parcial
+        # (colas agotadas o IA no disponible) se devuelve sin guardarlo
+        if completo:
+            guardar_respuesta_cacheada(clave, model_usado, texto_limpio)
+        else:
+            print("⚠️ Respuesta incompleta: no se guarda en cache")
+        return json_data, texto_limpio
 
     except Exception as e:
-        print(f"❌ Error en API de Gemini: {e}")
+        nombre_api = proveedor.nombre if proveedor else "IA"
+        print(f"❌ Error en API de {nombre_api}: {e}")
         import traceback
 
         traceback.print_exc()
-        return None, f"Error: Ocurrió un problema al contactar la API de Gemini. {e}"
+        return None, f"Error: Ocurrió un problema al contactar la API de {nombre_api}. {e}"
 
 
-# --- Funciones de Ayuda: Generación de Entregables ---
+def generar_casos_por_grupos(
+    textos, plantilla_obj, max_caracteres, usar_cache=True, al_recibir_caso=None
+):
+    """
+    Genera en paralelo los casos de varios trozos de requerimiento (los
+    grupos de un re-análisis diferencial) y los devuelve por separado.
+    Un trozo mayor que 'max_caracteres' se segmenta como de costumbre.
+    Devuelve (listas, None), una lista de casos por trozo, o (None, error).
+    """
+    prompts = []
+    grupo_de_prompt = []
+    for numero, texto in enumerate(textos):
+        for seg in segmentar_requerimiento(texto, max_caracteres):
+            prompt = generar_prompt_dinamico(seg, plantilla_obj)
+            if prompt is None:
+                return None, "La plantilla seleccionada no tiene columnas mapeadas."
+            prompts.append(prompt)
+            grupo_de_prompt.append(numero)
+
+    listas, error = generar_casos_por_prompt(
+        prompts,
+        partial(llamar_api_gemini, usar_cache=usar_cache, al_recibir_caso=al_recibir_caso),
+    )
+    if listas is None:
+        return None, f"Error en la generación por secciones: {error}"
+
+    por_grupo = [[] for _ in textos]
+    for numero, casos in zip(grupo_de_prompt, listas):
+        por_grupo[numero].extend(casos)
+    return por_grupo, None
 
 
-def _traducir_complejidad_a_numero(valor_texto):
+def generar_casos_lote(requerimientos, plantilla_obj, max_caracteres, usar_cache=True):
     """
-    Traduce el texto de complejidad/importancia (Alta, Media, Baja)
-    a su equivalente numérico para TestLink (1, 2, 3).
+    Genera los casos de varios requerimientos ('requerimientos' es una lista
+    de (nombre, texto)) con el menor número de llamadas: los pequeños se
+    empaquetan en prompts de lote (ver app/analysis/lotes.py) y los que no
+    caben se segmentan como de costumbre. Los requerimientos que la IA dejó
+    sin casos en su paquete se vuelven a pedir por separado.
+    Devuelve (listas, None), una lista de casos por requerimiento, o (None, error).
     """
-    if isinstance(valor_texto, str):
-        valor_lower = valor_texto.strip().lower()
-        if valor_lower == "alta":
-            return 1
-        elif valor_lower == "media":
-            return 2
-        elif valor_lower == "baja":
-            return 3
+    llamar = partial(llamar_api_gemini, usar_cache=usar_cache)
+    textos = [texto for _, texto in requerimientos]
+    paquetes = empaquetar_requerimientos(
+        textos, max_caracteres, current_app.config["ANALYSIS_BATCH_MAX_PER_PROMPT"]
+    )
+
+    prompts = []
+    for paquete in paquetes:
+        if len(paquete) == 1:
+            continue
+        prompt = generar_prompt_lote([requerimientos[i] for i in paquete], plantilla_obj)
+        if prompt is None:
+            return None, "La plantilla seleccionada no tiene columnas mapeadas."
+        prompts.append(prompt)
+    paquetes_lote = [p for p in paquetes if len(p) > 1]
+    individuales = [p[0] for p in paquetes if len(p) == 1]
+
+    por_requerimiento = [[] for _ in requerimientos]
+    if prompts:
+        listas, error = generar_casos_por_prompt(prompts, llamar)
+        if listas is None:
+            return None, f"Error en la generación por lote: {error}"
+        for paquete, casos in zip(paquetes_lote, listas):
+            repartidos, sin_asignar = repartir_casos(casos, len(paquete))
+            if sin_asignar:
+                print(f"⚠️ {sin_asignar} casos sin etiqueta {CLAVE_REQUERIMIENTO} válida (descartados)")
+            for indice, casos_req in zip(paquete, repartidos):
+                por_requerimiento[indice] = casos_req
+        individuales += [
+            i for paquete in paquetes_lote for i in paquete if not por_requerimiento[i]
+        ]
+
+    if individuales:
+        listas, error = generar_casos_por_grupos(
+            [textos[i] for i in individuales],
+            plantilla_obj,
+            max_caracteres,
+            usar_cache=usar_cache,
+        )
+        if listas is None:
+            return None, error
+        for indice, casos in zip(individuales, listas):
+            por_requerimiento[indice] = casos
+
+    print(
+        f"📦 Lote de {len(requerimientos)} requerimientos: {len(prompts)} prompts de lote "
+        f"y {len(individuales)} individuales"
+    )
+    return por_requerimiento, None
+
 
-    return valor_texto
+# --- Funciones de Ayuda: Generación de Entregables ---
 
 
 @bp.route("/generate_file/<int:view_id>/<type>", endpoint="generate_file")
@@ -336,7 +491,36 @@ def generar_excel_entregable(view_id, type):
         flash("No se encontró la plantilla asociada a este análisis.", "danger")
         return redirect(url_for("analysis.analysis_index", view_id=view_id))
 
-    # 2. Cargar los datos JSON generados por la IA
+    if type not in EXTENSIONES:
+        flash("Tipo de archivo no válido para generar.", "danger")
+        return redirect(url_for("analysis.analysis_index", view_id=view_id))
+
+    # 2. Obtener el mapeo de columnas
+    mapas = plantilla_obj.mapas.all()
+    if not mapas:
+        flash("La plantilla no tiene columnas mapeadas.", "danger")
+        return redirect(url_for("analysis.analysis_index", view_id=view_id))
+
+    # 3. Entregable ya generado con el mismo contenido: 304 si el navegador
+    # ya lo tiene, o el archivo guardado
+    if type == "excel":
+        download_name = f"{analisis.nombre_requerimiento or 'casos'}_generados.xlsx"
+        mimetype = None
+    else:
+        download_name = f"{analisis.nombre_requerimiento or 'casos'}_testlink.xml"
+        mimetype = "text/xml"
+
+    clave = clave_entregable(analisis, plantilla_obj, mapas, type)
+    if request.if_none_match.contains(clave):
+        respuesta = current_app.response_class(status=304)
+        respuesta.set_etag(clave)
+        return _cabeceras_entregable(respuesta)
+
+    archivo, generado = abrir_entregable(analisis.id, type, clave)
+    if archivo is not None:
+        return _enviar_entregable(archivo, clave, download_name, mimetype, generado)
+
+    # 4. Cargar los datos JSON generados por la IA
     try:
         data = json.loads(analisis.ai_result_json)
         if not data or not isinstance(data, list):
@@ -348,243 +532,131 @@ def generar_excel_entregable(view_id, type):
         )
         return redirect(url_for("analysis.analysis_index", view_id=view_id))
 
-    # 3. Obtener el mapeo de columnas
-    mapas = plantilla_obj.mapas.all()
-    if not mapas:
-        flash("La plantilla no tiene columnas mapeadas.", "danger")
-        return redirect(url_for("analysis.analysis_index", view_id=view_id))
-
     # === Lógica de Generación de EXCEL ===
     if type == "excel":
-        # 4. Cargar el archivo de plantilla original
-        plantilla_path = os.path.join(
-            current_app.config["UPLOAD_FOLDER"], plantilla_obj.filename_seguro
-        )
+        # 5. Cargar el esqueleto de la plantilla (el libro completo, ya
+        # procesado al mapear)
         try:
-            wb = openpyxl.load_workbook(plantilla_path)
-            ws = wb[plantilla_obj.sheet_name]
+            wb, ws = cargar_esqueleto(plantilla_obj)
         except Exception as e:
             flash(f"Error al cargar el archivo de plantilla Excel: {e}", "danger")
             return redirect(url_for("analysis.analysis_index", view_id=view_id))
 
-        # 5. Obtener las cabeceras mapeadas y sus índices de columna
-        cabeceras_mapeadas = [mapa.etiqueta for mapa in mapas]
-        col_indices = {
-            mapa.etiqueta: openpyxl.utils.column_index_from_string(mapa.coordenada)
-            for mapa in mapas
-        }
-
-        # 6. Lógica de Escritura de Datos
-        fila_actual = plantilla_obj.header_row + 1
-
-        etiqueta_pasos = None
-        etiqueta_resultados = None
-
-        if plantilla_obj.desglosar_pasos:
-            etiqueta_pasos = next(
-                (c for c in cabeceras_mapeadas if "paso" in c.lower()), None
-            )
-            etiqueta_resultados = next(
-                (c for c in cabeceras_mapeadas if "resultado" in c.lower()), None
+        # 6. Volcar los casos con el motor de exportación (plan por columnas
+        # y estilo compartido)
+        filas_escritas, plan = exportar_casos_excel(
+            ws,
+            data,
+            mapas,
+            plantilla_obj.header_row + 1,
+            plantilla_obj.desglosar_pasos,
+        )
+        if plantilla_obj.desglosar_pasos and plan["pasos"] is None:
+            flash(
+                'Modo "Desglosar Pasos" activado, pero no se encontraron etiquetas para "Pasos" y "Resultados".',
+                "warning",
             )
+        print(f"📄 Entregable Excel del análisis {analisis.id}: {filas_escritas} filas")
 
-            if not etiqueta_pasos or not etiqueta_resultados:
-                flash(
-                    'Modo "Desglosar Pasos" activado, pero no se encontraron etiquetas para "Pasos" y "Resultados".',
-                    "warning",
-                )
-                plantilla_obj.desglosar_pasos = False
-            else:
-                for fila_data in data:
-                    pasos = str(fila_data.get(etiqueta_pasos, "")).split("\n")
-                    resultados = str(fila_data.get(etiqueta_resultados, "")).split("\n")
-
-                    max_len = max(len(pasos), len(resultados))
-                    pasos.extend([""] * (max_len - len(pasos)))
-                    resultados.extend([""] * (max_len - len(resultados)))
-
-                    for i in range(max_len):
-                        for col_name, col_idx in col_indices.items():
-                            celda = ws.cell(row=fila_actual, column=col_idx)
-
-                            if col_name == etiqueta_pasos:
-                                valor = pasos[i]
-                            elif col_name == etiqueta_resultados:
-                                valor = resultados[i]
-                            elif i == 0:
-                                valor = fila_data.get(col_name, "")
-
-                                if (
-                                    "importancia" in col_name.lower()
-                                    or "complejidad" in col_name.lower()
-                                ):
-                                    valor = _traducir_complejidad_a_numero(valor)
-                            else:
-                                valor = ""
-
-                            celda.value = valor
-                            celda.alignment = Alignment(wrap_text=True, vertical="top")
-
-                            # --- 🆕 MEJORA: LÓGICA DE COMENTARIO EN PRIMERA COLUMNA ---
-                            import_source = fila_data.get("__import_source")
-
-                            # Colocar comentario SIEMPRE en la primera columna (col_idx == 1)
-                            if import_source and col_idx == 1:
-                                # Solo agregar una vez por grupo desglosado (i == 0)
-                                if i == 0:
-                                    celda.comment = Comment(import_source, "Q-Vision")
-                            # --- FIN DE LÓGICA DE COMENTARIO ---
-
-                        fila_actual += 1
-
-        if not plantilla_obj.desglosar_pasos:
-            for fila in data:
-                for cabecera_actual in cabeceras_mapeadas:
-                    col_idx = col_indices[cabecera_actual]
-                    celda = ws.cell(row=fila_actual, column=col_idx)
-
-                    valor = fila.get(cabecera_actual, "")
-
-                    if (
-                        "importancia" in cabecera_actual.lower()
-                        or "complejidad" in cabecera_actual.lower()
-                    ):
-                        valor = _traducir_complejidad_a_numero(valor)
-
-                    if isinstance(valor, list):
-                        valor = "\n".join(map(str, valor))
-
-                    celda.value = valor
-                    celda.alignment = Alignment(wrap_text=True, vertical="top")
-
-                    # --- 🆕 MEJORA: LÓGICA DE COMENTARIO EN PRIMERA COLUMNA ---
-                    import_source = fila.get("__import_source")
-
-                    # Colocar comentario SIEMPRE en la primera columna (col_idx == 1)
-                    if import_source and col_idx == 1:
-                        celda.comment = Comment(import_source, "Q-Vision")
-                    # --- FIN DE LÓGICA DE COMENTARIO ---
-
-                fila_actual += 1
-
-        # 7. Guardar el archivo temporalmente
-        temp_dir = os.path.join(current_app.config["UPLOAD_FOLDER"], "temp")
-        os.makedirs(temp_dir, exist_ok=True)
-        excel_path = os.path.join(temp_dir, f"entregable_{analisis.id}.xlsx")
-        wb.save(excel_path)
-
-        # 8. Enviar el archivo al usuario
-        return send_file(
-            excel_path,
-            as_attachment=True,
-            download_name=f"{analisis.nombre_requerimiento or 'casos'}_generados.xlsx",
-        )
+        # 7. Generar en un buffer propio de esta descarga, publicarlo en el
+        # cache de entregables y enviarlo desde el buffer
+        generado = time.time()
+        buffer = generar_en_buffer(wb.save)
+        guardar_entregable(analisis.id, type, clave, buffer, generado)
+        return _enviar_entregable(buffer, clave, download_name, mimetype, generado)
 
     # === Lógica de Generación de XML ===
-    elif type == "xml":
-        try:
-            cabeceras_mapeadas = [mapa.etiqueta for mapa in mapas]
-            xml_string = generar_xml_entregable(data, cabeceras_mapeadas)
+    # Se escribe caso a caso directamente en la respuesta (y en el cache).
+    # Una vez enviadas las cabeceras ya no se puede avisar de un error, así
+    # que los casos se validan y el primer trozo se genera antes.
+    cabeceras_mapeadas = [mapa.etiqueta for mapa in mapas]
+    try:
+        invalido = next((i for i, caso in enumerate(data, 1) if not isinstance(caso, dict)), None)
+        if invalido is not None:
+            raise ValueError(f"el caso {invalido} no es un objeto JSON")
+        generador = iterar_xml_testlink(data, cabeceras_mapeadas)
+        primero = next(generador)
+    except Exception as e:
+        flash(f"Error al generar el XML: {e}", "danger")
+        return redirect(url_for("analysis.analysis_index", view_id=view_id))
 
-            temp_dir = os.path.join(current_app.config["UPLOAD_FOLDER"], "temp")
-            os.makedirs(temp_dir, exist_ok=True)
-            xml_path = os.path.join(temp_dir, f"entregable_{analisis.id}.xml")
+    trozos = (
+        trozo.encode("utf-8") for trozo in itertools.chain([primero], generador)
+    )
+    generado = time.time()
+    respuesta = Response(
+        stream_with_context(publicar_en_flujo(analisis.id, type, clave, trozos, generado)),
+        mimetype=mimetype,
+    )
+    respuesta.headers["Content-Disposition"] = _disposicion_adjunto(download_name)
+    respuesta.set_etag(clave)
+    respuesta.last_modified = generado
+    return _cabeceras_entregable(respuesta)
 
-            with open(xml_path, "w", encoding="utf-8") as f:
-                f.write(xml_string)
 
-            return send_file(
-                xml_path,
-                as_attachment=True,
-                mimetype="text/xml",
-                download_name=f"{analisis.nombre_requerimiento or 'casos'}_testlink.xml",
-            )
+def _disposicion_adjunto(nombre):
+    """Content-Disposition de descarga, con 'filename*' si el nombre no es ASCII."""
+    try:
+        nombre.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", nombre).encode("ascii", "ignore").decode("ascii")
+        simple = simple.replace('"', "")
+        return (
+            f'attachment; filename="{simple}"; '
+            f"filename*=UTF-8''{quote(nombre, safe='')}"
+        )
+    return 'attachment; filename="{}"'.format(nombre.replace('"', ""))
 
-        except Exception as e:
-            flash(f"Error al generar el XML: {e}", "danger")
-            return redirect(url_for("analysis.analysis_index", view_id=view_id))
 
-    flash("Tipo de archivo no válido para generar.", "danger")
-    return redirect(url_for("analysis.analysis_index", view_id=view_id))
+def _cabeceras_entregable(respuesta):
+    # Privado del usuario y siempre re-validado con el ETag
+    respuesta.cache_control.private = True
+    respuesta.cache_control.no_cache = True
+    return respuesta
 
 
-def generar_xml_entregable(data, cabeceras_mapeadas):
+def _enviar_entregable(archivo, clave, download_name, mimetype, last_modified):
     """
-    Genera un string XML compatible con TestLink.
-    ¡ACTUALIZADO! Maneja pasos/resultados en líneas separadas.
+    Envía un entregable abierto (archivo del cache o buffer) con su ETag y
+    Last-Modified. El archivo se cierra al terminar la respuesta.
     """
+    archivo.seek(0, os.SEEK_END)
+    tamano = archivo.tell()
+    archivo.seek(0)
+    respuesta = send_file(
+        archivo,
+        as_attachment=True,
+        mimetype=mimetype,
+        download_name=download_name,
+        etag=clave,
+        last_modified=last_modified,
+        conditional=True,
+    )
+    if respuesta.status_code == 200:
+        respuesta.content_length = tamano
+    return _cabeceras_entregable(respuesta)
 
-    def find_key(keywords):
-        for key in cabeceras_mapeadas:
-            if any(kw in key.lower() for kw in keywords):
-                return key
-        return None
-
-    key_nombre = find_key(["nombre", "título", "titulo", "name"])
-    key_resumen = find_key(["resumen", "descripción", "descripcion", "summary"])
-    key_precondiciones = find_key(["precondicion", "precondition"])
-    key_pasos = find_key(["pasos", "steps", "ejecución", "ejecucion"])
-    key_resultados = find_key(["resultado", "results", "esperado"])
-    key_importancia = find_key(["importancia", "complejidad", "priority"])
-
-    root = ET.Element("testsuite")
-
-    for i, caso in enumerate(data, 1):
-        testcase = ET.SubElement(
-            root, "testcase", name=caso.get(key_nombre, f"Caso de Prueba {i}")
-        )
-
-        summary = ET.SubElement(testcase, "summary")
-        summary.text = caso.get(key_resumen, "N/A")
-
-        preconditions = ET.SubElement(testcase, "preconditions")
-        preconditions.text = caso.get(key_precondiciones, "N/A")
-
-        importancia_texto = caso.get(key_importancia, "media").lower()
-        if "alta" in importancia_texto:
-            importancia_num = "3"
-        elif "baja" in importancia_texto:
-            importancia_num = "1"
-        else:
-            importancia_num = "2"
-        importance = ET.SubElement(testcase, "importance")
-        importance.text = importancia_num
-
-        pasos_str = caso.get(key_pasos, "")
-        resultados_str = caso.get(key_resultados, "")
-
-        pasos_lista = str(pasos_str).split("\n") if pasos_str else ["N/A"]
-        resultados_lista = (
-            str(resultados_str).split("\n") if resultados_str else ["N/A"]
-        )
-
-        max_len = max(len(pasos_lista), len(resultados_lista))
-        pasos_lista.extend([""] * (max_len - len(pasos_lista)))
-        resultados_lista.extend([""] * (max_len - len(resultados_lista)))
-
-        steps = ET.SubElement(testcase, "steps")
-
-        for idx, (paso, resultado) in enumerate(zip(pasos_lista, resultados_lista), 1):
-            step = ET.SubElement(steps, "step")
-
-            step_number = ET.SubElement(step, "step_number")
-            step_number.text = str(idx)
-
-            actions = ET.SubElement(step, "actions")
-            actions.text = paso if paso else " "
 
-            expectedresults = ET.SubElement(step, "expectedresults")
-            expectedresults.text = resultado if resultado else " "
+def generar_xml_entregable(data, cabeceras_mapeadas):
+    """
+    Genera un string XML compatible con TestLink (para la vista previa).
+    La descarga usa el escritor en streaming directamente.
+    """
+    return "".join(iterar_xml_testlink(data, cabeceras_mapeadas))
 
-            execution_type = ET.SubElement(step, "execution_type")
-            execution_type.text = "1"
 
-    xml_str = ET.tostring(root, encoding="utf-8", method="xml")
-    dom = xml.dom.minidom.parseString(xml_str)
-    return dom.toprettyxml(indent="  ", encoding="utf-8").decode("utf-8")
+# --- Rutas Principales del Blueprint ---
 
 
-# --- Rutas Principales del Blueprint ---
+@bp.app_errorhandler(RequestEntityTooLarge)
+def archivo_demasiado_grande(error):
+    """
+    Flask rechaza las peticiones mayores que MAX_CONTENT_LENGTH antes de
+    leer el cuerpo; aquí solo convertimos el 413 en un mensaje amigable.
+    """
+    limite_mb = (current_app.config.get("MAX_CONTENT_LENGTH") or 0) // (1024 * 1024)
+    flash(f"El archivo supera el tamaño máximo permitido ({limite_mb} MB).", "danger")
+    return redirect(request.referrer or url_for("analysis.analysis_index"))
 
 
 @bp.route("/", methods=["GET", "POST"])
@@ -592,12 +664,15 @@ def generar_xml_entregable(data, cabeceras_mapeadas):
 def analysis_index():
     """
     Página principal del módulo de análisis.
-    Maneja la subida del requerimiento y muestra los resultados.
+    Maneja la subida del requerimiento (que se encola como trabajo en segundo
+    plano), muestra el progreso del trabajo y los resultados.
     """
     form = AnalysisForm()
     form.plantilla.choices = [
         (p.id, p.nombre_plantilla) for p in current_user.plantillas.all()
     ]
+    lote_form = AnalisisLoteForm()
+    lote_form.plantilla.choices = form.plantilla.choices
 
     analisis_info = None
     ai_result_data = None
@@ -605,6 +680,22 @@ def analysis_index():
     texto_requerimiento = None
     analisis_obj = None
 
+    trabajo = None
+
+    if request.method == "GET" and request.args.get("trabajo_id"):
+        trabajo = TrabajoAnalisis.query.get(request.args.get("trabajo_id"))
+        if trabajo is None or trabajo.id_usuario != current_user.id:
+            flash("No se encontró el análisis en curso.", "danger")
+            return redirect(url_for("analysis.analysis_index"))
+        if trabajo.estado == trabajos.COMPLETADO:
+            flash(trabajo.mensaje, "success")
+            return redirect(url_for("analysis.analysis_index", view_id=trabajo.id_analisis))
+        if trabajo.estado == trabajos.ERROR:
+            flash(trabajo.mensaje, "danger")
+            if trabajo.tipo == "re_analizar" and trabajo.id_analisis:
+                return redirect(url_for("analysis.analysis_index", view_id=trabajo.id_analisis))
+            return redirect(url_for("analysis.analysis_index"))
+
     if request.method == "GET":
         view_id = request.args.get("view_id")
         if view_id:
@@ -645,60 +736,60 @@ def analysis_index():
             flash("Plantilla no válida.", "danger")
             return redirect(url_for("analysis.analysis_index"))
 
-        filename = secure_filename(archivo.filename)
-        filepath = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-        archivo.save(filepath)
-
-        texto_requerimiento = leer_requerimiento(filepath)
-        os.remove(filepath)
-
-        if texto_requerimiento is None:
-            return redirect(url_for("analysis.analysis_index"))
-
-        analisis_info = analizar_complejidad_requerimiento(texto_requerimiento)
-
-        prompt = generar_prompt_dinamico(texto_requerimiento, plantilla_obj)
-        if prompt is None:
+        if plantilla_obj.mapas.first() is None:
             flash("La plantilla seleccionada no tiene columnas mapeadas.", "danger")
             return redirect(url_for("analysis.analysis_index"))
 
-        ai_result_data, ai_result_raw = llamar_api_gemini(prompt)
+        extension = os.path.splitext(archivo.filename or "")[1].lower()
+        if extension not in LECTORES_POR_EXTENSION:
+            flash("Formato de archivo no soportado.", "danger")
+            return redirect(url_for("analysis.analysis_index"))
 
-        if ai_result_data is None:
-            flash(f"Error de la IA: {ai_result_raw}", "danger")
+        if not trabajos.hay_capacidad():
+            flash("Hay demasiados análisis en cola. Inténtalo en unos minutos.", "warning")
             return redirect(url_for("analysis.analysis_index"))
 
+        # El archivo se procesa en un buffer propio de la petición (RAM o
+        # temporal anónimo); solo se hashea aquí.
         try:
-            casos_generados = len(ai_result_data)
-
-            nuevo_analisis = Analisis(
-                id_usuario=current_user.id,
-                id_plantilla=plantilla_obj.id,
-                nombre_requerimiento=archivo.filename,
-                texto_requerimiento_raw=texto_requerimiento,
-                nivel_complejidad=analisis_info["nivel"],
-                casos_generados=casos_generados,
-                criterios_detectados=analisis_info["criterios"],
-                criterios_no_funcionales=analisis_info["criterios_no_funcionales"],
-                palabras_analizadas=analisis_info["palabras"],
-                horas_diseño_estimadas=analisis_info["horas_diseño_estimadas"],
-                horas_ejecucion_estimadas=analisis_info["horas_ejecucion_estimadas"],
-                ai_result_json=ai_result_raw,
+            buffer, contenido_hash = bufferizar_subida(
+                archivo,
+                current_app.config["UPLOAD_SPOOL_MAX_SIZE"],
+                current_app.config.get("MAX_CONTENT_LENGTH"),
             )
-            db.session.add(nuevo_analisis)
-            db.session.commit()
+        except ValueError as e:
+            flash(str(e), "danger")
+            return redirect(url_for("analysis.analysis_index"))
 
-            flash(
-                f"¡Análisis completado! Se generaron {casos_generados} casos.",
-                "success",
-            )
-            return redirect(
-                url_for("analysis.analysis_index", view_id=nuevo_analisis.id)
-            )
+        # La lectura, las métricas y la IA se hacen en segundo plano.
+        # Si este mismo archivo ya se procesó, el trabajo reutiliza el texto
+        # extraído (cache direccionado por contenido); si no, el archivo
+        # espera en disco a que el trabajo lo lea.
+        trabajo = TrabajoAnalisis(
+            tipo="analizar",
+            id_usuario=current_user.id,
+            id_plantilla=plantilla_obj.id,
+            nombre_archivo=archivo.filename,
+            contenido_hash=contenido_hash,
+        )
+        with buffer:
+            cacheado = buscar_requerimiento_cacheado(contenido_hash)
+            if cacheado is not None:
+                trabajo.id_requerimiento = cacheado[0]
+                print(f"♻️ Requerimiento en cache: {contenido_hash[:12]}...")
+            db.session.add(trabajo)
+            db.session.flush()
+            if cacheado is None:
+                trabajo.ruta_archivo = os.path.join(
+                    trabajos.carpeta_trabajos(),
+                    f"{trabajo.id}_{contenido_hash[:16]}{extension}",
+                )
+                with open(trabajo.ruta_archivo, "wb") as destino:
+                    shutil.copyfileobj(buffer, destino)
 
-        except Exception as e:
-            db.session.rollback()
-            flash(f"Error al guardar en la base de datos: {e}", "danger")
+        db.session.commit()
+        trabajos.encolar_trabajo(trabajo.id)
+        return redirect(url_for("analysis.analysis_index", trabajo_id=trabajo.id))
 
     historial_analisis = current_user.analisis_historial.order_by(
         Analisis.timestamp.desc()
@@ -714,15 +805,107 @@ def analysis_index():
         texto_requerimiento=texto_requerimiento,
         analisis_obj=analisis_obj,
         historial_analisis=historial_analisis,
+        trabajo=trabajo,
+        lote_form=lote_form,
     )
 
 
+@bp.route("/lote", methods=["POST"])
+@login_required
+def analysis_lote():
+    """
+    Encola el análisis de varios requerimientos pequeños con una misma
+    plantilla. Se empaquetan varios por prompt y se crea un Analisis por
+    archivo (ver trabajos._procesar_lote).
+    """
+    form = AnalisisLoteForm()
+    form.plantilla.choices = [
+        (p.id, p.nombre_plantilla) for p in current_user.plantillas.all()
+    ]
+    if not form.validate_on_submit():
+        flash("Selecciona una plantilla válida.", "danger")
+        return redirect(url_for("analysis.analysis_index"))
+
+    archivos = [a for a in form.archivos_requerimiento.data or [] if a and a.filename]
+    if not archivos:
+        flash("Debes subir al menos un archivo.", "danger")
+        return redirect(url_for("analysis.analysis_index"))
+    max_archivos = current_app.config["ANALYSIS_BATCH_MAX_FILES"]
+    if len(archivos) > max_archivos:
+        flash(f"Un lote admite como máximo {max_archivos} archivos.", "danger")
+        return redirect(url_for("analysis.analysis_index"))
+
+    plantilla_obj = Plantilla.query.get(form.plantilla.data)
+    if not plantilla_obj or plantilla_obj.mapas.first() is None:
+        flash("La plantilla seleccionada no tiene columnas mapeadas.", "danger")
+        return redirect(url_for("analysis.analysis_index"))
+
+    no_soportados = [
+        a.filename
+        for a in archivos
+        if os.path.splitext(a.filename)[1].lower() not in LECTORES_POR_EXTENSION
+    ]
+    if no_soportados:
+        flash(f"Formato de archivo no soportado: {', '.join(no_soportados)}", "danger")
+        return redirect(url_for("analysis.analysis_index"))
+
+    if not trabajos.hay_capacidad():
+        flash("Hay demasiados análisis en cola. Inténtalo en unos minutos.", "warning")
+        return redirect(url_for("analysis.analysis_index"))
+
+    # Igual que en un análisis individual: los textos ya extraídos se
+    # reutilizan y el resto de archivos espera en disco al trabajo.
+    trabajo = TrabajoAnalisis(
+        tipo="lote",
+        id_usuario=current_user.id,
+        id_plantilla=plantilla_obj.id,
+        nombre_archivo=f"lote de {len(archivos)} archivos",
+    )
+    db.session.add(trabajo)
+    db.session.flush()
+
+    archivos_lote = []
+    try:
+        for numero, archivo in enumerate(archivos):
+            buffer, contenido_hash = bufferizar_subida(
+                archivo,
+                current_app.config["UPLOAD_SPOOL_MAX_SIZE"],
+                current_app.config.get("MAX_CONTENT_LENGTH"),
+            )
+            entrada = {"nombre": archivo.filename, "hash": contenido_hash}
+            with buffer:
+                cacheado = buscar_requerimiento_cacheado(contenido_hash)
+                if cacheado is not None:
+                    entrada["id_requerimiento"] = cacheado[0]
+                else:
+                    extension = os.path.splitext(archivo.filename)[1].lower()
+                    entrada["ruta"] = os.path.join(
+                        trabajos.carpeta_trabajos(),
+                        f"{trabajo.id}_{numero}_{contenido_hash[:16]}{extension}",
+                    )
+                    with open(entrada["ruta"], "wb") as destino:
+                        shutil.copyfileobj(buffer, destino)
+            archivos_lote.append(entrada)
+    except ValueError as e:
+        db.session.rollback()
+        for entrada in archivos_lote:
+            if entrada.get("ruta") and os.path.exists(entrada["ruta"]):
+                os.remove(entrada["ruta"])
+        flash(str(e), "danger")
+        return redirect(url_for("analysis.analysis_index"))
+
+    trabajo.archivos_lote = archivos_lote
+    db.session.commit()
+    trabajos.encolar_trabajo(trabajo.id)
+    return redirect(url_for("analysis.analysis_index", trabajo_id=trabajo.id))
+
+
 @bp.route("/re_analyze/<int:view_id>", methods=["POST"])
 @login_required
 def re_analyze(view_id):
     """
-    Toma el texto de requerimiento modificado del modal,
-    lo re-analiza y actualiza el registro en la BD.
+    Toma el texto de requerimiento modificado del modal y encola su
+    re-análisis; el registro se actualiza en segundo plano.
     """
     analisis = Analisis.query.get_or_404(view_id)
     if analisis.autor != current_user:
@@ -735,49 +918,28 @@ def re_analyze(view_id):
         flash("El texto del requerimiento no puede estar vacío.", "warning")
         return redirect(url_for("analysis.analysis_index", view_id=view_id))
 
-    plantilla_obj = analisis.plantilla_usada
-
-    # 1. Re-analizar métricas
-    analisis_info = analizar_complejidad_requerimiento(texto_requerimiento_modificado)
-
-    # 2. Re-generar prompt
-    prompt = generar_prompt_dinamico(texto_requerimiento_modificado, plantilla_obj)
-
-    # 3. Re-llamar a la IA
-    ai_result_data, ai_result_raw = llamar_api_gemini(prompt)
-
-    if ai_result_data is None:
-        flash(f"Error de la IA al re-analizar: {ai_result_raw}", "danger")
+    if not trabajos.hay_capacidad():
+        flash("Hay demasiados análisis en cola. Inténtalo en unos minutos.", "warning")
         return redirect(url_for("analysis.analysis_index", view_id=view_id))
 
-    # 4. Actualizar el registro en la BD
-    try:
-        casos_generados = len(ai_result_data)
-
-        analisis.texto_requerimiento_raw = texto_requerimiento_modificado
-        analisis.nivel_complejidad = analisis_info["nivel"]
-        analisis.casos_generados = casos_generados
-        analisis.criterios_detectados = analisis_info["criterios"]
-        analisis.criterios_no_funcionales = analisis_info["criterios_no_funcionales"]
-        analisis.palabras_analizadas = analisis_info["palabras"]
-        analisis.horas_diseño_estimadas = analisis_info["horas_diseño_estimadas"]
-        analisis.horas_ejecucion_estimadas = analisis_info["horas_ejecucion_estimadas"]
-        analisis.ai_result_json = ai_result_raw
-        # ¡IMPORTANTE! Actualizamos el timestamp
-        analisis.timestamp = db.func.now()
-
-        db.session.commit()
-
-        flash(
-            f"¡Re-análisis completado! Se generaron {casos_generados} nuevos casos.",
-            "success",
-        )
-
-    except Exception as e:
-        db.session.rollback()
-        flash(f"Error al actualizar el análisis: {e}", "danger")
+    # Las métricas y la IA se ejecutan en segundo plano.
+    # Con "regenerar" marcado se ignora el cache de respuestas de la IA; con
+    # "diferencial" solo se regeneran las secciones modificadas o nuevas.
+    trabajo = TrabajoAnalisis(
+        tipo="re_analizar",
+        id_usuario=current_user.id,
+        id_plantilla=analisis.id_plantilla,
+        id_analisis=analisis.id,
+        nombre_archivo=analisis.nombre_requerimiento,
+        texto_requerimiento=texto_requerimiento_modificado,
+        usar_cache=not request.form.get("regenerar"),
+        diferencial=bool(request.form.get("diferencial")),
+    )
+    db.session.add(trabajo)
+    db.session.commit()
+    trabajos.encolar_trabajo(trabajo.id)
 
-    return redirect(url_for("analysis.analysis_index", view_id=view_id))
+    return redirect(url_for("analysis.analysis_index", trabajo_id=trabajo.id))
 
 
 @bp.route("/delete_analysis/<int:view_id>", methods=["POST"])
@@ -792,6 +954,7 @@ def delete_analysis(view_id):
     try:
         db.session.delete(analisis)
         db.session.commit()
+        invalidar_entregables(view_id)
         flash("Análisis eliminado del historial.", "info")
     except Exception as e:
         db.session.rollback()
@@ -864,19 +1027,33 @@ def reuse_analysis(source_id, target_id):
         # 5. Fusionar datos (Casos + Texto)
         combined_data = target_data + source_data
 
+        separador = (
+            f"\n\n--- CASOS IMPORTADOS DE: {source_analysis.nombre_requerimiento} ---\n\n"
+        )
         combined_text = (
-            f"{target_analysis.texto_requerimiento_raw}\n\n"
-            f"--- CASOS IMPORTADOS DE: {source_analysis.nombre_requerimiento} ---\n\n"
+            f"{target_analysis.texto_requerimiento_raw}"
+            f"{separador}"
             f"{source_analysis.texto_requerimiento_raw}"
         )
 
         # 🔴 CORRECCIÓN #2: Recalcular métricas basándose en la FUSIÓN REAL
         # (Antes solo sumaba casos, lo que causaba incoherencia en la UI)
-        new_metrics = analizar_complejidad_requerimiento(combined_text)
+        # ¡ACTUALIZADO! Se fusionan los resúmenes guardados en lugar de volver
+        # a escanear el texto combinado (que crece con cada fusión).
+        resumen_fusion = fusionar_resumenes(
+            obtener_resumen_metricas(target_analysis),
+            resumen_desde_texto(separador),
+            obtener_resumen_metricas(source_analysis),
+        )
+        new_metrics = metricas_desde_resumen(resumen_fusion)
 
         # 6. Actualizar el análisis destino (Target)
         target_analysis.texto_requerimiento_raw = combined_text
+        target_analysis.resumen_metricas = resumen_fusion
         target_analysis.ai_result_json = json.dumps(combined_data, indent=4)
+        # El separador cambia los límites de sección: el próximo re-análisis
+        # diferencial regenera todo
+        target_analysis.mapa_secciones = None
 
         # Actualizar TODAS las métricas para coherencia en la UI
         target_analysis.casos_generados = len(combined_data)  # Conteo real
@@ -893,6 +1070,7 @@ def reuse_analysis(source_id, target_id):
 
         # 7. Guardar en la BD
         db.session.commit()
+        invalidar_entregables(target_analysis.id)
 
         flash(
             f"✅ ¡Éxito! Se importaron {len(source_data)} casos. "
@@ -909,6 +1087,113 @@ def reuse_analysis(source_id, target_id):
     return redirect(url_for("analysis.analysis_index", view_id=target_id))
 
 
+@bp.route("/analytics")
+@login_required
+def analytics():
+    """
+    Totales de horas estimadas, casos y distribución de complejidad del
+    usuario (global, por mes y por plantilla), leídos de la tabla
+    pre-agregada ResumenEstimacion.
+    """
+    return jsonify(analitica_usuario(current_user.id))
+
+
+@bp.route("/refresh_model", methods=["POST"])
+@login_required
+def refresh_model():
+    """Fuerza la re-resolución del modelo del proveedor de IA (tras cambios en la API)."""
+    try:
+        proveedor = obtener_proveedor()
+        modelo = proveedor.refrescar()
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 502
+    return jsonify({"status": "success", **proveedor.estado(), "modelo": modelo})
+
+
+@bp.route("/trabajos/<int:trabajo_id>")
+@login_required
+def estado_trabajo(trabajo_id):
+    """Estado de un trabajo de análisis (para el sondeo desde la página)."""
+    trabajo = TrabajoAnalisis.query.get(trabajo_id)
+    if trabajo is None or trabajo.id_usuario != current_user.id:
+        return jsonify({"status": "error", "message": "Trabajo no encontrado"}), 404
+
+    return jsonify(
+        {
+            "status": "success",
+            "id": trabajo.id,
+            "tipo": trabajo.tipo,
+            "estado": trabajo.estado,
+            "terminado": trabajo.terminado,
+            "mensaje": trabajo.mensaje,
+            "id_analisis": trabajo.id_analisis if trabajo.estado == trabajos.COMPLETADO else None,
+            "url_resultado": url_for("analysis.analysis_index", trabajo_id=trabajo.id),
+        }
+    )
+
+
+@bp.route("/trabajos/<int:trabajo_id>/eventos")
+@login_required
+def eventos_trabajo_sse(trabajo_id):
+    """
+    Server-Sent Events de un trabajo: cada caso en cuanto se genera y un
+    evento final con la URL del resultado. La conexión dura como máximo
+    ANALYSIS_JOB_EVENTS_MAX_SECONDS; con 0 se responde 204 y el navegador
+    consulta el estado (estado_trabajo) en su lugar.
+    """
+    trabajo = TrabajoAnalisis.query.get(trabajo_id)
+    if trabajo is None or trabajo.id_usuario != current_user.id:
+        return jsonify({"status": "error", "message": "Trabajo no encontrado"}), 404
+
+    duracion_max = current_app.config["ANALYSIS_JOB_EVENTS_MAX_SECONDS"]
+    if duracion_max <= 0:
+        return "", 204
+
+    url_resultado = url_for("analysis.analysis_index", trabajo_id=trabajo.id)
+    return Response(
+        stream_with_context(eventos_trabajo(trabajo.id, url_resultado, duracion_max)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.before_app_request
+def reanudar_trabajos_pendientes():
+    """Al primer request del proceso, re-encola los trabajos sin terminar."""
+    if trabajos.reanudacion_pendiente():
+        try:
+            trabajos.reanudar_trabajos()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ No se pudieron re-encolar los trabajos de análisis: {e}")
+
+
+@bp.route("/ia_stats")
+@login_required
+def ia_stats():
+    """Contadores de la capa de resiliencia (límites, reintentos, circuito) y modelo."""
+    return jsonify(
+        {
+            "resiliencia": obtener_resiliencia().estadisticas(),
+            "modelo": obtener_proveedor().estado(),
+            "extraccion_json": estadisticas_extraccion(),
+        }
+    )
+
+
+@bp.route("/cache_stats")
+@login_required
+def cache_stats():
+    """Devuelve los contadores de aciertos/fallos de los caches del módulo."""
+    return jsonify(
+        {
+            "extraccion": estadisticas_cache_textos(),
+            "respuestas_ia": estadisticas_cache_respuestas(),
+            "esqueletos_plantilla": estadisticas_esqueletos(),
+        }
+    )
+
+
 @bp.route("/update_results/<int:view_id>", methods=["POST"])
 @login_required
 def update_results(view_id):
@@ -938,9 +1223,13 @@ def update_results(view_id):
     try:
         # 3. Actualizar el análisis en la BD
         analisis.ai_result_json = json.dumps(new_data, indent=4)
+        if analisis.casos_generados != len(new_data):
+            # Filas añadidas o borradas: ya no se sabe qué casos son de qué sección
+            analisis.mapa_secciones = None
         analisis.casos_generados = len(new_data)  # Actualizamos el conteo
 
         db.session.commit()
+        invalidar_entregables(analisis.id)
 
         return jsonify(
             {
@@ -0,0 +1,195 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app.analysis.metricas import PATRON_CRITERIO_FUNCIONAL, PATRON_CRITERIO_NO_FUNCIONAL
+
+# --- Segmentación de Requerimientos Grandes ---
+
+# Marcador que el lector de Excel (lectura.py) antepone a cada hoja
+_RE_INICIO_HOJA = re.compile(r"^--- INICIO HOJA: .* ---$", re.MULTILINE)
+
+# Un criterio CA/CNF al inicio de una línea marca el comienzo de una sección
+_RE_INICIO_CRITERIO = re.compile(
+    rf"^[^\S\n]*(?:{PATRON_CRITERIO_FUNCIONAL}|{PATRON_CRITERIO_NO_FUNCIONAL})",
+    re.MULTILINE | re.IGNORECASE,
+)
+
+
+def _cortar_en(texto, posiciones):
+    """Corta 'texto' en las posiciones dadas (descartando trozos vacíos)."""
+    trozos = []
+    inicio = 0
+    for pos in posiciones:
+        if pos > inicio:
+            trozos.append(texto[inicio:pos])
+            inicio = pos
+    trozos.append(texto[inicio:])
+    return [t for t in trozos if t.strip()]
+
+
+def _dividir_por_tamano(texto, max_caracteres):
+    """Último recurso: corta por líneas y, si una línea no cabe, por caracteres."""
+    if max_caracteres <= 0:
+        raise ValueError(f"Presupuesto de segmento no válido: {max_caracteres} caracteres")
+    trozos = []
+    actual = ""
+    for linea in texto.splitlines(keepends=True):
+        while len(linea) > max_caracteres:
+            if actual:
+                trozos.append(actual)
+                actual = ""
+            trozos.append(linea[:max_caracteres])
+            linea = linea[max_caracteres:]
+        if len(actual) + len(linea) > max_caracteres:
+            trozos.append(actual)
+            actual = ""
+        actual += linea
+    if actual.strip():
+        trozos.append(actual)
+    return trozos
+
+
+def _empaquetar(trozos, max_caracteres, encabezado=""):
+    """
+    Une trozos consecutivos mientras quepan en el presupuesto, para no hacer
+    más llamadas de las necesarias. Si se indica 'encabezado' (la línea de la
+    hoja), se repite al inicio de cada segmento para conservar el contexto.
+    """
+    segmentos = []
+    actual = ""
+    for trozo in trozos:
+        if actual and len(actual) + len(trozo) > max_caracteres:
+            segmentos.append(actual)
+            actual = encabezado
+        actual += trozo
+    if actual.strip() and actual != encabezado:
+        segmentos.append(actual)
+    return segmentos
+
+
+def _segmentar_hoja(texto, max_caracteres):
+    """Divide una hoja (o texto sin hojas) por criterios CA/CNF y, si no basta, por tamaño."""
+    if len(texto) <= max_caracteres:
+        return [texto]
+
+    encabezado = ""
+    if _RE_INICIO_HOJA.match(texto):
+        encabezado = texto[: texto.find("\n") + 1]
+        if len(encabezado) >= max_caracteres:
+            # No cabe junto a ningún trozo: no se repite en cada segmento
+            encabezado = ""
+
+    posiciones = [m.start() for m in _RE_INICIO_CRITERIO.finditer(texto)]
+    trozos = []
+    for trozo in _cortar_en(texto, posiciones):
+        if len(trozo) > max_caracteres:
+            trozos.extend(_dividir_por_tamano(trozo, max_caracteres - len(encabezado)))
+        else:
+            trozos.append(trozo)
+
+    return _empaquetar(trozos, max_caracteres, encabezado)
+
+
+def segmentar_requerimiento(texto, max_caracteres):
+    """
+    Divide el texto de un requerimiento en segmentos de como máximo
+    'max_caracteres' (aprox.), respetando en este orden:
+      1. Los marcadores '--- INICIO HOJA: ... ---' de Excel.
+      2. Los límites entre criterios CA-XX / CNF-XX.
+      3. El presupuesto de tamaño (cortes por línea).
+    Los segmentos pequeños consecutivos se vuelven a agrupar.
+    """
+    if not max_caracteres or len(texto) <= max_caracteres:
+        return [texto]
+
+    hojas = _cortar_en(texto, [m.start() for m in _RE_INICIO_HOJA.finditer(texto)])
+
+    trozos = []
+    for hoja in hojas:
+        trozos.extend(_segmentar_hoja(hoja, max_caracteres))
+
+    return _empaquetar(trozos, max_caracteres)
+
+
+def dividir_en_secciones(texto):
+    """
+    Corta el texto en secciones: cada hoja de Excel y, dentro de ella, cada
+    criterio CA/CNF (más el preámbulo anterior al primero). Devuelve una
+    lista de (encabezado_hoja, seccion); 'encabezado_hoja' es la línea
+    '--- INICIO HOJA: ... ---' de la hoja a la que pertenece ("" si no hay).
+    """
+    posiciones = sorted(
+        {m.start() for m in _RE_INICIO_HOJA.finditer(texto)}
+        | {m.start() for m in _RE_INICIO_CRITERIO.finditer(texto)}
+    )
+    secciones = []
+    encabezado = ""
+    for seccion in _cortar_en(texto, posiciones):
+        if _RE_INICIO_HOJA.match(seccion):
+            encabezado = seccion[: seccion.find("\n") + 1] or seccion + "\n"
+        secciones.append((encabezado, seccion))
+    return secciones
+
+
+def es_criterio(seccion):
+    """True si la sección empieza por un criterio CA/CNF (no es un preámbulo)."""
+    return _RE_INICIO_CRITERIO.match(seccion) is not None
+
+
+# --- Generación Concurrente por Segmentos ---
+
+_pool_generacion = None
+_pool_generacion_lock = threading.Lock()
+
+
+def _obtener_pool_generacion():
+    """
+    Pool de hilos compartido por todo el proceso: acota el número total de
+    llamadas simultáneas a la IA aunque haya varias peticiones a la vez.
+    """
+    global _pool_generacion
+    if _pool_generacion is None:
+        with _pool_generacion_lock:
+            if _pool_generacion is None:
+                _pool_generacion = ThreadPoolExecutor(
+                    max_workers=current_app.config["LLM_FANOUT_MAX_WORKERS"],
+                    thread_name_prefix="generacion-ia",
+                )
+    return _pool_generacion
+
+
+def generar_casos_por_prompt(prompts, llamar_api):
+    """
+    Ejecuta 'llamar_api(prompt)' para cada prompt en el pool compartido.
+    La latencia total es la del prompt más lento, no la suma de todos.
+
+    Devuelve (listas, None), con la lista de casos de cada prompt en el
+    mismo orden, o (None, mensaje_error) si alguno falla.
+    """
+    app = current_app._get_current_object()
+
+    def _tarea(prompt):
+        with app.app_context():
+            return llamar_api(prompt)
+
+    futuros = [_obtener_pool_generacion().submit(_tarea, p) for p in prompts]
+
+    listas = []
+    errores = []
+    for numero, futuro in enumerate(futuros, 1):
+        try:
+            datos, respuesta = futuro.result()
+        except Exception as e:
+            datos, respuesta = None, str(e)
+
+        if datos is None:
+            errores.append(f"segmento {numero}/{len(prompts)}: {respuesta}")
+        elif isinstance(datos, list):
+            listas.append(datos)
+        else:
+            listas.append([datos])
+
+    if errores:
+        return None, "; ".join(errores)
+    return listas, None
@@ -0,0 +1,107 @@
+from xml.sax.saxutils import escape
+
+# --- Escritor XML de TestLink en Streaming ---
+#
+# Antes se construía el árbol completo (ElementTree), se serializaba, se
+# volvía a parsear con minidom y se re-serializaba con sangría: el suite
+# vivía en memoria unas tres veces. Aquí cada <testcase> se escribe como
+# texto en cuanto se procesa, con la misma sangría de dos espacios, y se
+# emite en trozos de ~TAMANO_TROZO caracteres. La memoria del escritor no
+# depende del número de casos.
+#
+# El texto sale igual que el de toprettyxml: minidom escapa también las
+# comillas dobles (&quot;) en texto y atributos, y un elemento sin texto
+# (None o "") se escribe cerrado, <summary/>.
+
+TAMANO_TROZO = 64 * 1024
+
+_CABECERA = '<?xml version="1.0" encoding="utf-8"?>\n<testsuite>\n'
+_PIE = "</testsuite>\n"
+
+# Lo que escapa minidom además de &, < y >
+_ENTIDADES = {'"': "&quot;"}
+
+
+def _buscar_clave(cabeceras_mapeadas, palabras):
+    for clave in cabeceras_mapeadas:
+        if any(palabra in clave.lower() for palabra in palabras):
+            return clave
+    return None
+
+
+def claves_testlink(cabeceras_mapeadas):
+    """Columnas mapeadas que alimentan cada campo de TestLink (o None)."""
+    return {
+        "nombre": _buscar_clave(cabeceras_mapeadas, ["nombre", "título", "titulo", "name"]),
+        "resumen": _buscar_clave(cabeceras_mapeadas, ["resumen", "descripción", "descripcion", "summary"]),
+        "precondiciones": _buscar_clave(cabeceras_mapeadas, ["precondicion", "precondition"]),
+        "pasos": _buscar_clave(cabeceras_mapeadas, ["pasos", "steps", "ejecución", "ejecucion"]),
+        "resultados": _buscar_clave(cabeceras_mapeadas, ["resultado", "results", "esperado"]),
+        "importancia": _buscar_clave(cabeceras_mapeadas, ["importancia", "complejidad", "priority"]),
+    }
+
+
+def _escapar(texto):
+    return escape(str(texto), _ENTIDADES)
+
+
+def _elemento(sangria, nombre, texto):
+    if texto is None or texto == "":
+        return f"{sangria}<{nombre}/>\n"
+    return f"{sangria}<{nombre}>{_escapar(texto)}</{nombre}>\n"
+
+
+def _importancia(texto):
+    # Escala de TestLink: 3 = alta, 2 = media, 1 = baja
+    texto = str(texto).lower()
+    if "alta" in texto:
+        return "3"
+    if "baja" in texto:
+        return "1"
+    return "2"
+
+
+def escribir_testcase(caso, numero, claves):
+    """Texto XML (con sangría) de un <testcase>."""
+    partes = [
+        f'  <testcase name="{_escapar(caso.get(claves["nombre"], f"Caso de Prueba {numero}"))}">\n',
+        _elemento("    ", "summary", caso.get(claves["resumen"], "N/A")),
+        _elemento("    ", "preconditions", caso.get(claves["precondiciones"], "N/A")),
+        _elemento("    ", "importance", _importancia(caso.get(claves["importancia"], "media"))),
+    ]
+
+    pasos_str = caso.get(claves["pasos"], "")
+    resultados_str = caso.get(claves["resultados"], "")
+    pasos = str(pasos_str).split("\n") if pasos_str else ["N/A"]
+    resultados = str(resultados_str).split("\n") if resultados_str else ["N/A"]
+    total = max(len(pasos), len(resultados))
+    pasos.extend([""] * (total - len(pasos)))
+    resultados.extend([""] * (total - len(resultados)))
+
+    partes.append("    <steps>\n")
+    for idx, (paso, resultado) in enumerate(zip(pasos, resultados), 1):
+        partes.append("      <step>\n")
+        partes.append(_elemento("        ", "step_number", idx))
+        partes.append(_elemento("        ", "actions", paso or " "))
+        partes.append(_elemento("        ", "expectedresults", resultado or " "))
+        partes.append(_elemento("        ", "execution_type", "1"))
+        partes.append("      </step>\n")
+    partes.append("    </steps>\n")
+    partes.append("  </testcase>\n")
+    return "".join(partes)
+
+
+def iterar_xml_testlink(casos, cabeceras_mapeadas, tamano_trozo=TAMANO_TROZO):
+    """Genera el XML de TestLink de 'casos' en trozos de texto."""
+    claves = claves_testlink(cabeceras_mapeadas)
+    trozo = [_CABECERA]
+    tamano = len(_CABECERA)
+    for numero, caso in enumerate(casos, 1):
+        texto = escribir_testcase(caso, numero, claves)
+        trozo.append(texto)
+        tamano += len(texto)
+        if tamano >= tamano_trozo:
+            yield "".join(trozo)
+            trozo, tamano = [], 0
+    trozo.append(_PIE)
+    yield "".join(trozo)
@@ -0,0 +1,633 @@
+import os
+import json
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from app import db
+from app.models import Analisis, Plantilla, Requerimiento, TrabajoAnalisis
+from app.analysis.lectura import iterar_requerimiento
+from app.analysis.metricas import resumen_desde_texto, metricas_desde_resumen
+from app.analysis.cache import guardar_requerimiento_cacheado
+from app.analysis.compactacion import preparar_texto_prompt, compactar_requerimiento
+from app.analysis.diferencial import mapa_completo, planificar_reanalisis
+from app.analysis.flujo import abrir_canal, cerrar_canal
+from app.analysis.entregables import invalidar_entregables
+
+# --- Trabajos de Análisis en Segundo Plano ---
+#
+# La petición solo valida, guarda un TrabajoAnalisis y lo encola; la lectura,
+# las métricas, la llamada a la IA y el guardado ocurren en un pool de hilos
+# acotado del proceso. El estado vive en la BD, así que:
+#   - cualquier worker puede responder al sondeo de estado, y
+#   - un reinicio no pierde trabajos: al primer request del proceso se vuelven
+#     a encolar los pendientes (y los 'en_proceso' abandonados).
+# Un trabajo se "reclama" con un UPDATE condicional, por lo que aunque dos
+# procesos lo encolen solo uno lo ejecuta.
+
+PENDIENTE = "pendiente"
+EN_PROCESO = "en_proceso"
+COMPLETADO = "completado"
+ERROR = "error"
+
+
+class ErrorTrabajo(Exception):
+    """Fallo esperado de un trabajo; su mensaje se muestra al usuario."""
+
+
+_pool_trabajos = None
+_pool_trabajos_lock = threading.Lock()
+_reanudados = False
+
+
+def _obtener_pool_trabajos():
+    global _pool_trabajos
+    if _pool_trabajos is None:
+        with _pool_trabajos_lock:
+            if _pool_trabajos is None:
+                _pool_trabajos = ThreadPoolExecutor(
+                    max_workers=current_app.config["ANALYSIS_JOB_MAX_WORKERS"],
+                    thread_name_prefix="trabajo-analisis",
+                )
+    return _pool_trabajos
+
+
+def carpeta_trabajos():
+    """Carpeta donde esperan los archivos subidos hasta que su trabajo los lee."""
+    carpeta = os.path.join(current_app.config["UPLOAD_FOLDER"], "trabajos")
+    os.makedirs(carpeta, exist_ok=True)
+    return carpeta
+
+
+def hay_capacidad():
+    """True si la cola admite otro trabajo (pendientes + en proceso < límite)."""
+    activos = TrabajoAnalisis.query.filter(
+        TrabajoAnalisis.estado.in_((PENDIENTE, EN_PROCESO))
+    ).count()
+    return activos < current_app.config["ANALYSIS_JOB_MAX_QUEUE"]
+
+
+def encolar_trabajo(id_trabajo):
+    """Envía el trabajo (ya confirmado en la BD) al pool del proceso."""
+    app = current_app._get_current_object()
+    _iniciar_latido(app)
+    with _pool_trabajos_lock:
+        if id_trabajo in _encolados:
+            return  # Ya espera turno en este proceso
+        _encolados.add(id_trabajo)
+    _obtener_pool_trabajos().submit(_ejecutar_trabajo, app, id_trabajo)
+
+
+def reanudacion_pendiente():
+    return not _reanudados
+
+
+# --- Propietario y latido ---
+#
+# Cada trabajo 'en_proceso' guarda qué proceso lo ejecuta ('host:pid:token';
+# el token distingue un proceso nuevo que reutiliza el pid, típico en
+# contenedores) y un latido que ese proceso renueva mientras lo ejecuta. Así
+# un trabajo largo (reintentos, backoff) nunca se re-ejecuta en paralelo, y
+# uno huérfano se recupera en cuanto se sabe que su proceso murió.
+
+_propietario_actual = {}  # pid -> 'host:pid:token'
+_en_curso = set()  # ids de trabajos que ejecuta este proceso
+_encolados = set()  # ids enviados al pool de este proceso que aún no empiezan
+_hilo_latido = None
+
+
+def _propietario():
+    pid = os.getpid()
+    if pid not in _propietario_actual:
+        _propietario_actual[pid] = f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}"
+    return _propietario_actual[pid]
+
+
+def _propietario_vivo(propietario):
+    """True/False si se puede saber (mismo host); None si es de otro host."""
+    try:
+        host, pid, _ = propietario.rsplit(":", 2)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return False
+    if host != socket.gethostname():
+        return None
+    if pid == os.getpid():
+        return propietario == _propietario()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _iniciar_latido(app):
+    """Arranca (una vez por proceso) el hilo que late y recupera huérfanos."""
+    global _hilo_latido
+    if _hilo_latido is not None and _hilo_latido.is_alive():
+        return
+    with _pool_trabajos_lock:
+        if _hilo_latido is None or not _hilo_latido.is_alive():
+            _hilo_latido = threading.Thread(
+                target=_latir, args=(app,), name="latido-trabajos", daemon=True
+            )
+            _hilo_latido.start()
+
+
+def _latir(app):
+    intervalo = app.config["ANALYSIS_JOB_HEARTBEAT_INTERVAL"]
+    while True:
+        time.sleep(intervalo)
+        with app.app_context():
+            try:
+                with _pool_trabajos_lock:
+                    ids = list(_en_curso)
+                if ids:
+                    TrabajoAnalisis.query.filter(
+                        TrabajoAnalisis.id.in_(ids),
+                        TrabajoAnalisis.propietario == _propietario(),
+                    ).update({"latido": datetime.now(timezone.utc)}, synchronize_session=False)
+                    db.session.commit()
+                _recuperar_abandonados()
+            except Exception as e:
+                db.session.rollback()
+                print(f"⚠️ Error en el latido de trabajos: {e}")
+            finally:
+                db.session.remove()
+
+
+def _borrar_subidas(trabajo):
+    """Borra los archivos subidos que el trabajo aún no había leído."""
+    rutas = [trabajo.ruta_archivo] + [a.get("ruta") for a in trabajo.archivos_lote or []]
+    for ruta in rutas:
+        if ruta and os.path.exists(ruta):
+            os.remove(ruta)
+
+
+def _recuperar_abandonados():
+    """
+    Devuelve a 'pendiente' los trabajos 'en_proceso' cuyo proceso murió o dejó
+    de latir, marca como error los que agotaron ANALYSIS_JOB_MAX_ATTEMPTS
+    (borrando sus archivos) y encola los pendientes. Devuelve cuántos encoló.
+    """
+    config = current_app.config
+    ahora = datetime.now(timezone.utc)
+    limite = (ahora - timedelta(seconds=config["ANALYSIS_JOB_STALE_AFTER"])).replace(tzinfo=None)
+
+    abandonados = []
+    for id_trabajo, propietario, latido, inicio in db.session.query(
+        TrabajoAnalisis.id,
+        TrabajoAnalisis.propietario,
+        TrabajoAnalisis.latido,
+        TrabajoAnalisis.timestamp_inicio,
+    ).filter(TrabajoAnalisis.estado == EN_PROCESO):
+        vivo = _propietario_vivo(propietario)
+        ultimo = latido or inicio
+        if ultimo is not None and ultimo.tzinfo is not None:
+            ultimo = ultimo.replace(tzinfo=None)
+        if vivo is False or (vivo is None and (ultimo is None or ultimo < limite)):
+            abandonados.append(id_trabajo)
+    if abandonados:
+        TrabajoAnalisis.query.filter(
+            TrabajoAnalisis.id.in_(abandonados), TrabajoAnalisis.estado == EN_PROCESO
+        ).update({"estado": PENDIENTE, "propietario": None}, synchronize_session=False)
+
+    agotados = TrabajoAnalisis.query.filter(
+        TrabajoAnalisis.estado == PENDIENTE,
+        TrabajoAnalisis.intentos >= config["ANALYSIS_JOB_MAX_ATTEMPTS"],
+    ).all()
+    for trabajo in agotados:
+        _borrar_subidas(trabajo)
+        trabajo.ruta_archivo = None
+        trabajo.estado = ERROR
+        trabajo.mensaje = "El análisis se interrumpió demasiadas veces. Vuelve a intentarlo."
+        trabajo.timestamp_fin = ahora
+
+    ids = [
+        id_trabajo
+        for (id_trabajo,) in db.session.query(TrabajoAnalisis.id)
+        .filter(TrabajoAnalisis.estado == PENDIENTE)
+        .order_by(TrabajoAnalisis.id)
+    ]
+    db.session.commit()
+
+    # Un pendiente puede estar ya en la cola de otro proceso: _reclamar evita
+    # que se ejecute dos veces
+    for id_trabajo in ids:
+        encolar_trabajo(id_trabajo)
+    if abandonados:
+        print(f"🔁 {len(abandonados)} trabajos abandonados re-encolados")
+    return len(ids)
+
+
+def reanudar_trabajos():
+    """
+    Al primer request del proceso: recupera los trabajos que quedaron sin
+    terminar (ver _recuperar_abandonados) y arranca el latido. Devuelve
+    cuántos se encolaron.
+    """
+    global _reanudados
+    with _pool_trabajos_lock:
+        if _reanudados:
+            return 0
+        _reanudados = True
+
+    encolados = _recuperar_abandonados()
+    _iniciar_latido(current_app._get_current_object())
+    return encolados
+
+
+def _reclamar(id_trabajo):
+    """Pasa el trabajo de 'pendiente' a 'en_proceso' de forma atómica."""
+    ahora = datetime.now(timezone.utc)
+    resultado = db.session.execute(
+        db.update(TrabajoAnalisis)
+        .where(TrabajoAnalisis.id == id_trabajo, TrabajoAnalisis.estado == PENDIENTE)
+        .values(
+            estado=EN_PROCESO,
+            intentos=TrabajoAnalisis.intentos + 1,
+            timestamp_inicio=ahora,
+            propietario=_propietario(),
+            latido=ahora,
+        )
+    )
+    db.session.commit()
+    return resultado.rowcount == 1
+
+
+def _ejecutar_trabajo(app, id_trabajo):
+    with app.app_context():
+        with _pool_trabajos_lock:
+            _encolados.discard(id_trabajo)
+        if not _reclamar(id_trabajo):
+            db.session.remove()
+            return  # Otro proceso ya lo tomó (o ya terminó)
+        with _pool_trabajos_lock:
+            _en_curso.add(id_trabajo)
+
+        try:
+
+            trabajo = db.session.get(TrabajoAnalisis, id_trabajo)
+            # Con streaming, los casos se publican en vivo mientras se generan.
+            # Un lote no genera en streaming: no abre canal.
+            al_recibir_caso = None
+            if app.config["LLM_STREAMING"] and trabajo.tipo != "lote":
+                al_recibir_caso = abrir_canal(id_trabajo).publicar
+            try:
+                if trabajo.tipo == "lote":
+                    analisis, casos_generados, creados = _procesar_lote(trabajo)
+                    omitidos = len(trabajo.archivos_lote) - creados
+                    trabajo.mensaje = (
+                        f"¡Lote completado! Se crearon {creados} análisis con "
+                        f"{casos_generados} casos."
+                        + (f" {omitidos} archivos no se pudieron leer." if omitidos else "")
+                    )
+                elif trabajo.tipo == "re_analizar":
+                    analisis, casos_generados = _procesar_re_analisis(trabajo, al_recibir_caso)
+                    trabajo.mensaje = (
+                        f"¡Re-análisis completado! Se generaron {casos_generados} nuevos casos."
+                    )
+                else:
+                    analisis, casos_generados = _procesar_analisis(trabajo, al_recibir_caso)
+                    trabajo.mensaje = (
+                        f"¡Análisis completado! Se generaron {casos_generados} casos."
+                    )
+                trabajo.id_analisis = analisis.id
+                trabajo.estado = COMPLETADO
+            except ErrorTrabajo as e:
+                db.session.rollback()
+                trabajo.estado = ERROR
+                trabajo.mensaje = str(e)
+            except Exception as e:
+                db.session.rollback()
+                traceback.print_exc()
+                trabajo.estado = ERROR
+                trabajo.mensaje = f"Error inesperado al procesar el análisis: {e}"
+
+            trabajo.timestamp_fin = datetime.now(timezone.utc)
+            db.session.commit()
+            if trabajo.tipo == "re_analizar" and trabajo.estado == COMPLETADO:
+                # Los casos cambiaron: los entregables generados ya no sirven
+                invalidar_entregables(trabajo.id_analisis)
+            print(f"🏁 Trabajo {id_trabajo} ({trabajo.tipo}): {trabajo.estado}")
+        finally:
+            with _pool_trabajos_lock:
+                _en_curso.discard(id_trabajo)
+            # Después del commit: quien escucha el canal lee el estado final en la BD
+            cerrar_canal(id_trabajo)
+            db.session.remove()
+
+
+# --- Procesamiento ---
+
+
+def _leer_archivo(ruta, nombre_archivo, contenido_hash, autor):
+    """
+    Extrae el texto de un archivo pendiente, lo registra en el cache de
+    extracción y borra el archivo. Devuelve (texto, id_requerimiento).
+    """
+    try:
+        texto = "".join(iterar_requerimiento(ruta, nombre_archivo))
+    except Exception as e:
+        raise ErrorTrabajo(f"Error al leer el archivo {nombre_archivo}: {e}")
+    finally:
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+    id_requerimiento = guardar_requerimiento_cacheado(
+        contenido_hash, texto, autor, nombre_archivo
+    )
+    return texto, id_requerimiento
+
+
+def _leer_archivo_pendiente(trabajo):
+    """
+    Extrae el texto del archivo que dejó la petición, lo registra en el cache
+    de extracción y borra el archivo. Devuelve el texto.
+    """
+    try:
+        texto, trabajo.id_requerimiento = _leer_archivo(
+            trabajo.ruta_archivo, trabajo.nombre_archivo, trabajo.contenido_hash, trabajo.autor
+        )
+    finally:
+        trabajo.ruta_archivo = None
+    # Si el worker se reinicia después de este punto, el trabajo sigue desde el texto
+    db.session.commit()
+    return texto
+
+
+def _obtener_plantilla(trabajo):
+    plantilla_obj = db.session.get(Plantilla, trabajo.id_plantilla) if trabajo.id_plantilla else None
+    if plantilla_obj is None:
+        raise ErrorTrabajo("La plantilla del análisis ya no existe.")
+    return plantilla_obj
+
+
+def _generar_casos(texto, plantilla_obj, usar_cache, al_recibir_caso):
+    """
+    Genera los casos de un requerimiento completo en grupos de secciones de
+    hasta ANALYSIS_DELTA_GROUP_CHARS (en paralelo), para que el mapa de
+    secciones permita un re-análisis diferencial desde la primera edición.
+    Devuelve (casos, json_crudo, informe_compactacion, mapa_secciones).
+    """
+    plan = planificar_reanalisis(
+        None, [], texto, current_app.config["ANALYSIS_DELTA_GROUP_CHARS"]
+    )
+    return _generar_grupos(plan, plantilla_obj, usar_cache, al_recibir_caso)
+
+
+def _generar_grupos(plan, plantilla_obj, usar_cache, al_recibir_caso):
+    """
+    Genera los grupos del plan que traen 'texto' (una lista de casos por
+    grupo) y une el resultado con los casos conservados del resto.
+    Devuelve (casos, json_crudo, informe_compactacion, mapa_secciones).
+    """
+    # Import diferido: routes importa este módulo
+    from app.analysis.routes import generar_casos_por_grupos
+
+    por_regenerar = [g for g in plan if "texto" in g]
+
+    # Cada grupo se compacta una sola vez; el informe de compactación mide
+    # solo lo que se envía a la IA
+    originales = [g["texto"] for g in por_regenerar]
+    textos = originales
+    if current_app.config["PROMPT_COMPACTION"]:
+        textos = [compactar_requerimiento(t) for t in originales]
+    _, compactacion = preparar_texto_prompt("".join(originales), compactado="\n".join(textos))
+    if por_regenerar:
+        listas, error = generar_casos_por_grupos(
+            textos,
+            plantilla_obj,
+            compactacion["max_caracteres_segmento"],
+            usar_cache=usar_cache,
+            al_recibir_caso=al_recibir_caso,
+        )
+        if listas is None:
+            raise ErrorTrabajo(f"Error de la IA: {error}")
+        for grupo, casos in zip(por_regenerar, listas):
+            grupo["casos"] = casos
+
+    casos = []
+    mapa = []
+    for grupo in plan:
+        if "texto" not in grupo and al_recibir_caso:
+            for caso in grupo["casos"]:
+                al_recibir_caso(caso)
+        casos.extend(grupo["casos"])
+        mapa.append({"huellas": grupo["huellas"], "casos": len(grupo["casos"])})
+    return casos, json.dumps(casos, indent=4), compactacion, mapa
+
+
+def _crear_analisis(
+    trabajo, plantilla_obj, nombre, id_requerimiento, texto, casos, crudo, compactacion, mapa
+):
+    """Mide el texto y guarda un Analisis nuevo con los casos generados."""
+    resumen_metricas = resumen_desde_texto(texto)
+    analisis_info = metricas_desde_resumen(resumen_metricas)
+
+    nuevo_analisis = Analisis(
+        id_usuario=trabajo.id_usuario,
+        id_plantilla=plantilla_obj.id,
+        id_requerimiento=id_requerimiento,
+        nombre_requerimiento=nombre,
+        texto_requerimiento_raw=texto,
+        nivel_complejidad=analisis_info["nivel"],
+        casos_generados=len(casos),
+        criterios_detectados=analisis_info["criterios"],
+        criterios_no_funcionales=analisis_info["criterios_no_funcionales"],
+        palabras_analizadas=analisis_info["palabras"],
+        horas_diseño_estimadas=analisis_info["horas_diseño_estimadas"],
+        horas_ejecucion_estimadas=analisis_info["horas_ejecucion_estimadas"],
+        resumen_metricas=resumen_metricas,
+        compactacion_prompt=compactacion,
+        mapa_secciones=mapa,
+        ai_result_json=crudo,
+    )
+    db.session.add(nuevo_analisis)
+    db.session.flush()
+    return nuevo_analisis
+
+
+def _procesar_analisis(trabajo, al_recibir_caso=None):
+    """Lee (si hace falta), mide, genera y guarda un Analisis nuevo."""
+    plantilla_obj = _obtener_plantilla(trabajo)
+
+    if trabajo.ruta_archivo:
+        texto_requerimiento = _leer_archivo_pendiente(trabajo)
+    else:
+        requerimiento = db.session.get(Requerimiento, trabajo.id_requerimiento)
+        if requerimiento is None:
+            raise ErrorTrabajo("No se encontró el texto del requerimiento.")
+        texto_requerimiento = requerimiento.contenido_texto
+
+    ai_result_data, ai_result_raw, compactacion, mapa = _generar_casos(
+        texto_requerimiento, plantilla_obj, trabajo.usar_cache, al_recibir_caso
+    )
+
+    nuevo_analisis = _crear_analisis(
+        trabajo,
+        plantilla_obj,
+        trabajo.nombre_archivo,
+        trabajo.id_requerimiento,
+        texto_requerimiento,
+        ai_result_data,
+        ai_result_raw,
+        compactacion,
+        mapa,
+    )
+    return nuevo_analisis, len(ai_result_data)
+
+
+def _procesar_lote(trabajo):
+    """
+    Lee los archivos del lote, genera sus casos empaquetando varios
+    requerimientos por prompt y guarda un Analisis por archivo.
+    Los archivos ilegibles se omiten (con su error en 'archivos_lote').
+    Devuelve (primer_analisis, casos_generados, analisis_creados).
+    """
+    # Import diferido: routes importa este módulo
+    from app.analysis.routes import generar_casos_lote
+
+    plantilla_obj = _obtener_plantilla(trabajo)
+    archivos = [dict(a) for a in trabajo.archivos_lote or []]
+
+    legibles = []  # (archivo, texto)
+    for archivo in archivos:
+        if archivo.get("error"):
+            continue
+        if archivo.get("ruta"):
+            try:
+                texto, archivo["id_requerimiento"] = _leer_archivo(
+                    archivo["ruta"], archivo["nombre"], archivo["hash"], trabajo.autor
+                )
+            except ErrorTrabajo as e:
+                archivo["error"] = str(e)
+                continue
+            finally:
+                archivo["ruta"] = None
+                # Si el worker se reinicia, el lote sigue desde los textos
+                trabajo.archivos_lote = [dict(a) for a in archivos]
+                db.session.commit()
+        else:
+            requerimiento = db.session.get(Requerimiento, archivo.get("id_requerimiento"))
+            if requerimiento is None:
+                archivo["error"] = "No se encontró el texto del requerimiento."
+                continue
+            texto = requerimiento.contenido_texto
+        legibles.append((archivo, texto))
+
+    if not legibles:
+        raise ErrorTrabajo("No se pudo leer ningún archivo del lote.")
+
+    # Siempre estimado: contar con el proveedor serían dos llamadas a la API
+    # por archivo, más que las que ahorra empaquetar varios por prompt
+    preparados = [preparar_texto_prompt(texto, exacto=False) for _, texto in legibles]
+    requerimientos = [
+        (archivo["nombre"], texto_prompt)
+        for (archivo, _), (texto_prompt, _) in zip(legibles, preparados)
+    ]
+    listas, error = generar_casos_lote(
+        requerimientos,
+        plantilla_obj,
+        min(informe["max_caracteres_segmento"] for _, informe in preparados),
+        usar_cache=trabajo.usar_cache,
+    )
+    if listas is None:
+        raise ErrorTrabajo(f"Error de la IA: {error}")
+
+    creados = []
+    for (archivo, texto), (_, compactacion), casos in zip(legibles, preparados, listas):
+        analisis = _crear_analisis(
+            trabajo,
+            plantilla_obj,
+            archivo["nombre"],
+            archivo.get("id_requerimiento"),
+            texto,
+            casos,
+            json.dumps(casos, indent=4),
+            compactacion,
+            # Sus casos salieron de un prompt de lote: un único grupo
+            mapa_completo(texto, len(casos)),
+        )
+        archivo["id_analisis"] = analisis.id
+        creados.append(analisis)
+
+    trabajo.archivos_lote = archivos
+    return creados[0], sum(a.casos_generados for a in creados), len(creados)
+
+
+def _generar_casos_diferencial(analisis, texto, plantilla_obj, usar_cache, al_recibir_caso):
+    """
+    Regenera solo los grupos de secciones modificados o nuevos y conserva
+    los casos del resto (ver app/analysis/diferencial.py).
+    Devuelve (casos, json_crudo, informe_compactacion, mapa_secciones).
+    """
+    casos_anteriores = json.loads(analisis.ai_result_json or "[]")
+    plan = planificar_reanalisis(
+        analisis.mapa_secciones,
+        casos_anteriores,
+        texto,
+        current_app.config["ANALYSIS_DELTA_GROUP_CHARS"],
+    )
+    regenerados = sum(1 for g in plan if "texto" in g)
+    conservados = sum(len(g["casos"]) for g in plan if "texto" not in g)
+
+    resultado = _generar_grupos(plan, plantilla_obj, usar_cache, al_recibir_caso)
+    print(
+        f"🔀 Re-análisis diferencial: {regenerados}/{len(plan)} grupos regenerados, "
+        f"{conservados} casos conservados"
+    )
+    return resultado
+
+
+def _procesar_re_analisis(trabajo, al_recibir_caso=None):
+    """
+    Re-mide y re-genera un Analisis existente con el texto editado.
+    En modo diferencial solo se regeneran las secciones que cambiaron.
+    """
+    analisis = db.session.get(Analisis, trabajo.id_analisis) if trabajo.id_analisis else None
+    if analisis is None:
+        raise ErrorTrabajo("El análisis a re-analizar ya no existe.")
+    plantilla_obj = _obtener_plantilla(trabajo)
+    texto_requerimiento_modificado = trabajo.texto_requerimiento
+
+    resumen_metricas = resumen_desde_texto(texto_requerimiento_modificado)
+    analisis_info = metricas_desde_resumen(resumen_metricas)
+
+    if trabajo.diferencial:
+        ai_result_data, ai_result_raw, compactacion, mapa = _generar_casos_diferencial(
+            analisis,
+            texto_requerimiento_modificado,
+            plantilla_obj,
+            trabajo.usar_cache,
+            al_recibir_caso,
+        )
+    else:
+        ai_result_data, ai_result_raw, compactacion, mapa = _generar_casos(
+            texto_requerimiento_modificado, plantilla_obj, trabajo.usar_cache, al_recibir_caso
+        )
+
+    casos_generados = len(ai_result_data)
+    analisis.texto_requerimiento_raw = texto_requerimiento_modificado
+    analisis.nivel_complejidad = analisis_info["nivel"]
+    analisis.casos_generados = casos_generados
+    analisis.criterios_detectados = analisis_info["criterios"]
+    analisis.criterios_no_funcionales = analisis_info["criterios_no_funcionales"]
+    analisis.palabras_analizadas = analisis_info["palabras"]
+    analisis.horas_diseño_estimadas = analisis_info["horas_diseño_estimadas"]
+    analisis.horas_ejecucion_estimadas = analisis_info["horas_ejecucion_estimadas"]
+    analisis.resumen_metricas = resumen_metricas
+    analisis.compactacion_prompt = compactacion
+    analisis.mapa_secciones = mapa
+    analisis.ai_result_json = ai_result_raw
+    # ¡IMPORTANTE! Actualizamos el timestamp
+    # (en Python y no con db.func.now(): el resumen de estimaciones
+    # necesita conocer el mes del análisis al hacer el flush)
+    analisis.timestamp = datetime.now(timezone.utc)
+    return analisis, casos_generados
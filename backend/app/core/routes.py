@@ -8,6 +8,8 @@ import openpyxl
 from openpyxl.utils import get_column_letter
 from werkzeug.utils import secure_filename
 from app.models import Plantilla, MapaPlantilla
+from app.analysis.esqueletos import construir_esqueleto, invalidar_esqueleto
+from app.analysis.entregables import invalidar_entregables_plantilla
 
 # Imports de Formularios (sin cambios)
 from app.core.forms import (
@@ -86,6 +88,8 @@ def delete_plantilla(plantilla_id):
         path_archivo = os.path.join(current_app.config['UPLOAD_FOLDER'], plantilla.filename_seguro)
         if os.path.exists(path_archivo):
             os.remove(path_archivo)
+        invalidar_esqueleto(plantilla.id)
+        invalidar_entregables_plantilla(plantilla)
             
         db.session.delete(plantilla)
         db.session.commit()
@@ -146,6 +150,8 @@ def map_step_1_sheet(plantilla_id):
     if form.validate_on_submit():
         plantilla.sheet_name = form.sheet_name.data
         db.session.commit()
+        invalidar_esqueleto(plantilla.id)
+        invalidar_entregables_plantilla(plantilla)
         return redirect(url_for('core.map_step_2_row', plantilla_id=plantilla.id))
         
     return render_template(
@@ -214,6 +220,8 @@ def map_step_2_row(plantilla_id):
     if form.validate_on_submit():
         plantilla.header_row = form.header_row.data
         db.session.commit()
+        invalidar_esqueleto(plantilla.id)
+        invalidar_entregables_plantilla(plantilla)
         return redirect(url_for('core.map_step_3_columns', plantilla_id=plantilla.id))
 
     return render_template(
@@ -282,6 +290,15 @@ def map_step_3_columns(plantilla_id):
             db.session.add(nuevo_mapa)
             
         db.session.commit()
+        invalidar_entregables_plantilla(plantilla)
+
+        # Pre-procesar la plantilla una sola vez para las exportaciones
+        try:
+            construir_esqueleto(plantilla)
+        except Exception as e:
+            # No es fatal: se reintenta en la primera exportación
+            invalidar_esqueleto(plantilla.id)
+            print(f"⚠️ No se pudo generar el esqueleto de la plantilla {plantilla.id}: {e}")
         
         flash("¡Mapeo completado y guardado exitosamente!", "success")
         return redirect(url_for('core.ver_plantilla', plantilla_id=plantilla.id))
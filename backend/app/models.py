@@ -77,10 +77,19 @@ class Requerimiento(db.Model):
     # Relaciones
     analisis_relacionados = db.relationship('Analisis', backref='requerimiento_base', lazy='dynamic')
     
+    @staticmethod
+    def nuevo_hasher():
+        """Devuelve un hasher SHA-256 vacío para calcular el hash por bloques"""
+        return hashlib.sha256()
+
     @staticmethod
     def calcular_hash(texto):
-        """Calcula el hash SHA-256 de un texto"""
-        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+        """Calcula el hash SHA-256 de un texto (o de bytes crudos)"""
+        if isinstance(texto, str):
+            texto = texto.encode('utf-8')
+        hasher = Requerimiento.nuevo_hasher()
+        hasher.update(texto)
+        return hasher.hexdigest()
     
     def __repr__(self):
         return f'<Requerimiento #{self.id} - Hash: {self.contenido_hash[:8]}...>'
@@ -118,6 +127,18 @@ class Analisis(db.Model):
     criterios_no_funcionales = db.Column(db.Integer, default=0)
     horas_diseño_estimadas = db.Column(db.Float, default=0)
     horas_ejecucion_estimadas = db.Column(db.Float, default=0)
+
+    # Resumen fusionable de las métricas: {palabras, ca: [[prefijo, num]], cnf: [...]}
+    # Permite recalcular las métricas de una fusión sin volver a escanear el texto.
+    resumen_metricas = db.Column(db.JSON, nullable=True)
+
+    # Tamaños del texto enviado a la IA antes y después de compactarlo:
+    # {caracteres_antes, caracteres_despues, tokens_antes, tokens_despues, ...}
+    compactacion_prompt = db.Column(db.JSON, nullable=True)
+
+    # Qué casos salieron de qué secciones del requerimiento (re-análisis
+    # diferencial): [{huellas: [...], casos: n}], ver app/analysis/diferencial.py
+    mapa_secciones = db.Column(db.JSON, nullable=True)
     
     # Resultado de la IA
     ai_result_json = db.Column(db.Text)
@@ -223,4 +244,107 @@ class AnalisisTag(db.Model):
     )
     
     def __repr__(self):
-        return f'<Tag "{self.tag}" - Analisis {self.analisis_id}>'
\ No newline at end of file
+        return f'<Tag "{self.tag}" - Analisis {self.analisis_id}>'
+
+
+# 🆕 NUEVA TABLA: Totales pre-agregados para la analítica de estimaciones
+class ResumenEstimacion(db.Model):
+    """
+    Totales de Analisis por usuario, plantilla, mes y nivel de complejidad.
+    Se mantiene de forma incremental con eventos de inserción/actualización/
+    borrado de Analisis (ver app/analysis/analitica.py), así los dashboards
+    leen unas pocas filas en lugar de recorrer todo el historial.
+    """
+    __tablename__ = 'resumen_estimacion'
+
+    id = db.Column(db.Integer, primary_key=True)
+    id_usuario = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False, index=True)
+    id_plantilla = db.Column(db.Integer, db.ForeignKey('plantilla.id'), nullable=False)
+    periodo = db.Column(db.String(7), nullable=False, index=True)  # "AAAA-MM"
+    nivel_complejidad = db.Column(db.String(100), nullable=False)
+
+    total_analisis = db.Column(db.Integer, nullable=False, default=0)
+    total_casos = db.Column(db.Integer, nullable=False, default=0)
+    total_horas_diseño = db.Column(db.Float, nullable=False, default=0)
+    total_horas_ejecucion = db.Column(db.Float, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('id_usuario', 'id_plantilla', 'periodo', 'nivel_complejidad',
+                            name='_resumen_estimacion_uc'),
+    )
+
+    def __repr__(self):
+        return f'<ResumenEstimacion {self.periodo} U{self.id_usuario} P{self.id_plantilla} {self.nivel_complejidad}>'
+
+
+# 🆕 NUEVA TABLA: Cache persistente de respuestas de la IA
+class RespuestaIACache(db.Model):
+    """
+    Respuestas de la IA indexadas por la huella (SHA-256) del prompt final,
+    el modelo y la configuración de generación. Evita pagar de nuevo una
+    generación idéntica. Nivel persistente del cache de app/analysis/cache.py.
+    """
+    __tablename__ = 'respuesta_ia_cache'
+
+    id = db.Column(db.Integer, primary_key=True)
+    clave_hash = db.Column(db.String(64), unique=True, index=True, nullable=False)
+    modelo = db.Column(db.String(100))
+    respuesta_texto = db.Column(db.Text, nullable=False)
+    timestamp_creacion = db.Column(db.DateTime, index=True, default=lambda: datetime.now(timezone.utc))
+    ultimo_acceso = db.Column(db.DateTime, index=True, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<RespuestaIACache {self.clave_hash[:8]}... ({self.modelo})>'
+
+
+# 🆕 NUEVA TABLA: Trabajos de análisis en segundo plano
+class TrabajoAnalisis(db.Model):
+    """
+    Análisis (o re-análisis) encolado para ejecutarse fuera de la petición.
+    Guarda todo lo necesario para procesarlo, así un reinicio del worker no
+    pierde el trabajo: los pendientes se vuelven a encolar al arrancar
+    (ver app/analysis/trabajos.py).
+    Estados: 'pendiente', 'en_proceso', 'completado', 'error'.
+    """
+    __tablename__ = 'trabajo_analisis'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)  # 'analizar' | 're_analizar' | 'lote'
+    estado = db.Column(db.String(20), nullable=False, default='pendiente', index=True)
+
+    id_usuario = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False, index=True)
+    id_plantilla = db.Column(db.Integer, db.ForeignKey('plantilla.id', ondelete='SET NULL'), nullable=True)
+    id_requerimiento = db.Column(db.Integer, db.ForeignKey('requerimiento.id'), nullable=True)
+    # Destino en un re-análisis; resultado cuando un análisis nuevo termina
+    id_analisis = db.Column(db.Integer, db.ForeignKey('analisis.id', ondelete='SET NULL'), nullable=True)
+
+    # Entrada: archivo pendiente de leer (sin cache) o texto ya disponible
+    nombre_archivo = db.Column(db.String(255))
+    contenido_hash = db.Column(db.String(64))
+    ruta_archivo = db.Column(db.String(500))
+    texto_requerimiento = db.Column(db.Text)
+    usar_cache = db.Column(db.Boolean, nullable=False, default=True)
+    # Re-análisis: regenerar solo las secciones modificadas o nuevas
+    diferencial = db.Column(db.Boolean, nullable=False, default=False)
+    # Lote: un elemento por archivo {nombre, hash, ruta, id_requerimiento,
+    # id_analisis, error}; ver trabajos._procesar_lote
+    archivos_lote = db.Column(db.JSON, nullable=True)
+
+    mensaje = db.Column(db.Text)  # Resultado o error legible para el usuario
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    timestamp_creacion = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    timestamp_inicio = db.Column(db.DateTime)
+    timestamp_fin = db.Column(db.DateTime)
+    # Proceso que lo ejecuta ('host:pid:token') y su último latido; un trabajo
+    # 'en_proceso' solo se re-encola si su proceso murió o dejó de latir
+    propietario = db.Column(db.String(120))
+    latido = db.Column(db.DateTime)
+
+    autor = db.relationship('Usuario')
+
+    @property
+    def terminado(self):
+        return self.estado in ('completado', 'error')
+
+    def __repr__(self):
+        return f'<TrabajoAnalisis {self.id} {self.tipo} ({self.estado})>'
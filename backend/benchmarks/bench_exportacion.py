@@ -0,0 +1,192 @@
+"""
+Benchmark: exportación a Excel anterior (Alignment nuevo y comprobaciones por
+celda) contra el motor de app/analysis/exportacion.py (plan por columnas y
+estilo compartido). Comprueba además que ambos escriben los mismos valores.
+
+Uso (desde la carpeta 'backend/'):
+    python benchmarks/bench_exportacion.py --casos 2000 --pasos 10
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import openpyxl
+from openpyxl.comments import Comment
+from openpyxl.styles import Alignment
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.analysis.exportacion import exportar_casos_excel  # noqa: E402
+
+COLUMNAS = [
+    ("A", "ID"),
+    ("B", "Nombre del Caso"),
+    ("C", "Precondiciones"),
+    ("D", "Pasos"),
+    ("E", "Resultado Esperado"),
+    ("F", "Importancia"),
+    ("G", "Complejidad"),
+    ("H", "Tipo de Prueba"),
+]
+
+
+def _traducir_complejidad_a_numero(valor_texto):
+    if isinstance(valor_texto, str):
+        valor_lower = valor_texto.strip().lower()
+        if valor_lower == "alta":
+            return 1
+        elif valor_lower == "media":
+            return 2
+        elif valor_lower == "baja":
+            return 3
+    return valor_texto
+
+
+def exportar_anterior(ws, data, mapas, fila_actual, desglosar_pasos):
+    """Copia fiel del bucle original de generar_excel_entregable."""
+    cabeceras_mapeadas = [mapa.etiqueta for mapa in mapas]
+    col_indices = {
+        mapa.etiqueta: openpyxl.utils.column_index_from_string(mapa.coordenada)
+        for mapa in mapas
+    }
+    etiqueta_pasos = next((c for c in cabeceras_mapeadas if "paso" in c.lower()), None)
+    etiqueta_resultados = next(
+        (c for c in cabeceras_mapeadas if "resultado" in c.lower()), None
+    )
+    if desglosar_pasos:
+        for fila_data in data:
+            pasos = str(fila_data.get(etiqueta_pasos, "")).split("\n")
+            resultados = str(fila_data.get(etiqueta_resultados, "")).split("\n")
+            max_len = max(len(pasos), len(resultados))
+            pasos.extend([""] * (max_len - len(pasos)))
+            resultados.extend([""] * (max_len - len(resultados)))
+            for i in range(max_len):
+                for col_name, col_idx in col_indices.items():
+                    celda = ws.cell(row=fila_actual, column=col_idx)
+                    if col_name == etiqueta_pasos:
+                        valor = pasos[i]
+                    elif col_name == etiqueta_resultados:
+                        valor = resultados[i]
+                    elif i == 0:
+                        valor = fila_data.get(col_name, "")
+                        if (
+                            "importancia" in col_name.lower()
+                            or "complejidad" in col_name.lower()
+                        ):
+                            valor = _traducir_complejidad_a_numero(valor)
+                    else:
+                        valor = ""
+                    celda.value = valor
+                    celda.alignment = Alignment(wrap_text=True, vertical="top")
+                    import_source = fila_data.get("__import_source")
+                    if import_source and col_idx == 1:
+                        if i == 0:
+                            celda.comment = Comment(import_source, "Q-Vision")
+                fila_actual += 1
+    else:
+        for fila in data:
+            for cabecera_actual in cabeceras_mapeadas:
+                col_idx = col_indices[cabecera_actual]
+                celda = ws.cell(row=fila_actual, column=col_idx)
+                valor = fila.get(cabecera_actual, "")
+                if (
+                    "importancia" in cabecera_actual.lower()
+                    or "complejidad" in cabecera_actual.lower()
+                ):
+                    valor = _traducir_complejidad_a_numero(valor)
+                if isinstance(valor, list):
+                    valor = "\n".join(map(str, valor))
+                celda.value = valor
+                celda.alignment = Alignment(wrap_text=True, vertical="top")
+                import_source = fila.get("__import_source")
+                if import_source and col_idx == 1:
+                    celda.comment = Comment(import_source, "Q-Vision")
+            fila_actual += 1
+
+
+def exportar_motor(ws, data, mapas, fila_actual, desglosar_pasos):
+    exportar_casos_excel(ws, data, mapas, fila_actual, desglosar_pasos)
+
+
+def crear_casos(casos, pasos):
+    niveles = ["Alta", "Media", "Baja"]
+    return [
+        {
+            "ID": f"CP-{c + 1:05d}",
+            "Nombre del Caso": f"Validar escenario {c + 1} del requerimiento",
+            "Precondiciones": "Usuario autenticado con permisos de edición",
+            "Pasos": "\n".join(f"{p + 1}. Acción {p + 1} del caso {c + 1}" for p in range(pasos)),
+            "Resultado Esperado": "\n".join(
+                f"{p + 1}. El sistema responde al paso {p + 1}" for p in range(pasos)
+            ),
+            "Importancia": niveles[c % 3],
+            "Complejidad": niveles[(c + 1) % 3],
+            "Tipo de Prueba": "Funcional",
+            **({"__import_source": "Importado de REQ-001"} if c % 10 == 0 else {}),
+        }
+        for c in range(casos)
+    ]
+
+
+def nueva_hoja():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for letra, etiqueta in COLUMNAS:
+        ws[f"{letra}1"] = etiqueta
+    return wb, ws
+
+
+def medir(nombre, funcion, data, mapas, desglosar):
+    # La latencia se mide sin tracemalloc, que ralentiza mucho la asignación
+    wb, ws = nueva_hoja()
+    inicio = time.perf_counter()
+    funcion(ws, data, mapas, 2, desglosar)
+    duracion = time.perf_counter() - inicio
+    filas = ws.max_row - 1
+
+    tracemalloc.start()
+    _, ws_pico = nueva_hoja()
+    funcion(ws_pico, data, mapas, 2, desglosar)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{nombre:<10} {duracion:8.2f} s   {filas / duracion:10,.0f} filas/s   "
+        f"pico {pico / 1024 / 1024:8.1f} MiB"
+    )
+    return ws
+
+
+def valores(ws):
+    # El motor no crea celdas nuevas vacías: solo se comparan las que tienen valor
+    return [
+        (c.coordinate, c.value, c.comment.text if c.comment else None, c.alignment.wrap_text)
+        for fila in ws.iter_rows()
+        for c in fila
+        if c.value not in (None, "")
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--casos", type=int, default=2000)
+    parser.add_argument("--pasos", type=int, default=10)
+    parser.add_argument("--sin-desglose", action="store_true")
+    args = parser.parse_args()
+
+    desglosar = not args.sin_desglose
+    data = crear_casos(args.casos, args.pasos)
+    mapas = [SimpleNamespace(coordenada=c, etiqueta=e) for c, e in COLUMNAS]
+    print(
+        f"Entregable: {args.casos} casos x {args.pasos} pasos "
+        f"({'desglosado' if desglosar else 'una fila por caso'})"
+    )
+    ws_anterior = medir("anterior", exportar_anterior, data, mapas, desglosar)
+    ws_motor = medir("motor", exportar_motor, data, mapas, desglosar)
+    print("Mismo contenido:", "sí" if valores(ws_anterior) == valores(ws_motor) else "NO")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark: lector de Word anterior (python-docx, solo doc.paragraphs y +=)
+contra el extractor incremental de word/document.xml de app/analysis/lectura.py.
+
+Uso (desde la carpeta 'backend/'):
+    python benchmarks/bench_lectura_docx.py --secciones 300
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import docx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.analysis.lectura import iterar_texto_docx  # noqa: E402
+
+
+def lector_anterior(filepath):
+    """Copia fiel del lector original (Document completo, solo párrafos)."""
+    texto_completo = ""
+    doc = docx.Document(filepath)
+    for para in doc.paragraphs:
+        texto_completo += para.text + "\n"
+    texto = texto_completo.strip()
+    return len(texto), texto.count("CA-")
+
+
+def lector_streaming(filepath):
+    texto = "".join(iterar_texto_docx(filepath)).strip()
+    return len(texto), texto.count("CA-")
+
+
+def solo_iterar(filepath):
+    """Consume los fragmentos sin acumularlos: mide la memoria del extractor."""
+    caracteres = 0
+    criterios = 0
+    for fragmento in iterar_texto_docx(filepath):
+        caracteres += len(fragmento)
+        criterios += fragmento.count("CA-")
+    return caracteres, criterios
+
+
+def crear_documento(path, secciones):
+    """Cada sección equivale aprox. a una página: texto + tabla de criterios."""
+    doc = docx.Document()
+    for s in range(secciones):
+        doc.add_heading(f"Historia de usuario {s + 1}", level=2)
+        for p in range(8):
+            doc.add_paragraph(
+                f"Como analista quiero registrar la operación {s}-{p} para que "
+                "el sistema valide los datos de entrada y notifique al usuario."
+            )
+        tabla = doc.add_table(rows=5, cols=3)
+        for f, fila in enumerate(tabla.rows):
+            fila.cells[0].text = f"CA-{f + 1:02d}"
+            fila.cells[1].text = f"Dado un usuario autenticado en la sección {s}"
+            fila.cells[2].text = "Entonces el sistema muestra el mensaje esperado"
+    doc.save(path)
+
+
+def medir(nombre, funcion, filepath):
+    inicio = time.perf_counter()
+    caracteres, criterios = funcion(filepath)
+    duracion = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    funcion(filepath)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{nombre:<12} {duracion:8.2f} s   pico {pico / 1024 / 1024:8.1f} MiB   "
+        f"{caracteres / 1024:8.0f} KiB de texto   "
+        f"{criterios} criterios en tablas"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--secciones", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "requerimiento.docx")
+        crear_documento(path, args.secciones)
+        print(
+            f"Documento: {args.secciones} secciones "
+            f"({os.path.getsize(path) / 1024 / 1024:.1f} MiB)"
+        )
+        medir("anterior", lector_anterior, path)
+        medir("streaming", lector_streaming, path)
+        medir("solo iterar", solo_iterar, path)
+
+
+if __name__ == "__main__":
+    main()
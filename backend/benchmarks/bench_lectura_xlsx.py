@@ -0,0 +1,90 @@
+"""
+Benchmark: lector de Excel anterior (DOM completo + texto +=) contra el
+lector en streaming de app/analysis/lectura.py.
+
+Uso (desde la carpeta 'backend/'):
+    python benchmarks/bench_lectura_xlsx.py --hojas 40 --filas 1250 --columnas 12
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import openpyxl
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.analysis.lectura import iterar_texto_xlsx  # noqa: E402
+
+
+def lector_anterior(filepath):
+    """Copia fiel del lector original (load_workbook completo y +=)."""
+    texto_completo = ""
+    workbook = openpyxl.load_workbook(filepath, data_only=True)
+    for sheet_name in workbook.sheetnames:
+        sheet = workbook[sheet_name]
+        texto_completo += f"\n--- INICIO HOJA: {sheet_name} ---\n"
+        for row in sheet.iter_rows():
+            if all(cell.value is None for cell in row):
+                continue
+            fila_texto = [
+                str(cell.value) if cell.value is not None else "" for cell in row
+            ]
+            texto_completo += " | ".join(fila_texto) + "\n"
+    return texto_completo.strip()
+
+
+def lector_streaming(filepath):
+    return "".join(iterar_texto_xlsx(filepath)).strip()
+
+
+def crear_libro(path, hojas, filas, columnas):
+    wb = openpyxl.Workbook(write_only=True)
+    for h in range(hojas):
+        ws = wb.create_sheet(f"Hoja{h + 1}")
+        for f in range(filas):
+            # La última columna queda vacía en la mitad de las filas
+            fila = [f"CA-{f % 99:02d} valor {h}-{f}-{c}" for c in range(columnas - 1)]
+            fila.append(None if f % 2 else "Observación")
+            ws.append(fila)
+    wb.save(path)
+
+
+def medir(nombre, funcion, filepath):
+    # La latencia se mide sin tracemalloc, que ralentiza mucho la asignación
+    inicio = time.perf_counter()
+    texto = funcion(filepath)
+    duracion = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    funcion(filepath)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{nombre:<12} {duracion:8.2f} s   pico {pico / 1024 / 1024:8.1f} MiB   "
+        f"{len(texto) / 1024 / 1024:6.1f} MiB de texto"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hojas", type=int, default=10)
+    parser.add_argument("--filas", type=int, default=1000)
+    parser.add_argument("--columnas", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "requerimiento.xlsx")
+        crear_libro(path, args.hojas, args.filas, args.columnas)
+        print(
+            f"Libro: {args.hojas} hojas x {args.filas} filas x {args.columnas} columnas "
+            f"({os.path.getsize(path) / 1024 / 1024:.1f} MiB)"
+        )
+        medir("anterior", lector_anterior, path)
+        medir("streaming", lector_streaming, path)
+
+
+if __name__ == "__main__":
+    main()
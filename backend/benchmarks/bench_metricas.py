@@ -0,0 +1,95 @@
+"""
+Benchmark: analizar_complejidad_requerimiento anterior (dos re.findall sin
+compilar + PERT_LOOKUP por llamada) contra el motor de app/analysis/metricas.py.
+
+Uso (desde la carpeta 'backend/'):
+    python benchmarks/bench_metricas.py --mb 5 --lote 5000 --procesos 4
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.analysis.metricas import calcular_metricas, calcular_metricas_lote  # noqa: E402
+
+VOCABULARIO = (
+    "el sistema debe validar los datos de entrada del usuario y notificar "
+    "cuando la operación sea rechazada por el servicio CA-{n} CNF-{n} "
+    "Criterio de Aceptación {n} C.A. {n}"
+).split()
+
+
+def metricas_anteriores(texto):
+    """Copia fiel de la versión original (sin el cálculo de casos/horas)."""
+    palabras = texto.split()
+    conteo_palabras = len(palabras)
+    criterios_funcionales = re.findall(
+        r"\b(CA|C\.A\.|\bCriterio de Aceptaci[oó]n)[\s\-]?[—_]?(\d{1,3})\b",
+        texto,
+        re.IGNORECASE,
+    )
+    criterios_no_funcionales = re.findall(
+        r"\b(CNF|C\.N\.F\.|Requerimiento No Funcional)[\s\-]?[—_]?(\d{1,3})\b",
+        texto,
+        re.IGNORECASE,
+    )
+    PERT_LOOKUP = {
+        "Baja": {"To": 0.1, "Tm": 0.25, "Tp": 0.5},
+        "Media": {"To": 0.25, "Tm": 0.5, "Tp": 1.0},
+        "Alta": {"To": 0.5, "Tm": 0.75, "Tp": 1.5},
+    }
+    return conteo_palabras, len(set(criterios_funcionales)), len(set(criterios_no_funcionales)), PERT_LOOKUP
+
+
+def generar_texto(caracteres, semilla=1):
+    rnd = random.Random(semilla)
+    partes = []
+    total = 0
+    while total < caracteres:
+        palabra = rnd.choice(VOCABULARIO).format(n=rnd.randint(1, 200))
+        partes.append(palabra)
+        total += len(palabra) + 1
+    return " ".join(partes)
+
+
+def cronometrar(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mb", type=float, default=5)
+    parser.add_argument("--lote", type=int, default=5000)
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    texto = generar_texto(int(args.mb * 1024 * 1024))
+    mb = len(texto) / 1024 / 1024
+
+    anterior, t_anterior = cronometrar(metricas_anteriores, texto)
+    nuevo, t_nuevo = cronometrar(calcular_metricas, texto)
+    assert anterior[:3] == (nuevo["palabras"], nuevo["criterios"], nuevo["criterios_no_funcionales"])
+
+    print(f"Texto único de {mb:.1f} MiB")
+    print(f"  anterior  {t_anterior:6.2f} s   {mb / t_anterior:6.1f} MiB/s")
+    print(f"  motor     {t_nuevo:6.2f} s   {mb / t_nuevo:6.1f} MiB/s")
+
+    textos = [generar_texto(2000, semilla=i) for i in range(args.lote)]
+    _, t_lote_anterior = cronometrar(lambda: [metricas_anteriores(t) for t in textos])
+    _, t_lote = cronometrar(calcular_metricas_lote, textos)
+    _, t_lote_proc = cronometrar(calcular_metricas_lote, textos, args.procesos)
+
+    print(f"Lote de {args.lote} textos de ~2 KB")
+    print(f"  anterior              {args.lote / t_lote_anterior:10.0f} textos/s")
+    print(f"  motor (1 proceso)     {args.lote / t_lote:10.0f} textos/s")
+    print(f"  motor ({args.procesos} procesos)    {args.lote / t_lote_proc:10.0f} textos/s")
+
+
+if __name__ == "__main__":
+    main()
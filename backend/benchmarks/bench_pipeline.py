@@ -0,0 +1,127 @@
+"""
+Benchmark de carga del pipeline completo de análisis (subida -> trabajo en
+segundo plano -> lectura -> métricas -> IA -> guardado) sin red, con el
+proveedor de IA local determinista (LLM_PROVIDER='local').
+
+Usa una BD SQLite temporal y el cliente de pruebas de Flask; cada análisis
+sube un requerimiento distinto para no caer en los caches.
+
+Uso (desde la carpeta 'backend/'):
+    python benchmarks/bench_pipeline.py --analisis 50 --latencia-ms 200 --trabajadores 4
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from config import Config  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import Usuario, Plantilla, MapaPlantilla, TrabajoAnalisis  # noqa: E402
+
+COLUMNAS = ["ID", "Nombre", "Pasos", "Resultado Esperado", "Importancia"]
+
+
+def crear_app(args, carpeta):
+    class ConfigBenchmark(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(carpeta, 'bench.db')}"
+        WTF_CSRF_ENABLED = False
+        UPLOAD_FOLDER = carpeta
+        LLM_PROVIDER = "local"
+        LOCAL_LLM_LATENCY_MS = args.latencia_ms
+        LOCAL_LLM_CASES = args.casos
+        ANALYSIS_JOB_MAX_WORKERS = args.trabajadores
+        ANALYSIS_JOB_MAX_QUEUE = args.analisis + 1
+        LLM_MAX_CONCURRENCY = args.trabajadores
+        LLM_MAX_REQUESTS_PER_MINUTE = 1_000_000
+
+    app = create_app(ConfigBenchmark)
+    with app.app_context():
+        db.create_all()
+        usuario = Usuario(email="bench@example.com")
+        usuario.set_password("bench")
+        plantilla = Plantilla(
+            nombre_plantilla="Bench",
+            tipo_archivo="Excel",
+            filename_seguro="bench.xlsx",
+            autor=usuario,
+            sheet_name="Casos",
+            header_row=1,
+        )
+        db.session.add_all([usuario, plantilla])
+        for i, etiqueta in enumerate(COLUMNAS):
+            db.session.add(
+                MapaPlantilla(
+                    etiqueta=etiqueta,
+                    coordenada=chr(ord("A") + i),
+                    tipo_mapa="fila_tabla",
+                    plantilla_padre=plantilla,
+                )
+            )
+        db.session.commit()
+        return app, plantilla.id
+
+
+def requerimiento(n):
+    criterios = "\n".join(
+        f"CA-{i:02d} El usuario {n} debe poder completar la operación {i}." for i in range(1, 11)
+    )
+    return f"Requerimiento de prueba número {n}\n{criterios}\n".encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--analisis", type=int, default=50)
+    parser.add_argument("--latencia-ms", type=int, default=200)
+    parser.add_argument("--casos", type=int, default=8)
+    parser.add_argument("--trabajadores", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        app, id_plantilla = crear_app(args, carpeta)
+        cliente = app.test_client()
+        cliente.post("/auth/login", data={"email": "bench@example.com", "password": "bench"})
+
+        latencias_envio = []
+        inicio = time.perf_counter()
+        for n in range(args.analisis):
+            t0 = time.perf_counter()
+            respuesta = cliente.post(
+                "/analysis/",
+                data={
+                    "plantilla": str(id_plantilla),
+                    "archivo_requerimiento": (io.BytesIO(requerimiento(n)), f"req_{n}.txt"),
+                },
+                content_type="multipart/form-data",
+            )
+            latencias_envio.append(time.perf_counter() - t0)
+            assert "trabajo_id=" in (respuesta.location or ""), respuesta.status_code
+
+        with app.app_context():
+            while True:
+                pendientes = TrabajoAnalisis.query.filter(
+                    TrabajoAnalisis.estado.in_(("pendiente", "en_proceso"))
+                ).count()
+                db.session.rollback()
+                if not pendientes:
+                    break
+                time.sleep(0.05)
+            total = time.perf_counter() - inicio
+            errores = TrabajoAnalisis.query.filter_by(estado="error").count()
+
+    latencias_envio.sort()
+    p95 = latencias_envio[int(len(latencias_envio) * 0.95) - 1]
+    print(f"Análisis:            {args.analisis} ({errores} con error)")
+    print(f"Latencia IA (local): {args.latencia_ms} ms, {args.casos} casos por respuesta")
+    print(f"Trabajadores:        {args.trabajadores}")
+    print(f"Envío (p50 / p95):   {statistics.median(latencias_envio) * 1000:.1f} / {p95 * 1000:.1f} ms")
+    print(f"Tiempo total:        {total:.2f} s")
+    print(f"Rendimiento:         {args.analisis / total:.1f} análisis/s")
+
+
+if __name__ == "__main__":
+    main()
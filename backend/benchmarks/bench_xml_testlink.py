@@ -0,0 +1,152 @@
+"""
+Benchmark: XML de TestLink anterior (ElementTree + minidom + toprettyxml)
+contra el escritor en streaming de app/analysis/testlink.py. Comprueba además
+que ambos producen los mismos bytes en una muestra de casos (con comillas,
+'&', '<' y campos vacíos).
+
+Uso (desde la carpeta 'backend/'):
+    python benchmarks/bench_xml_testlink.py --casos 10000 --pasos 8
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import xml.dom.minidom
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.analysis.testlink import iterar_xml_testlink  # noqa: E402
+
+CABECERAS = [
+    "Nombre del Caso",
+    "Descripción",
+    "Precondiciones",
+    "Pasos",
+    "Resultado Esperado",
+    "Importancia",
+]
+
+
+def xml_anterior(data, cabeceras_mapeadas):
+    """Copia fiel del generador original (árbol completo + minidom)."""
+
+    def find_key(keywords):
+        for key in cabeceras_mapeadas:
+            if any(kw in key.lower() for kw in keywords):
+                return key
+        return None
+
+    key_nombre = find_key(["nombre", "título", "titulo", "name"])
+    key_resumen = find_key(["resumen", "descripción", "descripcion", "summary"])
+    key_precondiciones = find_key(["precondicion", "precondition"])
+    key_pasos = find_key(["pasos", "steps", "ejecución", "ejecucion"])
+    key_resultados = find_key(["resultado", "results", "esperado"])
+    key_importancia = find_key(["importancia", "complejidad", "priority"])
+
+    root = ET.Element("testsuite")
+    for i, caso in enumerate(data, 1):
+        testcase = ET.SubElement(
+            root, "testcase", name=caso.get(key_nombre, f"Caso de Prueba {i}")
+        )
+        summary = ET.SubElement(testcase, "summary")
+        summary.text = caso.get(key_resumen, "N/A")
+        preconditions = ET.SubElement(testcase, "preconditions")
+        preconditions.text = caso.get(key_precondiciones, "N/A")
+        importancia_texto = caso.get(key_importancia, "media").lower()
+        if "alta" in importancia_texto:
+            importancia_num = "3"
+        elif "baja" in importancia_texto:
+            importancia_num = "1"
+        else:
+            importancia_num = "2"
+        importance = ET.SubElement(testcase, "importance")
+        importance.text = importancia_num
+
+        pasos_str = caso.get(key_pasos, "")
+        resultados_str = caso.get(key_resultados, "")
+        pasos_lista = str(pasos_str).split("\n") if pasos_str else ["N/A"]
+        resultados_lista = str(resultados_str).split("\n") if resultados_str else ["N/A"]
+        max_len = max(len(pasos_lista), len(resultados_lista))
+        pasos_lista.extend([""] * (max_len - len(pasos_lista)))
+        resultados_lista.extend([""] * (max_len - len(resultados_lista)))
+
+        steps = ET.SubElement(testcase, "steps")
+        for idx, (paso, resultado) in enumerate(zip(pasos_lista, resultados_lista), 1):
+            step = ET.SubElement(steps, "step")
+            step_number = ET.SubElement(step, "step_number")
+            step_number.text = str(idx)
+            actions = ET.SubElement(step, "actions")
+            actions.text = paso if paso else " "
+            expectedresults = ET.SubElement(step, "expectedresults")
+            expectedresults.text = resultado if resultado else " "
+            execution_type = ET.SubElement(step, "execution_type")
+            execution_type.text = "1"
+
+    xml_str = ET.tostring(root, encoding="utf-8", method="xml")
+    dom = xml.dom.minidom.parseString(xml_str)
+    return dom.toprettyxml(indent="  ", encoding="utf-8")
+
+
+def xml_streaming(data, cabeceras_mapeadas):
+    # Como en la descarga: se consume trozo a trozo sin juntar el documento
+    total = 0
+    for trozo in iterar_xml_testlink(data, cabeceras_mapeadas):
+        total += len(trozo.encode("utf-8"))
+    return total
+
+
+def crear_casos(casos, pasos):
+    niveles = ["Alta", "Media", "Baja"]
+    return [
+        {
+            "Nombre del Caso": f'Validar escenario {c + 1} <con & "caracteres">',
+            "Descripción": "" if c % 7 == 0 else f"Verifica el comportamiento {c + 1}",
+            "Precondiciones": "Usuario autenticado con permisos de edición",
+            "Pasos": "\n".join(f"{p + 1}. Acción {p + 1} del caso {c + 1}" for p in range(pasos)),
+            "Resultado Esperado": "\n".join(
+                f"{p + 1}. El sistema responde al paso {p + 1}" for p in range(pasos - 1)
+            ),
+            "Importancia": niveles[c % 3],
+        }
+        for c in range(casos)
+    ]
+
+
+def medir(nombre, funcion, data):
+    # La latencia se mide sin tracemalloc, que ralentiza mucho la asignación
+    inicio = time.perf_counter()
+    resultado = funcion(data, CABECERAS)
+    duracion = time.perf_counter() - inicio
+    tamano = resultado if isinstance(resultado, int) else len(resultado)
+
+    tracemalloc.start()
+    funcion(data, CABECERAS)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{nombre:<10} {duracion:8.2f} s   {len(data) / duracion:10,.0f} casos/s   "
+        f"pico {pico / 1024 / 1024:8.1f} MiB   {tamano / 1024 / 1024:6.1f} MiB de XML"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--casos", type=int, default=10000)
+    parser.add_argument("--pasos", type=int, default=8)
+    args = parser.parse_args()
+
+    data = crear_casos(args.casos, args.pasos)
+    print(f"Suite: {args.casos} casos x {args.pasos} pasos")
+    medir("anterior", xml_anterior, data)
+    medir("streaming", xml_streaming, data)
+
+    muestra = data[:200]
+    nuevo = "".join(iterar_xml_testlink(muestra, CABECERAS)).encode("utf-8")
+    igual = xml_anterior(muestra, CABECERAS) == nuevo
+    print("Mismos bytes:", "sí" if igual else "NO")
+
+
+if __name__ == "__main__":
+    main()
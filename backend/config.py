@@ -21,10 +21,141 @@ class Config:
 
     # --- Configuración de Subida de Archivos ---
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
+
+    # Tamaño máximo de una petición. Flask responde 413 antes de leer el cuerpo.
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH') or 50 * 1024 * 1024)
+
+    # Los requerimientos subidos se procesan en memoria; por encima de este
+    # tamaño (en bytes) el buffer temporal se vuelca a disco.
+    UPLOAD_SPOOL_MAX_SIZE = int(os.environ.get('UPLOAD_SPOOL_MAX_SIZE') or 5 * 1024 * 1024)
+
+    # --- Cache de textos extraídos (por hash SHA-256 del archivo) ---
+    # Límites del nivel en memoria; el nivel persistente es la tabla Requerimiento.
+    EXTRACTION_CACHE_MAX_ENTRIES = int(os.environ.get('EXTRACTION_CACHE_MAX_ENTRIES') or 256)
+    EXTRACTION_CACHE_MAX_CHARS = int(os.environ.get('EXTRACTION_CACHE_MAX_CHARS') or 64 * 1024 * 1024)
+
+    # --- Esqueletos de plantillas Excel (libro ya leído y guardado por openpyxl) ---
+    # Se generan al terminar el mapeo y se guardan en UPLOAD_FOLDER/esqueletos;
+    # este es el número de esqueletos que se mantienen además en memoria.
+    TEMPLATE_SKELETON_CACHE_MAX_ENTRIES = int(os.environ.get('TEMPLATE_SKELETON_CACHE_MAX_ENTRIES') or 32)
+
+    # --- Entregables generados (Excel / XML) ---
+    # Cada descarga se genera en memoria hasta este tamaño (bytes); por encima
+    # se vuelca a un archivo temporal anónimo y único.
+    EXPORT_SPOOL_MAX_SIZE = int(os.environ.get('EXPORT_SPOOL_MAX_SIZE') or 8 * 1024 * 1024)
+    # Tamaño total máximo del cache de entregables en UPLOAD_FOLDER/entregables;
+    # por encima se borran los menos usados.
+    EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_BYTES') or 512 * 1024 * 1024)
     
+    # --- Proveedor de IA ---
+    # 'gemini' (Google AI) o 'local' (casos sintéticos deterministas, sin red:
+    # para pruebas de carga y benchmarks del pipeline completo).
+    LLM_PROVIDER = os.environ.get('LLM_PROVIDER') or 'gemini'
+    # Parámetros del proveedor local: latencia por respuesta (ms), casos por
+    # respuesta y longitud de cada texto generado (caracteres).
+    LOCAL_LLM_LATENCY_MS = int(os.environ.get('LOCAL_LLM_LATENCY_MS') or 500)
+    LOCAL_LLM_CASES = int(os.environ.get('LOCAL_LLM_CASES') or 8)
+    LOCAL_LLM_TEXT_CHARS = int(os.environ.get('LOCAL_LLM_TEXT_CHARS') or 120)
+
     # --- 🔑 Configuración de API de Gemini (Google AI) ---
     # La API Key se carga desde el archivo .env
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
+
+    # Cada cuántos segundos se re-valida en segundo plano el modelo resuelto
+    # (0 = solo al primer uso o con el refresco explícito).
+    GEMINI_REVALIDATION_INTERVAL = int(os.environ.get('GEMINI_REVALIDATION_INTERVAL') or 3600)
+
+    # Enrutamiento entre modelos disponibles: cuántos candidatos se mantienen,
+    # tamaño de la ventana de latencias por modelo, muestras mínimas antes de
+    # fiarse de ellas y probabilidad de probar un modelo aún sin medir.
+    GEMINI_ROUTER_MAX_MODELS = int(os.environ.get('GEMINI_ROUTER_MAX_MODELS') or 3)
+    GEMINI_ROUTER_WINDOW = int(os.environ.get('GEMINI_ROUTER_WINDOW') or 50)
+    GEMINI_ROUTER_MIN_SAMPLES = int(os.environ.get('GEMINI_ROUTER_MIN_SAMPLES') or 5)
+    GEMINI_ROUTER_EXPLORATION = float(os.environ.get('GEMINI_ROUTER_EXPLORATION') or 0.05)
+    # Cobertura (hedged request): si el modelo elegido supera su percentil
+    # LLM_HEDGE_PERCENTILE (y al menos LLM_HEDGE_MIN_DELAY segundos), se repite
+    # la petición en el segundo mejor, que se usa si el principal falla o su
+    # respuesta no es válida.
+    # Como máximo una fracción LLM_HEDGE_MAX_RATIO de las llamadas se cubre.
+    LLM_HEDGE_ENABLED = bool(int(os.environ.get('LLM_HEDGE_ENABLED') or 1))
+    LLM_HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE') or 95)
+    LLM_HEDGE_MIN_DELAY = float(os.environ.get('LLM_HEDGE_MIN_DELAY') or 2)
+    LLM_HEDGE_MAX_RATIO = float(os.environ.get('LLM_HEDGE_MAX_RATIO') or 0.1)
+
+    # --- Cache de respuestas de la IA (por huella del prompt) ---
+    LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL') or 7 * 24 * 3600)  # segundos
+    LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES') or 512)  # en memoria
+    LLM_CACHE_MAX_ROWS = int(os.environ.get('LLM_CACHE_MAX_ROWS') or 10000)  # en la BD
+
+    # Requerimientos más largos que esto (en caracteres) se dividen en
+    # segmentos que se generan en paralelo y luego se unen en una sola lista.
+    LLM_FANOUT_MAX_CHARS = int(os.environ.get('LLM_FANOUT_MAX_CHARS') or 30000)
+    # Máximo de llamadas simultáneas a la IA en el pool compartido del proceso.
+    LLM_FANOUT_MAX_WORKERS = int(os.environ.get('LLM_FANOUT_MAX_WORKERS') or 4)
+
+    # --- Compactación del prompt y presupuesto de tokens ---
+    # Quita celdas vacías, filas repetidas y espacios sobrantes del texto del
+    # requerimiento antes de armar el prompt (el texto guardado no cambia).
+    PROMPT_COMPACTION = bool(int(os.environ.get('PROMPT_COMPACTION') or 1))
+    # Tokens máximos del requerimiento por llamada; por encima se segmenta
+    # (además de LLM_FANOUT_MAX_CHARS). 0 = sin presupuesto.
+    PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET') or 8000)
+    # 1 = contar tokens con el proveedor (una llamada extra a la API);
+    # 0 = estimarlos a partir de la longitud del texto.
+    PROMPT_TOKEN_COUNT_EXACT = bool(int(os.environ.get('PROMPT_TOKEN_COUNT_EXACT') or 0))
+
+    # Re-análisis diferencial: tamaño máximo (caracteres) de cada grupo de
+    # secciones que se genera junto, ya desde el primer análisis. Más
+    # pequeño = ediciones más baratas, pero más llamadas al generar todo.
+    ANALYSIS_DELTA_GROUP_CHARS = int(os.environ.get('ANALYSIS_DELTA_GROUP_CHARS') or 4000)
+
+    # --- Resiliencia de las llamadas a la IA ---
+    # Llamadas simultáneas y peticiones por minuto permitidas por proceso.
+    LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY') or 4)
+    LLM_MAX_REQUESTS_PER_MINUTE = int(os.environ.get('LLM_MAX_REQUESTS_PER_MINUTE') or 60)
+    # Segundos máximos esperando turno antes de rechazar la llamada.
+    LLM_QUEUE_TIMEOUT = float(os.environ.get('LLM_QUEUE_TIMEOUT') or 60)
+    # Timeout (segundos) de cada llamada a la API.
+    LLM_REQUEST_TIMEOUT = float(os.environ.get('LLM_REQUEST_TIMEOUT') or 120)
+    # Reintentos ante 429/5xx/timeouts: backoff exponencial con jitter.
+    LLM_RETRY_MAX_ATTEMPTS = int(os.environ.get('LLM_RETRY_MAX_ATTEMPTS') or 4)
+    LLM_RETRY_BASE_DELAY = float(os.environ.get('LLM_RETRY_BASE_DELAY') or 1.0)
+    LLM_RETRY_MAX_DELAY = float(os.environ.get('LLM_RETRY_MAX_DELAY') or 30)
+    # Si una respuesta llega cortada o con casos inválidos, se conservan los
+    # casos bien formados y se pide solo la cola faltante (hasta N veces).
+    LLM_TAIL_MAX_ATTEMPTS = int(os.environ.get('LLM_TAIL_MAX_ATTEMPTS') or 1)
+    # Circuito: fallos consecutivos para abrirlo y segundos antes de probar de nuevo.
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('LLM_CIRCUIT_FAILURE_THRESHOLD') or 5)
+    LLM_CIRCUIT_RESET_TIMEOUT = float(os.environ.get('LLM_CIRCUIT_RESET_TIMEOUT') or 60)
+
+    # --- Trabajos de análisis en segundo plano ---
+    # Hilos del proceso que ejecutan análisis (lectura, métricas, IA y guardado).
+    ANALYSIS_JOB_MAX_WORKERS = int(os.environ.get('ANALYSIS_JOB_MAX_WORKERS') or 2)
+    # Trabajos pendientes o en proceso admitidos a la vez; por encima se rechazan.
+    ANALYSIS_JOB_MAX_QUEUE = int(os.environ.get('ANALYSIS_JOB_MAX_QUEUE') or 50)
+    # Cada proceso renueva cada ANALYSIS_JOB_HEARTBEAT_INTERVAL segundos el
+    # latido de los trabajos que ejecuta. Un trabajo 'en_proceso' se vuelve a
+    # encolar si su proceso ya no existe (mismo host) o si lleva más de
+    # ANALYSIS_JOB_STALE_AFTER segundos sin latir (cualquier host).
+    ANALYSIS_JOB_HEARTBEAT_INTERVAL = int(os.environ.get('ANALYSIS_JOB_HEARTBEAT_INTERVAL') or 30)
+    ANALYSIS_JOB_STALE_AFTER = int(os.environ.get('ANALYSIS_JOB_STALE_AFTER') or 120)
+    ANALYSIS_JOB_MAX_ATTEMPTS = int(os.environ.get('ANALYSIS_JOB_MAX_ATTEMPTS') or 3)
+
+    # Análisis por lote: archivos admitidos por envío y cuántos requerimientos
+    # pequeños se empaquetan como máximo en un mismo prompt (el tamaño lo
+    # acota además PROMPT_TOKEN_BUDGET).
+    ANALYSIS_BATCH_MAX_FILES = int(os.environ.get('ANALYSIS_BATCH_MAX_FILES') or 50)
+    ANALYSIS_BATCH_MAX_PER_PROMPT = int(os.environ.get('ANALYSIS_BATCH_MAX_PER_PROMPT') or 8)
+
+    # Generar en modo streaming y mostrar cada caso en la página en cuanto se
+    # completa (Server-Sent Events). 0 = esperar la respuesta completa.
+    LLM_STREAMING = bool(int(os.environ.get('LLM_STREAMING') or 1))
+    # Cada conexión SSE ocupa un worker síncrono (gunicorn sync, servidor de
+    # desarrollo) mientras dura. Pasados ANALYSIS_JOB_EVENTS_MAX_SECONDS se
+    # cierra y la página sigue consultando el estado con peticiones cortas.
+    # Con workers asíncronos (gevent/eventlet) se puede subir; 0 = sin SSE,
+    # solo consultas.
+    ANALYSIS_JOB_EVENTS_MAX_SECONDS = int(os.environ.get('ANALYSIS_JOB_EVENTS_MAX_SECONDS') or 90)
     
     # Verificación en consola (útil para debugging)
     if not GEMINI_API_KEY: